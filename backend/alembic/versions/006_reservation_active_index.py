@@ -0,0 +1,31 @@
+"""Add covering index for active reservation lookups
+
+Revision ID: 006_reservation_active_index
+Revises: 005_analytics_optimization
+Create Date: 2025-08-25 10:00:00.000000
+
+"""
+from alembic import op
+
+# revision identifiers
+revision = '006_reservation_active_index'
+down_revision = '005_analytics_optimization'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # Range scan for "NOW() BETWEEN start_time AND end_time" and today's stats per lot;
+    # created_at is included so the real-time metrics query can be answered from the index
+    with op.get_context().autocommit_block():
+        op.execute("""
+            CREATE INDEX CONCURRENTLY IF NOT EXISTS idx_reservations_lot_active
+            ON reservations (parking_lot_id, start_time, end_time)
+            INCLUDE (created_at)
+            WHERE status = 'confirmed'
+        """)
+
+
+def downgrade():
+    with op.get_context().autocommit_block():
+        op.execute("DROP INDEX CONCURRENTLY IF EXISTS idx_reservations_lot_active")
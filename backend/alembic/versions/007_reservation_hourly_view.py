@@ -0,0 +1,41 @@
+"""Add hourly reservation aggregate materialized view
+
+Revision ID: 007_reservation_hourly_view
+Revises: 006_reservation_active_index
+Create Date: 2025-08-26 09:00:00.000000
+
+"""
+from alembic import op
+
+# revision identifiers
+revision = '007_reservation_hourly_view'
+down_revision = '006_reservation_active_index'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # Hourly confirmed-reservation aggregates per lot, refreshed by the background processor
+    op.execute("""
+        CREATE MATERIALIZED VIEW IF NOT EXISTS mv_reservation_hourly AS
+        SELECT 
+            parking_lot_id,
+            DATE_TRUNC('hour', start_time) AS hour_bucket,
+            COUNT(*) AS reservations,
+            AVG(EXTRACT(EPOCH FROM (end_time - start_time))/3600) AS avg_duration,
+            SUM(EXTRACT(EPOCH FROM (end_time - start_time))/3600) AS occupied_spot_hours
+        FROM reservations
+        WHERE status = 'confirmed'
+        GROUP BY parking_lot_id, DATE_TRUNC('hour', start_time)
+    """)
+    
+    # Unique index is required for REFRESH MATERIALIZED VIEW CONCURRENTLY
+    op.execute("""
+        CREATE UNIQUE INDEX IF NOT EXISTS idx_mv_reservation_hourly_lot_hour
+        ON mv_reservation_hourly (parking_lot_id, hour_bucket)
+    """)
+
+
+def downgrade():
+    op.execute("DROP INDEX IF EXISTS idx_mv_reservation_hourly_lot_hour")
+    op.execute("DROP MATERIALIZED VIEW IF EXISTS mv_reservation_hourly")
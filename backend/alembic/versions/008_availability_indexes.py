@@ -0,0 +1,39 @@
+"""Add partial indexes for the available-spot query
+
+Revision ID: 008_availability_indexes
+Revises: 007_reservation_hourly_view
+Create Date: 2025-08-27 09:00:00.000000
+
+"""
+from alembic import op
+
+# revision identifiers
+revision = '008_availability_indexes'
+down_revision = '007_reservation_hourly_view'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # Predicates match the literals in the CQRS available-spot and confirm queries
+    # (the lowercase enum labels from 001, see app.db.enums), so the planner can use them
+    with op.get_context().autocommit_block():
+        # Reservable, available spots per lot
+        op.execute("""
+            CREATE INDEX CONCURRENTLY IF NOT EXISTS ix_spots_lot_available
+            ON parking_spots (parking_lot_id)
+            WHERE status = 'available' AND is_active = true AND is_reservable = true
+        """)
+
+        # Overlap check against bookings that hold a spot
+        op.execute("""
+            CREATE INDEX CONCURRENTLY IF NOT EXISTS ix_res_spot_time_active
+            ON reservations (parking_spot_id, start_time, end_time)
+            WHERE status IN ('confirmed', 'active')
+        """)
+
+
+def downgrade():
+    with op.get_context().autocommit_block():
+        op.execute("DROP INDEX CONCURRENTLY IF EXISTS ix_res_spot_time_active")
+        op.execute("DROP INDEX CONCURRENTLY IF EXISTS ix_spots_lot_available")
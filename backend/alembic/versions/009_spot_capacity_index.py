@@ -0,0 +1,28 @@
+"""Add covering index for per-lot capacity counts
+
+Revision ID: 009_spot_capacity_index
+Revises: 008_availability_indexes
+Create Date: 2025-08-28 09:00:00.000000
+
+"""
+from alembic import op
+
+# revision identifiers
+revision = '009_spot_capacity_index'
+down_revision = '008_availability_indexes'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # Lets the total/occupied capacity count for a lot run as an index-only scan
+    with op.get_context().autocommit_block():
+        op.execute("""
+            CREATE INDEX CONCURRENTLY IF NOT EXISTS ix_spots_lot_active_status
+            ON parking_spots (parking_lot_id, is_active, status)
+        """)
+
+
+def downgrade():
+    with op.get_context().autocommit_block():
+        op.execute("DROP INDEX CONCURRENTLY IF EXISTS ix_spots_lot_active_status")
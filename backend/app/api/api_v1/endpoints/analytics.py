@@ -4,13 +4,15 @@ RESTful API endpoints for analytics, optimization, and performance monitoring.
 """
 
 from fastapi import APIRouter, Depends, HTTPException, Query, BackgroundTasks
+from fastapi.responses import Response
 from sqlalchemy.orm import Session
 from typing import List, Optional, Dict, Any
 from datetime import datetime, timedelta
 import logging
+import orjson
 
 from app.db.database import get_db
-from app.services.analytics_service import AnalyticsService
+from app.services.analytics_service import AnalyticsService, ORJSON_OPTIONS
 from app.services.performance_service import get_performance_service
 from app.models.analytics import OccupancyAnalytics, RevenueAnalytics
 import redis.asyncio as redis
@@ -28,6 +30,13 @@ async def get_redis_client():
         decode_responses=True
     )
 
+def orjson_response(payload: Dict[str, Any]) -> Response:
+    """Encode like the cached reports: numpy arrays natively, anything else via str"""
+    return Response(
+        orjson.dumps(payload, default=str, option=ORJSON_OPTIONS),
+        media_type="application/json"
+    )
+
 @router.get("/comprehensive/{parking_lot_id}")
 async def get_comprehensive_analytics(
     parking_lot_id: str,
@@ -50,11 +59,11 @@ async def get_comprehensive_analytics(
         if not comprehensive_report:
             raise HTTPException(status_code=404, detail="Parking lot not found or insufficient data")
         
-        return {
+        return orjson_response({
             "status": "success",
             "data": comprehensive_report,
             "message": f"Comprehensive analytics generated for {analysis_period_days} days"
-        }
+        })
         
     except Exception as e:
         logger.error(f"Comprehensive analytics error: {e}")
@@ -134,11 +143,11 @@ async def get_demand_forecast(
                 parking_lot_id, forecast_hours, use_ensemble
             )
         
-        return {
+        return orjson_response({
             "status": "success",
             "data": forecast,
             "message": f"Demand forecast generated for {forecast_hours} hours"
-        }
+        })
         
     except Exception as e:
         logger.error(f"Demand forecast error: {e}")
@@ -20,6 +20,7 @@ from app.core.deps import (
     get_current_user_token
 )
 from app.core.security import SecurityHeaders
+from app.core.config import settings
 from app.models.user import User
 from datetime import datetime
 
@@ -55,7 +56,8 @@ async def login(
     for header, value in SecurityHeaders.get_security_headers().items():
         response.headers[header] = value
     
-    access_token, refresh_token, expires_in = await AuthService.login_user(db, credentials)
+    client_ip = request.client.host if request.client else None
+    access_token, refresh_token, expires_in = await AuthService.login_user(db, credentials, client_ip)
     
     return Token(
         access_token=access_token,
@@ -242,7 +244,6 @@ async def oauth_callback(
     
     # Create JWT tokens directly (since OAuth users don't need password validation)
     from app.core.security import create_access_token, create_refresh_token
-    import redis
     
     jwt_access_token = create_access_token(
         subject=user.id,
@@ -255,12 +256,7 @@ async def oauth_callback(
     refresh_token = create_refresh_token(subject=user.id)
     
     # Store refresh token in Redis
-    redis_client = redis.from_url(settings.REDIS_URL, decode_responses=True)
-    redis_client.setex(
-        f"refresh_token:{user.id}",
-        settings.REFRESH_TOKEN_EXPIRE_MINUTES * 60,
-        refresh_token
-    )
+    await AuthService.store_refresh_token(user.id, refresh_token)
     
     return Token(
         access_token=jwt_access_token,
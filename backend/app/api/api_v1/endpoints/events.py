@@ -296,8 +296,8 @@ async def update_spot_status(
             reason=update.reason
         )
         
-        # Execute command
-        result = await cqrs_service.execute_command(command)
+        # Execute command (concurrent spot updates are written together)
+        result = await cqrs_service.submit(command)
         
         if result.status.value != "success":
             raise HTTPException(status_code=400, detail=result.error_message)
@@ -561,18 +561,22 @@ async def initialize_event_system():
         # Initialize event service
         await event_service.initialize()
         
+        # Relay broadcasts published by any worker to this worker's websockets
+        await notification_service.start_broadcast_relay()
+        
         # Register event handlers
-        event_service.register_event_handler(EventType.SPOT_STATUS_CHANGED, system_event_handler.handle_spot_status_change)
-        event_service.register_event_handler(EventType.SPOT_OCCUPIED, system_event_handler.handle_spot_status_change)
-        event_service.register_event_handler(EventType.SPOT_VACATED, system_event_handler.handle_spot_status_change)
-        event_service.register_event_handler(EventType.RESERVATION_CREATED, system_event_handler.handle_reservation_created)
-        event_service.register_event_handler(EventType.CAPACITY_THRESHOLD, system_event_handler.handle_capacity_threshold)
-        event_service.register_event_handler(EventType.USER_ARRIVED, system_event_handler.handle_user_arrival)
+        for event_type, handler in system_event_handler.handlers.items():
+            event_service.register_event_handler(event_type, handler)
         
         # Initialize CQRS service
         from app.services.cqrs_service import cqrs_service
         global cqrs_service
         
+        # Drop cached available-spot listings when spots change
+        for spot_event_type in (EventType.SPOT_STATUS_CHANGED, EventType.SPOT_OCCUPIED,
+                                EventType.SPOT_VACATED, EventType.SPOT_RESERVED):
+            event_service.register_event_handler(spot_event_type, cqrs_service.invalidate_available_spots)
+        
         # Initialize reservation manager with CQRS service
         global reservation_manager
         reservation_manager.cqrs_service = cqrs_service
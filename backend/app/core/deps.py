@@ -8,7 +8,7 @@ from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy import select
 from app.db.database import get_async_session
 from app.models.user import User, UserStatus
-from app.core.security import verify_token
+from app.core.security import verify_token, token_blacklist_key
 import redis
 from app.core.config import settings
 
@@ -26,12 +26,12 @@ class TokenBlacklist:
         """Add token to blacklist"""
         if expires_in is None:
             expires_in = settings.ACCESS_TOKEN_EXPIRE_MINUTES * 60
-        redis_client.setex(f"blacklist:{token}", expires_in, "1")
+        redis_client.setex(token_blacklist_key(token), expires_in, "1")
     
     @staticmethod
     async def is_blacklisted(token: str) -> bool:
         """Check if token is blacklisted"""
-        return redis_client.exists(f"blacklist:{token}")
+        return redis_client.exists(token_blacklist_key(token))
 
 async def get_current_user_token(
     credentials: HTTPAuthorizationCredentials = Depends(security)
@@ -2,12 +2,14 @@
 Security utilities for authentication and authorization
 """
 from datetime import datetime, timedelta
+from functools import lru_cache
 from typing import Any, Union, Optional
 import re
 from passlib.context import CryptContext
 from jose import jwt, JWTError
 from fastapi import HTTPException, status
 from app.core.config import settings
+import hashlib
 import secrets
 import string
 
@@ -95,29 +97,40 @@ def create_refresh_token(subject: Union[str, Any]) -> str:
     encoded_jwt = jwt.encode(to_encode, settings.SECRET_KEY, algorithm=settings.ALGORITHM)
     return encoded_jwt
 
+@lru_cache(maxsize=10000)
+def _decode_token(token: str) -> Optional[dict]:
+    """Decode and signature-check a JWT once; repeat presentations hit the cache"""
+    try:
+        return jwt.decode(token, settings.SECRET_KEY, algorithms=[settings.ALGORITHM])
+    except JWTError:
+        return None
+
 def verify_token(token: str, token_type: str = "access") -> Optional[str]:
     """
     Verify JWT token and return subject
     """
-    try:
-        payload = jwt.decode(token, settings.SECRET_KEY, algorithms=[settings.ALGORITHM])
-        
-        # Check token type
-        if payload.get("type") != token_type:
-            return None
-        
-        # Check expiration
-        exp = payload.get("exp")
-        if exp is None or datetime.utcnow() > datetime.fromtimestamp(exp):
-            return None
-        
-        subject: str = payload.get("sub")
-        if subject is None:
-            return None
-        
-        return subject
-    except JWTError:
+    payload = _decode_token(token)
+    if payload is None:
+        return None
+    
+    # Check token type
+    if payload.get("type") != token_type:
+        return None
+    
+    # Check expiration (on every call - cached payloads may have expired since decoding)
+    exp = payload.get("exp")
+    if exp is None or datetime.utcnow() > datetime.fromtimestamp(exp):
         return None
+    
+    subject: str = payload.get("sub")
+    if subject is None:
+        return None
+    
+    return subject
+
+def token_blacklist_key(token: str) -> str:
+    """Redis key marking a revoked access token (SHA-256 digest, not the raw JWT)"""
+    return f"blacklist:{hashlib.sha256(token.encode()).hexdigest()}"
 
 def generate_password_reset_token() -> str:
     """Generate a secure password reset token"""
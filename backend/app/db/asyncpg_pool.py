@@ -0,0 +1,64 @@
+"""
+Raw asyncpg connection pools for hot queries that skip the ORM.
+The main pool is read-only and serves reads that serialize rows straight to dicts;
+a small separate pool serves single-statement writes on hot event paths.
+"""
+import asyncio
+import asyncpg
+from app.core.config import settings
+
+class AsyncpgPool:
+    def __init__(self):
+        self.pool = None
+        self.write_pool = None
+        self._lock = asyncio.Lock()
+    
+    async def connect(self):
+        async with self._lock:
+            if self.pool is None:
+                self.pool = await asyncpg.create_pool(
+                    self._dsn(),
+                    min_size=10,
+                    max_size=50,
+                    max_inactive_connection_lifetime=300,
+                    # Repeated hot queries reuse their prepared statements
+                    statement_cache_size=1024,
+                    # Read-only pool: every implicit transaction is READ ONLY, without
+                    # paying extra BEGIN/SET TRANSACTION/COMMIT round trips per query
+                    server_settings={"default_transaction_read_only": "on"}
+                )
+        return self.pool
+    
+    async def connect_writer(self):
+        async with self._lock:
+            if self.write_pool is None:
+                self.write_pool = await asyncpg.create_pool(
+                    self._dsn(),
+                    min_size=5,
+                    max_size=20,
+                    max_inactive_connection_lifetime=300,
+                    statement_cache_size=100
+                )
+        return self.write_pool
+    
+    def _dsn(self) -> str:
+        # asyncpg takes a plain libpq DSN, without SQLAlchemy's driver suffix
+        return settings.DATABASE_URL.replace("postgresql+asyncpg://", "postgresql://", 1)
+    
+    async def disconnect(self):
+        if self.pool:
+            await self.pool.close()
+            self.pool = None
+        if self.write_pool:
+            await self.write_pool.close()
+            self.write_pool = None
+    
+    async def fetch(self, query: str, *args):
+        pool = self.pool or await self.connect()
+        return await pool.fetch(query, *args)
+    
+    async def execute(self, query: str, *args):
+        pool = self.write_pool or await self.connect_writer()
+        return await pool.execute(query, *args)
+
+asyncpg_pool = AsyncpgPool()
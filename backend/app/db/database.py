@@ -6,7 +6,11 @@ from app.core.config import settings
 engine = create_async_engine(
     settings.DATABASE_URL,
     echo=True,
-    future=True
+    future=True,
+    # Keep connections warm across requests instead of reconnecting under load
+    pool_size=20,
+    max_overflow=30,
+    pool_pre_ping=True
 )
 
 AsyncSessionLocal = sessionmaker(
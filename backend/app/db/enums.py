@@ -0,0 +1,19 @@
+"""
+Database encoding of Python enums.
+Migration 001 creates the Postgres enum types with the members' values ('available',
+'confirmed', ...), so both the ORM columns and raw SQL use member values as labels.
+"""
+from enum import Enum
+from typing import Iterable, List, Type
+
+def enum_values(enum_cls: Type[Enum]) -> List[str]:
+    """values_callable for SQLAlchemy Enum columns"""
+    return [member.value for member in enum_cls]
+
+def sql_enum(member: Enum) -> str:
+    """Quoted label for a static raw SQL predicate"""
+    return f"'{member.value}'"
+
+def sql_enum_list(members: Iterable[Enum]) -> str:
+    """Comma-separated quoted labels for a raw SQL IN (...) list"""
+    return ", ".join(sql_enum(member) for member in members)
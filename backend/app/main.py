@@ -35,6 +35,12 @@ async def lifespan(app: FastAPI):
         spatial_task = asyncio.create_task(start_spatial_processor())
         logger.info("Spatial background processor started")
         
+        # Open the asyncpg pools up front so the first queries don't pay connection setup
+        from app.db.asyncpg_pool import asyncpg_pool
+        await asyncpg_pool.connect()
+        await asyncpg_pool.connect_writer()
+        logger.info("Database connection pools opened")
+        
         # Initialize event system
         await initialize_event_system()
         logger.info("Event system initialized")
@@ -58,11 +64,19 @@ async def lifespan(app: FastAPI):
             # Stop event system
             from app.services.reservation_service import reservation_manager
             from app.services.event_service import event_service
+            from app.services.event_handlers import notification_service
             
             await reservation_manager.stop_processing()
-            event_service.close()
+            await notification_service.stop_broadcast_relay()
+            await event_service.close()
             logger.info("Event system stopped")
             
+            from app.services.oauth_service import oauth_service
+            await oauth_service.close()
+            
+            from app.db.asyncpg_pool import asyncpg_pool
+            await asyncpg_pool.disconnect()
+            
         except Exception as e:
             logger.error(f"Error during shutdown: {e}")
 
@@ -222,6 +236,7 @@ if __name__ == "__main__":
         host="0.0.0.0",
         port=8000,
         reload=settings.DEBUG,
+        loop="uvloop",
         ssl_keyfile=settings.SSL_PRIVATE_KEY_PATH if settings.USE_SSL else None,
         ssl_certfile=settings.SSL_CERTIFICATE_PATH if settings.USE_SSL else None
     )
@@ -232,6 +247,7 @@ if __name__ == "__main__":
         host="0.0.0.0",
         port=8000,
         reload=settings.DEBUG,
+        loop="uvloop",
         ssl_keyfile=settings.SSL_PRIVATE_KEY_PATH if settings.USE_SSL else None,
         ssl_certfile=settings.SSL_CERTIFICATE_PATH if settings.USE_SSL else None
     )
\ No newline at end of file
@@ -3,6 +3,7 @@ from sqlalchemy.sql import func
 from sqlalchemy.orm import relationship
 from geoalchemy2 import Geometry
 from app.db.database import Base
+from app.db.enums import enum_values
 import enum
 
 class SpotStatus(enum.Enum):
@@ -56,8 +57,8 @@ class ParkingSpot(Base):
     longitude = Column(Numeric(11, 8), nullable=True)
     
     # Spot Characteristics
-    spot_type = Column(Enum(SpotType), default=SpotType.REGULAR, nullable=False)
-    status = Column(Enum(SpotStatus), default=SpotStatus.AVAILABLE, nullable=False, index=True)
+    spot_type = Column(Enum(SpotType, values_callable=enum_values), default=SpotType.REGULAR, nullable=False)
+    status = Column(Enum(SpotStatus, values_callable=enum_values), default=SpotStatus.AVAILABLE, nullable=False, index=True)
     
     # Physical Dimensions (in centimeters)
     length_cm = Column(Integer, nullable=True, default=500)   # 5 meters default
@@ -2,6 +2,7 @@ from sqlalchemy import Column, Integer, String, Boolean, DateTime, Enum, Numeric
 from sqlalchemy.sql import func
 from sqlalchemy.orm import relationship
 from app.db.database import Base
+from app.db.enums import enum_values
 import enum
 from datetime import datetime, timedelta
 
@@ -49,7 +50,7 @@ class Reservation(Base):
     extension_count = Column(Integer, default=0, nullable=False)
     
     # Status and State
-    status = Column(Enum(ReservationStatus), default=ReservationStatus.PENDING, nullable=False, index=True)
+    status = Column(Enum(ReservationStatus, values_callable=enum_values), default=ReservationStatus.PENDING, nullable=False, index=True)
     is_recurring = Column(Boolean, default=False, nullable=False)
     parent_reservation_id = Column(Integer, ForeignKey("reservations.id"), nullable=True)  # For recurring reservations
     
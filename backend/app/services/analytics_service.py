@@ -5,15 +5,21 @@ Implements sliding window algorithms, occupancy pattern detection, and demand pr
 
 import asyncio
 import logging
-from datetime import datetime, timedelta
+import os
+import secrets
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime, timedelta, timezone
 from typing import Dict, List, Optional, Tuple, Any
-from collections import deque, defaultdict
-import json
+from collections import defaultdict
 
+import orjson
 import numpy as np
 from scipy import stats, signal
 from scipy.stats import poisson, norm
 import pandas as pd
+import polars as pl
+from joblib import Parallel, delayed
+from sklearn.base import clone
 from sklearn.ensemble import RandomForestRegressor, GradientBoostingRegressor
 from sklearn.linear_model import LinearRegression
 from sklearn.preprocessing import StandardScaler
@@ -32,55 +38,232 @@ from app.models.analytics import Analytics, OccupancyPattern, DemandForecast
 
 logger = logging.getLogger(__name__)
 
+# orjson serializes numpy arrays/scalars natively; non-str keys match the old json.dumps behaviour
+ORJSON_OPTIONS = orjson.OPT_SERIALIZE_NUMPY | orjson.OPT_NON_STR_KEYS
+
+# Single-flight lock for comprehensive report rebuilds (seconds)
+COMPREHENSIVE_LOCK_TTL = 60
+
+# Delete the single-flight lock only if it still holds our token
+RELEASE_LOCK_SCRIPT = """
+if redis.call("get", KEYS[1]) == ARGV[1] then
+    return redis.call("del", KEYS[1])
+else
+    return 0
+end
+"""
+
+# Strong references to fire-and-forget rebuild tasks so they aren't garbage collected
+_background_tasks = set()
+
+def _on_background_task_done(task: asyncio.Task):
+    """Drop the task reference and log a failed rebuild instead of losing it"""
+    _background_tasks.discard(task)
+    if not task.cancelled() and task.exception() is not None:
+        logger.error(f"Background analytics rebuild failed: {task.exception()}")
+
+# Static statements for the real-time dashboard path, parsed once at import.
+# Current occupancy and today's statistics in one round trip; both CTEs are range
+# scans on idx_reservations_lot_active
+_CURRENT_METRICS_SQL = text("""
+    WITH occ AS (
+        SELECT COUNT(*) as occupied_spots
+        FROM reservations
+        WHERE parking_lot_id = :parking_lot_id
+        AND status = 'confirmed'
+        AND start_time <= NOW()
+        AND end_time >= NOW()
+    ),
+    today AS (
+        SELECT 
+            COUNT(*) as total_reservations_today,
+            AVG(EXTRACT(EPOCH FROM (end_time - start_time))/3600) as avg_duration_hours,
+            MAX(created_at) as last_reservation_time
+        FROM reservations 
+        WHERE parking_lot_id = :parking_lot_id 
+        AND status = 'confirmed'
+        AND start_time >= CURRENT_DATE
+        AND start_time < CURRENT_DATE + INTERVAL '1 day'
+    )
+    SELECT 
+        pl.total_spots,
+        occ.occupied_spots,
+        COALESCE(occ.occupied_spots * 100.0 / NULLIF(pl.total_spots, 0), 0) as current_occupancy_rate,
+        today.total_reservations_today,
+        today.avg_duration_hours,
+        today.last_reservation_time
+    FROM parking_lots pl
+    CROSS JOIN occ
+    CROSS JOIN today
+    WHERE pl.id = :parking_lot_id
+""")
+
+# Today's hourly trend from the aggregate view (see migration 007)
+_HOURLY_TREND_SQL = text("""
+    SELECT 
+        EXTRACT(hour FROM hour_bucket) as hour,
+        reservations,
+        avg_duration
+    FROM mv_reservation_hourly 
+    WHERE parking_lot_id = :parking_lot_id 
+    AND hour_bucket >= CURRENT_DATE
+    AND hour_bucket < CURRENT_DATE + INTERVAL '1 day'
+    ORDER BY hour_bucket
+""")
+
+def batched_linregress(Y: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+    """Closed-form least-squares slope and correlation for each row of Y against 0..N-1.
+    
+    Y has shape (L, N), e.g. one row per parking lot, so trends for many series are
+    computed with a single matrix-vector product instead of one linregress call each.
+    Matches scipy.stats.linregress (r is 0 for constant rows).
+    """
+    Y = np.atleast_2d(np.asarray(Y, dtype=np.float64))
+    x_centered = np.arange(Y.shape[1]) - (Y.shape[1] - 1) / 2.0
+    Y_centered = Y - Y.mean(axis=1, keepdims=True)
+    
+    sxx = x_centered @ x_centered
+    sxy = Y_centered @ x_centered
+    syy = np.einsum('ij,ij->i', Y_centered, Y_centered)
+    
+    slopes = sxy / sxx
+    denom = np.sqrt(sxx * syy)
+    r_values = np.divide(sxy, denom, out=np.zeros_like(sxy), where=denom > 0)
+    
+    return slopes, r_values
+
+def forward_fill(arr: np.ndarray) -> np.ndarray:
+    """Propagate the last non-NaN value forward; leading NaNs are left as-is."""
+    arr = np.asarray(arr, dtype=np.float64)
+    mask = np.isnan(arr)
+    idx = np.where(~mask, np.arange(len(arr)), 0)
+    np.maximum.accumulate(idx, out=idx)
+    return np.where(mask, arr[idx], arr)
+
+def fit_demand_models(models: Dict[str, Any], X: np.ndarray, y: np.ndarray,
+                      n_jobs: Optional[int] = None) -> Tuple[Dict[str, Any], StandardScaler, Dict[str, Dict[str, float]]]:
+    """Scale features, fit all models and evaluate them on a hold-out split (CPU-bound).
+    
+    Module-level so it can be shipped to a worker process; returns fitted copies of the
+    models together with the fitted scaler and per-model performance.
+    """
+    
+    # Split data
+    X_train, X_test, y_train, y_test = train_test_split(
+        X, y, test_size=0.2, random_state=42, shuffle=False
+    )
+    
+    # Scale features
+    scaler = StandardScaler()
+    X_train_scaled = scaler.fit_transform(X_train)
+    X_test_scaled = scaler.transform(X_test)
+    
+    # Train models in parallel - the estimators are independent, so wall time
+    # is bounded by the slowest fit rather than the sum of all three
+    logger.info(f"Training {', '.join(models)}")
+    if n_jobs is None:
+        n_jobs = min(len(models), os.cpu_count() or 1)
+    # Cap each estimator's own threading too (e.g. RandomForest n_jobs=-1), otherwise
+    # one worker process per lot would still spin up cpu_count threads each
+    estimators = []
+    for model in models.values():
+        estimator = clone(model)
+        if 'n_jobs' in estimator.get_params():
+            estimator.set_params(n_jobs=n_jobs)
+        estimators.append(estimator)
+    fitted_models = Parallel(n_jobs=n_jobs, backend='loky')(
+        delayed(estimator.fit)(X_train_scaled, y_train) for estimator in estimators
+    )
+    fitted = dict(zip(models.keys(), fitted_models))
+    
+    # Evaluate models
+    model_performance = {}
+    
+    for model_name, model in fitted.items():
+        # Evaluate
+        y_pred = model.predict(X_test_scaled)
+        mae = mean_absolute_error(y_test, y_pred)
+        rmse = np.sqrt(mean_squared_error(y_test, y_pred))
+        
+        model_performance[model_name] = {
+            'mae': float(mae),
+            'rmse': float(rmse),
+            'train_score': float(model.score(X_train_scaled, y_train)),
+            'test_score': float(model.score(X_test_scaled, y_test))
+        }
+        
+        logger.info(f"{model_name} - MAE: {mae:.3f}, RMSE: {rmse:.3f}")
+    
+    return fitted, scaler, model_performance
+
 class SlidingWindowAnalyzer:
     """Implements sliding window algorithms for real-time demand analysis."""
     
+    # Compact structured record for buffered data points (column-wise access via buffer['field'])
+    BUFFER_DTYPE = np.dtype([
+        ('timestamp', 'datetime64[ns]'),
+        ('occupied_spots', 'i4'),
+        ('total_spots', 'i4'),
+        ('occupancy_rate', 'f4'),
+        ('demand_level', 'f4')
+    ])
+    
     def __init__(self, window_size: int = 100, step_size: int = 10):
         self.window_size = window_size
         self.step_size = step_size
-        self.data_buffer = deque(maxlen=window_size * 2)  # Double buffer for overlap
+        # Double buffer ring: each point is written at cursor and cursor + window_size,
+        # so the latest window is always a contiguous slice with no copying
+        self.data_buffer = np.zeros(window_size * 2, dtype=self.BUFFER_DTYPE)
+        self._cursor = 0
+        self._count = 0
+        # datetime64 has no timezone: aware inputs are stored as UTC and re-tagged on output
+        self._tz_aware = False
         self.metrics_cache = {}
         
     def add_data_point(self, timestamp: datetime, parking_lot_id: str, 
                        occupied_spots: int, total_spots: int, demand_level: float):
         """Add new data point to sliding window."""
-        data_point = {
-            'timestamp': timestamp,
-            'parking_lot_id': parking_lot_id,
-            'occupied_spots': occupied_spots,
-            'total_spots': total_spots,
-            'occupancy_rate': occupied_spots / total_spots if total_spots > 0 else 0,
-            'demand_level': demand_level
-        }
-        self.data_buffer.append(data_point)
+        if timestamp.tzinfo is not None:
+            timestamp = timestamp.astimezone(timezone.utc).replace(tzinfo=None)
+            self._tz_aware = True
+        data_point = (
+            np.datetime64(timestamp, 'ns'),
+            occupied_spots,
+            total_spots,
+            occupied_spots / total_spots if total_spots > 0 else 0,
+            demand_level
+        )
+        self.data_buffer[self._cursor] = data_point
+        self.data_buffer[self._cursor + self.window_size] = data_point
+        self._cursor = (self._cursor + 1) % self.window_size
+        self._count = min(self._count + 1, self.window_size)
         
         # Trigger analysis if window is full
-        if len(self.data_buffer) >= self.window_size:
+        if self._count >= self.window_size:
             return self._analyze_current_window()
         return None
     
     def _analyze_current_window(self) -> Dict[str, Any]:
         """Analyze current sliding window for patterns and metrics."""
-        if len(self.data_buffer) < self.window_size:
+        if self._count < self.window_size:
             return {}
         
-        # Extract recent window
-        window_data = list(self.data_buffer)[-self.window_size:]
+        # Extract recent window (contiguous view, oldest point first)
+        window_data = self.data_buffer[self._cursor:self._cursor + self.window_size]
         
-        # Convert to numpy arrays for efficient computation
-        occupancy_rates = np.array([d['occupancy_rate'] for d in window_data])
-        demand_levels = np.array([d['demand_level'] for d in window_data])
-        timestamps = [d['timestamp'] for d in window_data]
+        occupancy_rates = window_data['occupancy_rate']
+        demand_levels = window_data['demand_level']
+        timestamps = window_data['timestamp'].astype('datetime64[us]')
         
         analysis = {
-            'window_start': timestamps[0],
-            'window_end': timestamps[-1],
-            'mean_occupancy': np.mean(occupancy_rates),
-            'std_occupancy': np.std(occupancy_rates),
-            'peak_occupancy': np.max(occupancy_rates),
-            'min_occupancy': np.min(occupancy_rates),
+            'window_start': self._to_datetime(timestamps[0]),
+            'window_end': self._to_datetime(timestamps[-1]),
+            'mean_occupancy': float(np.mean(occupancy_rates)),
+            'std_occupancy': float(np.std(occupancy_rates)),
+            'peak_occupancy': float(np.max(occupancy_rates)),
+            'min_occupancy': float(np.min(occupancy_rates)),
             'occupancy_trend': self._calculate_trend(occupancy_rates),
-            'demand_volatility': np.std(demand_levels),
+            'demand_volatility': float(np.std(demand_levels)),
             'peak_periods': self._detect_peaks(occupancy_rates, timestamps),
             'pattern_score': self._calculate_pattern_score(occupancy_rates),
             'prediction_confidence': self._calculate_confidence(occupancy_rates)
@@ -88,16 +271,20 @@ class SlidingWindowAnalyzer:
         
         return analysis
     
+    def _to_datetime(self, value: np.datetime64) -> datetime:
+        """Convert a buffered timestamp back to datetime, UTC-aware if the inputs were."""
+        result = value.item()
+        return result.replace(tzinfo=timezone.utc) if self._tz_aware else result
+    
     def _calculate_trend(self, data: np.ndarray) -> float:
         """Calculate trend using linear regression."""
         if len(data) < 2:
             return 0.0
         
-        x = np.arange(len(data))
-        slope, _, r_value, _, _ = stats.linregress(x, data)
-        return slope * (r_value ** 2)  # Weight by R-squared
+        slopes, r_values = batched_linregress(data)
+        return float(slopes[0] * (r_values[0] ** 2))  # Weight by R-squared
     
-    def _detect_peaks(self, data: np.ndarray, timestamps: List[datetime]) -> List[Dict]:
+    def _detect_peaks(self, data: np.ndarray, timestamps: np.ndarray) -> List[Dict]:
         """Detect peak usage periods using scipy signal processing."""
         if len(data) < 10:
             return []
@@ -113,8 +300,8 @@ class SlidingWindowAnalyzer:
         for peak_idx in peaks:
             if peak_idx < len(timestamps):
                 peak_periods.append({
-                    'timestamp': timestamps[peak_idx],
-                    'occupancy_rate': data[peak_idx],
+                    'timestamp': self._to_datetime(timestamps[peak_idx]),
+                    'occupancy_rate': float(data[peak_idx]),
                     'prominence': properties.get('prominences', [0])[0] if 'prominences' in properties else 0
                 })
         
@@ -166,7 +353,7 @@ class OccupancyPatternDetector:
         cache_key = f"occupancy_patterns:{parking_lot_id}:{time_range[0].date()}"
         cached_result = await self.redis_client.get(cache_key)
         if cached_result:
-            return json.loads(cached_result)
+            return orjson.loads(cached_result)
         
         # Fetch historical data
         async with get_db() as db:
@@ -181,7 +368,7 @@ class OccupancyPatternDetector:
         await self.redis_client.setex(
             cache_key, 
             3600, 
-            json.dumps(patterns, default=str)
+            orjson.dumps(patterns, default=str, option=ORJSON_OPTIONS)
         )
         
         return patterns
@@ -190,24 +377,20 @@ class OccupancyPatternDetector:
                                   time_range: Tuple[datetime, datetime]) -> List[Dict]:
         """Fetch occupancy data from database."""
         
+        # Read from the hourly aggregate view (refreshed every 5 minutes) instead of
+        # re-aggregating raw reservations
         query = text("""
             SELECT 
-                DATE_TRUNC('hour', r.start_time) as hour_slot,
-                COUNT(*) as reservations_count,
+                mv.hour_bucket as hour_slot,
+                mv.reservations as reservations_count,
                 pl.total_spots,
-                (COUNT(*) * 100.0 / pl.total_spots) as occupancy_percentage,
-                EXTRACT(hour FROM r.start_time) as hour_of_day,
-                EXTRACT(dow FROM r.start_time) as day_of_week
-            FROM reservations r
-            JOIN parking_lots pl ON r.parking_lot_id = pl.id
-            WHERE r.parking_lot_id = :parking_lot_id
-            AND r.start_time BETWEEN :start_time AND :end_time
-            AND r.status = 'confirmed'
-            GROUP BY 
-                DATE_TRUNC('hour', r.start_time),
-                pl.total_spots,
-                EXTRACT(hour FROM r.start_time),
-                EXTRACT(dow FROM r.start_time)
+                (mv.reservations * 100.0 / pl.total_spots) as occupancy_percentage,
+                EXTRACT(hour FROM mv.hour_bucket) as hour_of_day,
+                EXTRACT(dow FROM mv.hour_bucket) as day_of_week
+            FROM mv_reservation_hourly mv
+            JOIN parking_lots pl ON mv.parking_lot_id = pl.id
+            WHERE mv.parking_lot_id = :parking_lot_id
+            AND mv.hour_bucket BETWEEN :start_time AND :end_time
             ORDER BY hour_slot
         """)
         
@@ -217,7 +400,7 @@ class OccupancyPatternDetector:
             'end_time': time_range[1]
         })
         
-        return [dict(row) for row in result.fetchall()]
+        return [dict(row) for row in result.mappings()]
     
     async def _analyze_patterns(self, data: List[Dict]) -> Dict[str, Any]:
         """Analyze occupancy patterns using statistical methods."""
@@ -271,7 +454,8 @@ class OccupancyPatternDetector:
         day_names = {0: 'Sunday', 1: 'Monday', 2: 'Tuesday', 3: 'Wednesday', 
                     4: 'Thursday', 5: 'Friday', 6: 'Saturday'}
         
-        daily_named = {day_names[idx]: stats for idx, stats in daily_stats.iterrows()}
+        # Plain dicts so the report serializes without pandas objects
+        daily_named = {day_names[idx]: stats.to_dict() for idx, stats in daily_stats.iterrows()}
         
         busiest_days = daily_stats['mean'].nlargest(3).index.tolist()
         quietest_days = daily_stats['mean'].nsmallest(3).index.tolist()
@@ -324,10 +508,10 @@ class OccupancyPatternDetector:
         
         return [
             {
-                'timestamp': row['hour_slot'],
-                'occupancy_percentage': row['occupancy_percentage'],
+                'timestamp': pd.Timestamp(row['hour_slot']).isoformat(),
+                'occupancy_percentage': float(row['occupancy_percentage']),
                 'type': 'high' if row['occupancy_percentage'] > upper_bound else 'low',
-                'severity': abs(row['occupancy_percentage'] - df['occupancy_percentage'].mean()) / df['occupancy_percentage'].std()
+                'severity': float(abs(row['occupancy_percentage'] - df['occupancy_percentage'].mean()) / df['occupancy_percentage'].std())
             }
             for _, row in anomalies.iterrows()
         ]
@@ -349,11 +533,10 @@ class OccupancyPatternDetector:
         short_term_data = occupancy_values[-short_term_size:]
         
         # Long-term trend (all data)
-        x_all = np.arange(len(occupancy_values))
-        x_short = np.arange(len(short_term_data))
-        
-        long_slope, _, long_r2, _, _ = stats.linregress(x_all, occupancy_values)
-        short_slope, _, short_r2, _, _ = stats.linregress(x_short, short_term_data)
+        long_slopes, long_r = batched_linregress(occupancy_values)
+        short_slopes, short_r = batched_linregress(short_term_data)
+        long_slope, long_r2 = long_slopes[0], long_r[0]
+        short_slope, short_r2 = short_slopes[0], short_r[0]
         
         return {
             'long_term_trend': {
@@ -435,15 +618,18 @@ class DemandPredictionEngine:
     def __init__(self, redis_client: redis.Redis):
         self.redis_client = redis_client
         self.models = {
-            'random_forest': RandomForestRegressor(n_estimators=100, random_state=42),
+            'random_forest': RandomForestRegressor(n_estimators=100, random_state=42, n_jobs=-1),
             'gradient_boosting': GradientBoostingRegressor(n_estimators=100, random_state=42),
             'linear_regression': LinearRegression()
         }
+        self.model_names = ('random_forest', 'gradient_boosting', 'linear_regression')
+        self.ensemble_weights = np.array([0.4, 0.4, 0.2])  # Aligned with model_names
         self.scaler = StandardScaler()
         self.feature_columns = [
             'hour_of_day', 'day_of_week', 'is_weekend', 'month',
             'historical_avg', 'recent_trend', 'seasonal_factor'
         ]
+        self.model_performance = {}
         self.is_trained = False
         
     async def train_models(self, parking_lot_id: str, lookback_days: int = 90):
@@ -461,38 +647,11 @@ class DemandPredictionEngine:
         # Prepare features and target
         X, y = self._prepare_features_target(training_data)
         
-        # Split data
-        X_train, X_test, y_train, y_test = train_test_split(
-            X, y, test_size=0.2, random_state=42, shuffle=False
-        )
-        
-        # Scale features
-        X_train_scaled = self.scaler.fit_transform(X_train)
-        X_test_scaled = self.scaler.transform(X_test)
-        
-        # Train models and evaluate
-        model_performance = {}
-        
-        for model_name, model in self.models.items():
-            logger.info(f"Training {model_name}")
-            
-            # Train model
-            model.fit(X_train_scaled, y_train)
-            
-            # Evaluate
-            y_pred = model.predict(X_test_scaled)
-            mae = mean_absolute_error(y_test, y_pred)
-            rmse = np.sqrt(mean_squared_error(y_test, y_pred))
-            
-            model_performance[model_name] = {
-                'mae': float(mae),
-                'rmse': float(rmse),
-                'train_score': float(model.score(X_train_scaled, y_train)),
-                'test_score': float(model.score(X_test_scaled, y_test))
-            }
-            
-            logger.info(f"{model_name} - MAE: {mae:.3f}, RMSE: {rmse:.3f}")
+        # Fit and evaluate off the event loop - training takes seconds and would
+        # otherwise block every other request served by this worker
+        model_performance = await asyncio.to_thread(self._train_and_evaluate, X, y)
         
+        self.model_performance = model_performance
         self.is_trained = True
         
         # Cache model performance
@@ -500,21 +659,91 @@ class DemandPredictionEngine:
         await self.redis_client.setex(
             cache_key,
             86400,  # 24 hours
-            json.dumps(model_performance)
+            orjson.dumps(model_performance)
         )
         
         return model_performance
     
+    def _train_and_evaluate(self, X: np.ndarray, y: np.ndarray) -> Dict[str, Dict[str, float]]:
+        """Fit and evaluate all models, keeping the fitted models and scaler (CPU-bound)."""
+        
+        self.models, self.scaler, model_performance = fit_demand_models(self.models, X, y)
+        
+        return model_performance
+    
+    async def train_models_batch(self, parking_lot_ids: List[str], 
+                                 lookback_days: int = 90) -> Dict[str, 'DemandPredictionEngine']:
+        """Train independent models for several parking lots.
+        
+        Training data for all lots is loaded with a single query and each lot is fitted
+        in its own worker process. Returns one engine per lot; lots without enough
+        history get an untrained engine.
+        """
+        
+        logger.info(f"Batch training demand prediction models for {len(parking_lot_ids)} parking lots")
+        
+        async with get_db() as db:
+            training_data = await self._load_training_frame(db, parking_lot_ids, lookback_days)
+        
+        predictors = {str(lot_id): DemandPredictionEngine(self.redis_client) for lot_id in parking_lot_ids}
+        
+        jobs = {}
+        if not training_data.empty:
+            for lot_id, lot_data in training_data.groupby('parking_lot_id'):
+                if len(lot_data) < 50:  # Need minimum data for training
+                    continue
+                jobs[str(lot_id)] = self._prepare_features_target(self._engineer_features(lot_data))
+        
+        if not jobs:
+            return predictors
+        
+        # One process per lot; each fits its models serially to avoid oversubscribing cores
+        loop = asyncio.get_running_loop()
+        with ProcessPoolExecutor(max_workers=min(len(jobs), os.cpu_count() or 1)) as executor:
+            results = await asyncio.gather(*(
+                loop.run_in_executor(executor, fit_demand_models, predictors[lot_id].models, X, y, 1)
+                for lot_id, (X, y) in jobs.items()
+            ))
+        
+        async with self.redis_client.pipeline(transaction=False) as pipe:
+            for lot_id, (models, scaler, model_performance) in zip(jobs, results):
+                predictor = predictors[lot_id]
+                predictor.models = models
+                predictor.scaler = scaler
+                predictor.model_performance = model_performance
+                predictor.is_trained = True
+                
+                # Cache model performance
+                pipe.setex(f"model_performance:{lot_id}", 86400, orjson.dumps(model_performance))
+            await pipe.execute()
+        
+        return predictors
+    
     async def _prepare_training_data(self, db: Session, parking_lot_id: str, 
                                    lookback_days: int) -> pd.DataFrame:
         """Prepare training data with features and target variable."""
         
+        df = await self._load_training_frame(db, [parking_lot_id], lookback_days)
+        
+        if df.empty:
+            return df
+        
+        # Add engineered features
+        df = self._engineer_features(df.drop(columns='parking_lot_id'))
+        
+        return df
+    
+    async def _load_training_frame(self, db: Session, parking_lot_ids: List[str], 
+                                 lookback_days: int) -> pd.DataFrame:
+        """Load hourly demand with SQL-computed features for one or more parking lots."""
+        
         end_date = datetime.now()
         start_date = end_date - timedelta(days=lookback_days)
         
         query = text("""
             WITH hourly_occupancy AS (
                 SELECT 
+                    r.parking_lot_id,
                     DATE_TRUNC('hour', r.start_time) as hour_slot,
                     COUNT(*) as demand,
                     pl.total_spots,
@@ -524,18 +753,19 @@ class DemandPredictionEngine:
                     EXTRACT(month FROM r.start_time) as month
                 FROM reservations r
                 JOIN parking_lots pl ON r.parking_lot_id = pl.id
-                WHERE r.parking_lot_id = :parking_lot_id
+                WHERE r.parking_lot_id = ANY(:parking_lot_ids)
                 AND r.start_time BETWEEN :start_date AND :end_date
                 AND r.status = 'confirmed'
                 GROUP BY 
+                    r.parking_lot_id,
                     DATE_TRUNC('hour', r.start_time),
                     pl.total_spots,
                     EXTRACT(hour FROM r.start_time),
                     EXTRACT(dow FROM r.start_time),
                     EXTRACT(month FROM r.start_time)
-                ORDER BY hour_slot
             )
             SELECT 
+                parking_lot_id,
                 hour_slot,
                 demand,
                 total_spots,
@@ -543,47 +773,44 @@ class DemandPredictionEngine:
                 hour_of_day,
                 day_of_week,
                 month,
-                CASE WHEN day_of_week IN (0, 6) THEN 1 ELSE 0 END as is_weekend
+                CASE WHEN day_of_week IN (0, 6) THEN 1 ELSE 0 END as is_weekend,
+                AVG(demand) OVER (PARTITION BY parking_lot_id, hour_of_day, day_of_week)::float8 as historical_avg,
+                COALESCE(
+                    AVG(demand) OVER (PARTITION BY parking_lot_id, month)
+                        / NULLIF(AVG(demand) OVER (PARTITION BY parking_lot_id), 0),
+                    1.0
+                )::float8 as seasonal_factor
             FROM hourly_occupancy
+            ORDER BY parking_lot_id, hour_slot
         """)
         
         result = db.execute(query, {
-            'parking_lot_id': parking_lot_id,
+            'parking_lot_ids': list(parking_lot_ids),
             'start_date': start_date,
             'end_date': end_date
         })
         
-        df = pd.DataFrame([dict(row) for row in result.fetchall()])
-        
-        if df.empty:
-            return df
-        
-        # Add engineered features
-        df = self._engineer_features(df)
-        
-        return df
+        return pd.DataFrame(result.fetchall(), columns=list(result.keys()))
     
     def _engineer_features(self, df: pd.DataFrame) -> pd.DataFrame:
-        """Engineer additional features for better prediction."""
+        """Engineer additional features for better prediction.
+        
+        is_weekend, historical_avg and seasonal_factor are computed by the SQL window
+        functions; only the rolling trend is left to pandas.
+        """
         
         # Sort by time
         df = df.sort_values('hour_slot').reset_index(drop=True)
         
-        # Historical average for same hour and day
-        df['historical_avg'] = df.groupby(['hour_of_day', 'day_of_week'])['demand'].transform('mean')
-        
         # Recent trend (slope of last 7 days)
         df['recent_trend'] = df['demand'].rolling(window=min(168, len(df)), min_periods=10).apply(
             lambda x: np.polyfit(range(len(x)), x, 1)[0] if len(x) >= 10 else 0
         )
         
-        # Seasonal factor (monthly average vs overall average)
-        monthly_avg = df.groupby('month')['demand'].transform('mean')
-        overall_avg = df['demand'].mean()
-        df['seasonal_factor'] = monthly_avg / overall_avg if overall_avg > 0 else 1.0
-        
-        # Fill NaN values
-        df = df.fillna(method='ffill').fillna(0)
+        # Fill NaN values (numpy pass for the model features, pandas for the rest)
+        for column in ('historical_avg', 'recent_trend', 'seasonal_factor'):
+            df[column] = forward_fill(df[column].to_numpy(dtype=np.float64, na_value=np.nan))
+        df = df.ffill().fillna(0)
         
         return df
     
@@ -595,8 +822,9 @@ class DemandPredictionEngine:
         if missing_cols:
             raise ValueError(f"Missing required columns: {missing_cols}")
         
-        X = df[self.feature_columns].values
-        y = df['demand'].values
+        # float32 matches the prediction features; tree models work in float32 internally
+        X = df[self.feature_columns].to_numpy(dtype=np.float32)
+        y = df['demand'].to_numpy(dtype=np.float64)
         
         return X, y
     
@@ -618,27 +846,18 @@ class DemandPredictionEngine:
         # Prepare features for prediction
         prediction_features = self._prepare_prediction_features(recent_data, future_slots)
         
-        # Scale features
-        X_pred_scaled = self.scaler.transform(prediction_features)
+        # Scale features and run the models in a worker thread so the event loop stays free
+        X_pred_scaled, model_preds = await asyncio.to_thread(self._run_models, prediction_features)
         
-        # Generate predictions
         predictions = {}
         
         if use_ensemble:
-            # Ensemble prediction (weighted average)
-            weights = {'random_forest': 0.4, 'gradient_boosting': 0.4, 'linear_regression': 0.2}
-            ensemble_pred = np.zeros(len(X_pred_scaled))
-            
-            for model_name, weight in weights.items():
-                model_pred = self.models[model_name].predict(X_pred_scaled)
-                ensemble_pred += weight * model_pred
-            
-            predictions['ensemble'] = ensemble_pred.tolist()
+            # Ensemble prediction (weighted average as a single matrix-vector product)
+            predictions['ensemble'] = (self.ensemble_weights @ model_preds).tolist()
         
         # Individual model predictions
-        for model_name, model in self.models.items():
-            model_pred = model.predict(X_pred_scaled)
-            predictions[model_name] = model_pred.tolist()
+        for i, model_name in enumerate(self.model_names):
+            predictions[model_name] = model_preds[i].tolist()
         
         # Add confidence intervals
         ensemble_pred = predictions.get('ensemble', predictions['random_forest'])
@@ -664,11 +883,22 @@ class DemandPredictionEngine:
         await self.redis_client.setex(
             cache_key,
             1800,  # 30 minutes
-            json.dumps(result, default=str)
+            orjson.dumps(result, default=str, option=ORJSON_OPTIONS)
         )
         
         return result
     
+    def _run_models(self, features: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+        """Scale features and predict with every model once (CPU-bound).
+        
+        Returns the scaled features and a (models, H) prediction matrix ordered like model_names.
+        """
+        X_scaled = self.scaler.transform(features)
+        model_preds = np.stack([
+            self.models[model_name].predict(X_scaled) for model_name in self.model_names
+        ])
+        return X_scaled, model_preds
+    
     async def _get_recent_context(self, db: Session, parking_lot_id: str) -> pd.DataFrame:
         """Get recent data for prediction context."""
         
@@ -676,21 +906,36 @@ class DemandPredictionEngine:
         start_time = end_time - timedelta(days=7)  # Last week for context
         
         query = text("""
+            WITH hourly_demand AS (
+                SELECT 
+                    DATE_TRUNC('hour', r.start_time) as hour_slot,
+                    COUNT(*) as demand,
+                    EXTRACT(hour FROM r.start_time) as hour_of_day,
+                    EXTRACT(dow FROM r.start_time) as day_of_week,
+                    EXTRACT(month FROM r.start_time) as month
+                FROM reservations r
+                WHERE r.parking_lot_id = :parking_lot_id
+                AND r.start_time BETWEEN :start_time AND :end_time
+                AND r.status = 'confirmed'
+                GROUP BY 
+                    DATE_TRUNC('hour', r.start_time),
+                    EXTRACT(hour FROM r.start_time),
+                    EXTRACT(dow FROM r.start_time),
+                    EXTRACT(month FROM r.start_time)
+            )
             SELECT 
-                DATE_TRUNC('hour', r.start_time) as hour_slot,
-                COUNT(*) as demand,
-                EXTRACT(hour FROM r.start_time) as hour_of_day,
-                EXTRACT(dow FROM r.start_time) as day_of_week,
-                EXTRACT(month FROM r.start_time) as month
-            FROM reservations r
-            WHERE r.parking_lot_id = :parking_lot_id
-            AND r.start_time BETWEEN :start_time AND :end_time
-            AND r.status = 'confirmed'
-            GROUP BY 
-                DATE_TRUNC('hour', r.start_time),
-                EXTRACT(hour FROM r.start_time),
-                EXTRACT(dow FROM r.start_time),
-                EXTRACT(month FROM r.start_time)
+                hour_slot,
+                demand,
+                hour_of_day,
+                day_of_week,
+                month,
+                CASE WHEN day_of_week IN (0, 6) THEN 1 ELSE 0 END as is_weekend,
+                AVG(demand) OVER (PARTITION BY hour_of_day, day_of_week)::float8 as historical_avg,
+                COALESCE(
+                    AVG(demand) OVER (PARTITION BY month) / NULLIF(AVG(demand) OVER (), 0),
+                    1.0
+                )::float8 as seasonal_factor
+            FROM hourly_demand
             ORDER BY hour_slot DESC
             LIMIT 168  -- Last week's hourly data
         """)
@@ -701,10 +946,9 @@ class DemandPredictionEngine:
             'end_time': end_time
         })
         
-        df = pd.DataFrame([dict(row) for row in result.fetchall()])
+        df = pd.DataFrame(result.fetchall(), columns=list(result.keys()))
         
         if not df.empty:
-            df['is_weekend'] = df['day_of_week'].isin([0, 6]).astype(int)
             df = self._engineer_features(df)
         
         return df
@@ -723,71 +967,80 @@ class DemandPredictionEngine:
     
     def _prepare_prediction_features(self, recent_data: pd.DataFrame, 
                                    future_slots: List[datetime]) -> np.ndarray:
-        """Prepare features for future time slots."""
-        
-        features = []
+        """Prepare features for future time slots as a single Polars lazy query."""
+        
+        slots = pl.LazyFrame({'hour_slot': future_slots}).with_columns(
+            pl.col('hour_slot').dt.hour().cast(pl.Int64).alias('hour_of_day'),
+            # Polars weekday is ISO (Mon=1..Sun=7); match PostgreSQL's EXTRACT(dow): 0 = Sunday
+            (pl.col('hour_slot').dt.weekday() % 7).cast(pl.Int64).alias('day_of_week'),
+            pl.col('hour_slot').dt.month().cast(pl.Int64).alias('month')
+        ).with_columns(
+            pl.col('day_of_week').is_in([0, 6]).cast(pl.Int8).alias('is_weekend')
+        )
         
-        for slot in future_slots:
-            hour_of_day = slot.hour
-            day_of_week = slot.weekday()
-            if day_of_week == 6:  # Sunday in pandas is 6, we want it as 0
-                day_of_week = 0
-            else:
-                day_of_week += 1
-            
-            is_weekend = 1 if day_of_week in [0, 6] else 0
-            month = slot.month
+        if recent_data.empty:
+            features = slots.with_columns(
+                pl.lit(0.0).alias('historical_avg'),
+                pl.lit(0.0).alias('recent_trend'),
+                pl.lit(1.0).alias('seasonal_factor')
+            )
+        else:
+            demand = recent_data['demand'].to_numpy(dtype=np.float64)
+            overall_mean = float(demand.mean())
+            recent_trend = float(np.diff(demand[-10:]).mean()) if len(demand) >= 10 else 0.0
             
-            # Calculate historical average from recent data
-            if not recent_data.empty:
-                similar_hours = recent_data[
-                    (recent_data['hour_of_day'] == hour_of_day) & 
-                    (recent_data['day_of_week'] == day_of_week)
-                ]
-                historical_avg = similar_hours['demand'].mean() if not similar_hours.empty else recent_data['demand'].mean()
-                
-                # Recent trend from last few data points
-                recent_trend = recent_data['demand'].tail(10).diff().mean() if len(recent_data) >= 10 else 0
-                
-                # Seasonal factor
-                monthly_data = recent_data[recent_data['month'] == month]
-                seasonal_factor = monthly_data['demand'].mean() / recent_data['demand'].mean() if not monthly_data.empty and recent_data['demand'].mean() > 0 else 1.0
-            else:
-                historical_avg = 0
-                recent_trend = 0
-                seasonal_factor = 1.0
+            recent = pl.from_pandas(
+                recent_data[['hour_of_day', 'day_of_week', 'month', 'demand']].astype({
+                    'hour_of_day': np.int64, 'day_of_week': np.int64,
+                    'month': np.int64, 'demand': np.float64
+                })
+            ).lazy()
+            hd_avg = recent.group_by(['hour_of_day', 'day_of_week']).agg(
+                pl.col('demand').mean().alias('historical_avg')
+            )
+            month_avg = recent.group_by('month').agg(pl.col('demand').mean().alias('month_avg'))
             
-            features.append([
-                hour_of_day,
-                day_of_week,
-                is_weekend,
-                month,
-                historical_avg,
-                recent_trend,
-                seasonal_factor
-            ])
+            seasonal_factor = (
+                pl.col('month_avg').fill_null(overall_mean) / overall_mean if overall_mean > 0 else pl.lit(1.0)
+            )
+            features = (
+                slots
+                .join(hd_avg, on=['hour_of_day', 'day_of_week'], how='left')
+                .join(month_avg, on='month', how='left')
+                .with_columns(
+                    pl.col('historical_avg').fill_null(overall_mean),
+                    pl.lit(recent_trend).alias('recent_trend'),
+                    seasonal_factor.alias('seasonal_factor')
+                )
+            )
         
-        return np.array(features)
+        return (
+            features
+            .sort('hour_slot')
+            .select(self.feature_columns)
+            .collect()
+            .to_numpy()
+            .astype(np.float32)
+        )
     
     def _calculate_confidence_intervals(self, predictions: List[float], 
-                                     features: np.ndarray) -> Dict[str, List[float]]:
+                                     features: np.ndarray) -> Dict[str, np.ndarray]:
         """Calculate confidence intervals for predictions."""
         
         # Simple confidence interval based on prediction uncertainty
         # In a production system, you'd use more sophisticated methods
         
-        pred_array = np.array(predictions)
+        pred_array = np.asarray(predictions, dtype=np.float32)
         
         # Estimate uncertainty based on feature similarity to training data
         # This is a simplified approach
         uncertainty = np.std(pred_array) * 0.5  # 50% of standard deviation as base uncertainty
+        margin = 1.96 * uncertainty  # 95% confidence interval
         
-        lower_bound = pred_array - 1.96 * uncertainty  # 95% confidence interval
-        upper_bound = pred_array + 1.96 * uncertainty
-        
+        # Kept as arrays; serialized natively by orjson (see ORJSON_OPTIONS)
         return {
-            'lower_95': np.maximum(0, lower_bound).tolist(),  # Demand can't be negative
-            'upper_95': upper_bound.tolist()
+            'lower_95': np.clip(pred_array - margin, 0, None),  # Demand can't be negative
+            'upper_95': pred_array + margin
         }
 
 class AnalyticsService:
@@ -798,10 +1051,70 @@ class AnalyticsService:
         self.sliding_window = SlidingWindowAnalyzer()
         self.pattern_detector = OccupancyPatternDetector(redis_client)
         self.demand_predictor = DemandPredictionEngine(redis_client)
+        self.release_lock_script = redis_client.register_script(RELEASE_LOCK_SCRIPT)
         
     async def comprehensive_analysis(self, parking_lot_id: str, 
-                                   analysis_period_days: int = 30) -> Dict[str, Any]:
-        """Perform comprehensive analytics analysis for a parking lot."""
+                                   analysis_period_days: int = 30,
+                                   demand_predictor: Optional[DemandPredictionEngine] = None) -> Dict[str, Any]:
+        """Perform comprehensive analytics analysis for a parking lot.
+        
+        Reports are served stale-while-revalidate: a fresh cached report is returned as is,
+        a stale one is returned while a single background task (guarded by a Redis lock)
+        rebuilds it. A pre-trained demand_predictor (see comprehensive_analysis_batch)
+        skips model training and always rebuilds.
+        """
+        
+        if demand_predictor is not None:
+            return await self._build_comprehensive_analysis(parking_lot_id, analysis_period_days, demand_predictor)
+        
+        cache_key = f"comprehensive_analysis:{parking_lot_id}:{analysis_period_days}"
+        lock_key = f"lock:{cache_key}"
+        
+        async with self.redis_client.pipeline(transaction=False) as pipe:
+            pipe.get(f"{cache_key}:value")
+            pipe.exists(f"{cache_key}:fresh")
+            cached_report, is_fresh = await pipe.execute()
+        
+        if cached_report and is_fresh:
+            return orjson.loads(cached_report)
+        
+        lock_token = secrets.token_hex(8)
+        got_lock = await self.redis_client.set(lock_key, lock_token, nx=True, ex=COMPREHENSIVE_LOCK_TTL)
+        
+        if cached_report:
+            if got_lock:
+                task = asyncio.create_task(
+                    self._rebuild_with_lock(parking_lot_id, analysis_period_days, lock_key, lock_token)
+                )
+                _background_tasks.add(task)
+                task.add_done_callback(_on_background_task_done)
+            return orjson.loads(cached_report)
+        
+        if not got_lock:
+            # Cold cache with a rebuild already in flight - wait for it instead of duplicating the work
+            for _ in range(COMPREHENSIVE_LOCK_TTL * 2):
+                await asyncio.sleep(0.5)
+                cached_report = await self.redis_client.get(f"{cache_key}:value")
+                if cached_report:
+                    return orjson.loads(cached_report)
+            return await self._build_comprehensive_analysis(parking_lot_id, analysis_period_days)
+        
+        return await self._rebuild_with_lock(parking_lot_id, analysis_period_days, lock_key, lock_token)
+    
+    async def _rebuild_with_lock(self, parking_lot_id: str, analysis_period_days: int,
+                                 lock_key: str, lock_token: str) -> Dict[str, Any]:
+        """Rebuild the report, then release the single-flight lock if it is still ours."""
+        try:
+            return await self._build_comprehensive_analysis(parking_lot_id, analysis_period_days)
+        finally:
+            try:
+                await self.release_lock_script(keys=[lock_key], args=[lock_token])
+            except Exception as e:
+                logger.error(f"Failed to release {lock_key}: {e}")
+    
+    async def _build_comprehensive_analysis(self, parking_lot_id: str, analysis_period_days: int,
+                                          demand_predictor: Optional[DemandPredictionEngine] = None) -> Dict[str, Any]:
+        """Run the full analysis pipeline and refresh the cached report."""
         
         logger.info(f"Starting comprehensive analysis for parking lot {parking_lot_id}")
         
@@ -819,10 +1132,16 @@ class AnalyticsService:
         
         # Train prediction models if enough data
         try:
-            model_performance = await self.demand_predictor.train_models(parking_lot_id)
+            if demand_predictor is None:
+                demand_predictor = self.demand_predictor
+                model_performance = await demand_predictor.train_models(parking_lot_id)
+            elif demand_predictor.is_trained:
+                model_performance = demand_predictor.model_performance
+            else:
+                raise ValueError("Insufficient historical data for model training")
             
             # Generate predictions
-            demand_forecast = await self.demand_predictor.predict_demand(parking_lot_id, 48)
+            demand_forecast = await demand_predictor.predict_demand(parking_lot_id, 48)
         except ValueError as e:
             logger.warning(f"Could not train prediction models: {e}")
             model_performance = {}
@@ -843,56 +1162,47 @@ class AnalyticsService:
             'generated_at': datetime.now().isoformat()
         }
         
-        # Cache comprehensive report
-        cache_key = f"comprehensive_analysis:{parking_lot_id}"
-        await self.redis_client.setex(
-            cache_key,
-            3600,  # 1 hour
-            json.dumps(comprehensive_report, default=str)
-        )
+        # Cache comprehensive report: the value outlives the freshness marker so it can be
+        # served stale while the next rebuild runs
+        cache_key = f"comprehensive_analysis:{parking_lot_id}:{analysis_period_days}"
+        async with self.redis_client.pipeline(transaction=True) as pipe:
+            pipe.setex(
+                f"{cache_key}:value",
+                7200,  # 2 hours
+                orjson.dumps(comprehensive_report, default=str, option=ORJSON_OPTIONS)
+            )
+            pipe.setex(f"{cache_key}:fresh", 3600, "1")  # 1 hour
+            await pipe.execute()
         
         logger.info(f"Comprehensive analysis completed for parking lot {parking_lot_id}")
         
         return comprehensive_report
     
+    async def comprehensive_analysis_batch(self, parking_lot_ids: List[str], 
+                                         analysis_period_days: int = 30) -> Dict[str, Dict[str, Any]]:
+        """Perform comprehensive analysis for several parking lots, training their models in parallel."""
+        
+        predictors = await self.demand_predictor.train_models_batch(parking_lot_ids)
+        
+        reports = await asyncio.gather(*(
+            self.comprehensive_analysis(lot_id, analysis_period_days, predictors[str(lot_id)])
+            for lot_id in parking_lot_ids
+        ))
+        
+        return dict(zip(parking_lot_ids, reports))
+    
     async def _get_current_metrics(self, parking_lot_id: str) -> Dict[str, Any]:
         """Get current real-time metrics."""
         
         async with get_db() as db:
-            # Current occupancy
-            current_query = text("""
-                SELECT 
-                    pl.total_spots,
-                    COUNT(r.id) as occupied_spots,
-                    (COUNT(r.id) * 100.0 / pl.total_spots) as current_occupancy_rate
-                FROM parking_lots pl
-                LEFT JOIN reservations r ON r.parking_lot_id = pl.id 
-                    AND r.status = 'confirmed'
-                    AND NOW() BETWEEN r.start_time AND r.end_time
-                WHERE pl.id = :parking_lot_id
-                GROUP BY pl.id, pl.total_spots
-            """)
-            
-            result = db.execute(current_query, {'parking_lot_id': parking_lot_id})
+            # Current occupancy and today's statistics in one round trip
+            result = db.execute(_CURRENT_METRICS_SQL, {'parking_lot_id': parking_lot_id})
             current_data = result.fetchone()
             
             if not current_data:
                 return {}
             
-            # Today's statistics
-            today_query = text("""
-                SELECT 
-                    COUNT(*) as total_reservations_today,
-                    AVG(EXTRACT(EPOCH FROM (end_time - start_time))/3600) as avg_duration_hours,
-                    MAX(created_at) as last_reservation_time
-                FROM reservations 
-                WHERE parking_lot_id = :parking_lot_id 
-                AND DATE(start_time) = CURRENT_DATE
-                AND status = 'confirmed'
-            """)
-            
-            today_result = db.execute(today_query, {'parking_lot_id': parking_lot_id})
-            today_data = today_result.fetchone()
+            today_data = current_data
             
             return {
                 'current_occupancy': {
@@ -986,27 +1296,14 @@ class AnalyticsService:
         cache_key = f"realtime_analytics:{parking_lot_id}"
         cached_data = await self.redis_client.get(cache_key)
         if cached_data:
-            return json.loads(cached_data)
+            return orjson.loads(cached_data)
         
         current_metrics = await self._get_current_metrics(parking_lot_id)
         
         # Get hourly trends for today
         async with get_db() as db:
-            hourly_trend_query = text("""
-                SELECT 
-                    EXTRACT(hour FROM start_time) as hour,
-                    COUNT(*) as reservations,
-                    AVG(EXTRACT(EPOCH FROM (end_time - start_time))/3600) as avg_duration
-                FROM reservations 
-                WHERE parking_lot_id = :parking_lot_id 
-                AND DATE(start_time) = CURRENT_DATE
-                AND status = 'confirmed'
-                GROUP BY EXTRACT(hour FROM start_time)
-                ORDER BY hour
-            """)
-            
-            result = db.execute(hourly_trend_query, {'parking_lot_id': parking_lot_id})
-            hourly_data = [dict(row) for row in result.fetchall()]
+            result = db.execute(_HOURLY_TREND_SQL, {'parking_lot_id': parking_lot_id})
+            hourly_data = [dict(row) for row in result.mappings()]
         
         real_time_data = {
             'parking_lot_id': parking_lot_id,
@@ -1020,7 +1317,7 @@ class AnalyticsService:
         await self.redis_client.setex(
             cache_key,
             300,
-            json.dumps(real_time_data, default=str)
+            orjson.dumps(real_time_data, default=str, option=ORJSON_OPTIONS)
         )
         
         return real_time_data
@@ -1,10 +1,13 @@
 """
 Authentication service for user management
 """
+import hashlib
+import time
 from typing import Optional, Tuple
 from datetime import datetime, timedelta
 from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy import select, update
+from sqlalchemy.exc import IntegrityError
 from fastapi import HTTPException, status
 from app.models.user import User, UserStatus, UserRole
 from app.schemas.auth import UserCreate, UserLogin, PasswordChange, PasswordReset, PasswordResetConfirm
@@ -16,12 +19,65 @@ from app.core.security import (
     create_refresh_token,
     generate_password_reset_token,
     generate_email_verification_token,
+    token_blacklist_key,
     verify_token
 )
 from app.core.config import settings
-import redis
+import redis.asyncio as redis
 
-redis_client = redis.from_url(settings.REDIS_URL, decode_responses=True)
+# Single module-wide connection pool shared by all auth requests
+redis_client = redis.from_url(
+    settings.REDIS_URL,
+    decode_responses=True,
+    max_connections=50,
+    health_check_interval=30
+)
+
+# Short-lived per email+IP failure counter that short-circuits password hashing
+AUTH_FAILURE_LIMIT = 5
+AUTH_FAILURE_WINDOW_SECONDS = 60
+
+# Refresh tokens live in one hash per user: field = SHA-256 of the token, value = expiry
+# (unix seconds). Each session has its own field and no plaintext token is stored.
+def _refresh_tokens_key(user_id) -> str:
+    return f"user:{user_id}:rt"
+
+def _hash_refresh_token(token: str) -> str:
+    return hashlib.sha256(token.encode()).hexdigest()
+
+# Register a new session, pruning the user's expired sessions in the same round trip
+store_refresh_token_script = redis_client.register_script("""
+local now = tonumber(ARGV[2])
+local sessions = redis.call('HGETALL', KEYS[1])
+for i = 1, #sessions, 2 do
+    if tonumber(sessions[i + 1]) < now then
+        redis.call('HDEL', KEYS[1], sessions[i])
+    end
+end
+redis.call('HSET', KEYS[1], ARGV[1], now + tonumber(ARGV[3]))
+redis.call('EXPIRE', KEYS[1], ARGV[3])
+return 1
+""")
+
+# Validate the presented refresh token and rotate it in a single atomic round trip,
+# pruning the user's expired sessions on the way
+rotate_refresh_token_script = redis_client.register_script("""
+local now = tonumber(ARGV[3])
+local expiry = redis.call('HGET', KEYS[1], ARGV[1])
+if not expiry or tonumber(expiry) < now then
+    return 0
+end
+local sessions = redis.call('HGETALL', KEYS[1])
+for i = 1, #sessions, 2 do
+    if tonumber(sessions[i + 1]) < now then
+        redis.call('HDEL', KEYS[1], sessions[i])
+    end
+end
+redis.call('HDEL', KEYS[1], ARGV[1])
+redis.call('HSET', KEYS[1], ARGV[2], now + tonumber(ARGV[4]))
+redis.call('EXPIRE', KEYS[1], ARGV[4])
+return 1
+""")
 
 class AuthService:
     """Authentication service class"""
@@ -29,27 +85,6 @@ class AuthService:
     @staticmethod
     async def create_user(db: AsyncSession, user_data: UserCreate) -> User:
         """Create a new user"""
-        # Check if user already exists
-        existing_user = await db.execute(
-            select(User).where(User.email == user_data.email)
-        )
-        if existing_user.scalar_one_or_none():
-            raise HTTPException(
-                status_code=status.HTTP_400_BAD_REQUEST,
-                detail="Email already registered"
-            )
-        
-        # Check username if provided
-        if user_data.username:
-            existing_username = await db.execute(
-                select(User).where(User.username == user_data.username)
-            )
-            if existing_username.scalar_one_or_none():
-                raise HTTPException(
-                    status_code=status.HTTP_400_BAD_REQUEST,
-                    detail="Username already taken"
-                )
-        
         # Create user
         salt = create_salt()
         hashed_password = get_password_hash(user_data.password, salt)
@@ -68,8 +103,24 @@ class AuthService:
             status=UserStatus.PENDING_VERIFICATION
         )
         
+        # Uniqueness is enforced by the ix_users_email/ix_users_username indexes rather than
+        # preflight SELECTs; translate the violation into the matching 400
         db.add(user)
-        await db.commit()
+        try:
+            await db.commit()
+        except IntegrityError as e:
+            await db.rollback()
+            if 'ix_users_email' in str(e.orig):
+                raise HTTPException(
+                    status_code=status.HTTP_400_BAD_REQUEST,
+                    detail="Email already registered"
+                )
+            if 'ix_users_username' in str(e.orig):
+                raise HTTPException(
+                    status_code=status.HTTP_400_BAD_REQUEST,
+                    detail="Username already taken"
+                )
+            raise
         await db.refresh(user)
         
         # TODO: Send verification email
@@ -78,8 +129,21 @@ class AuthService:
         return user
     
     @staticmethod
-    async def authenticate_user(db: AsyncSession, credentials: UserLogin) -> Optional[User]:
+    async def authenticate_user(
+        db: AsyncSession, 
+        credentials: UserLogin, 
+        client_ip: Optional[str] = None
+    ) -> Optional[User]:
         """Authenticate user with email and password"""
+        # Reject repeated recent failures before doing any DB or hashing work
+        failure_key = f"auth:fail:{credentials.email}:{client_ip or 'unknown'}"
+        recent_failures = await redis_client.get(failure_key)
+        if recent_failures and int(recent_failures) > AUTH_FAILURE_LIMIT:
+            raise HTTPException(
+                status_code=status.HTTP_423_LOCKED,
+                detail="Too many failed login attempts, try again later"
+            )
+        
         # Get user by email
         result = await db.execute(
             select(User).where(User.email == credentials.email)
@@ -87,6 +151,7 @@ class AuthService:
         user = result.scalar_one_or_none()
         
         if not user:
+            await AuthService._record_failed_attempt(failure_key)
             return None
         
         # Check if account is locked due to failed attempts
@@ -98,23 +163,46 @@ class AuthService:
         
         # Verify password
         if not verify_password(credentials.password, user.hashed_password, user.salt):
-            # Increment failed login attempts
-            user.failed_login_attempts += 1
+            # Increment failed login attempts in the database so concurrent attempts aren't lost
+            await db.execute(
+                update(User)
+                .where(User.id == user.id)
+                .values(failed_login_attempts=User.failed_login_attempts + 1)
+            )
             await db.commit()
+            await AuthService._record_failed_attempt(failure_key)
             return None
         
         # Reset failed login attempts on successful login
-        user.failed_login_attempts = 0
-        user.last_login_at = datetime.utcnow()
-        user.last_activity_at = datetime.utcnow()
+        now = datetime.utcnow()
+        result = await db.execute(
+            update(User)
+            .where(User.id == user.id)
+            .values(failed_login_attempts=0, last_login_at=now, last_activity_at=now)
+            .returning(User)
+        )
+        user = result.scalar_one()
         await db.commit()
+        await redis_client.delete(failure_key)
         
         return user
     
     @staticmethod
-    async def login_user(db: AsyncSession, credentials: UserLogin) -> Tuple[str, str, int]:
+    async def _record_failed_attempt(failure_key: str):
+        """Increment the short-lived failure counter for an email+IP pair"""
+        async with redis_client.pipeline(transaction=True) as pipe:
+            pipe.incr(failure_key)
+            pipe.expire(failure_key, AUTH_FAILURE_WINDOW_SECONDS)
+            await pipe.execute()
+    
+    @staticmethod
+    async def login_user(
+        db: AsyncSession, 
+        credentials: UserLogin, 
+        client_ip: Optional[str] = None
+    ) -> Tuple[str, str, int]:
         """Login user and return tokens"""
-        user = await AuthService.authenticate_user(db, credentials)
+        user = await AuthService.authenticate_user(db, credentials, client_ip)
         
         if not user:
             raise HTTPException(
@@ -151,14 +239,22 @@ class AuthService:
         refresh_token = create_refresh_token(subject=user.id)
         
         # Store refresh token in Redis
-        redis_client.setex(
-            f"refresh_token:{user.id}",
-            settings.REFRESH_TOKEN_EXPIRE_MINUTES * 60,
-            refresh_token
-        )
+        await AuthService.store_refresh_token(user.id, refresh_token)
         
         return access_token, refresh_token, settings.ACCESS_TOKEN_EXPIRE_MINUTES * 60
     
+    @staticmethod
+    async def store_refresh_token(user_id: int, refresh_token: str):
+        """Register a refresh token as a new session for the user"""
+        await store_refresh_token_script(
+            keys=[_refresh_tokens_key(user_id)],
+            args=[
+                _hash_refresh_token(refresh_token),
+                int(time.time()),
+                settings.REFRESH_TOKEN_EXPIRE_MINUTES * 60
+            ]
+        )
+    
     @staticmethod
     async def refresh_token(db: AsyncSession, refresh_token: str) -> Tuple[str, str, int]:
         """Refresh access token"""
@@ -169,14 +265,6 @@ class AuthService:
                 detail="Invalid refresh token"
             )
         
-        # Check if refresh token exists in Redis
-        stored_token = redis_client.get(f"refresh_token:{user_id}")
-        if not stored_token or stored_token != refresh_token:
-            raise HTTPException(
-                status_code=status.HTTP_401_UNAUTHORIZED,
-                detail="Invalid refresh token"
-            )
-        
         # Get user
         result = await db.execute(select(User).where(User.id == int(user_id)))
         user = result.scalar_one_or_none()
@@ -198,27 +286,38 @@ class AuthService:
         )
         new_refresh_token = create_refresh_token(subject=user.id)
         
-        # Update refresh token in Redis
-        redis_client.setex(
-            f"refresh_token:{user.id}",
-            settings.REFRESH_TOKEN_EXPIRE_MINUTES * 60,
-            new_refresh_token
+        # Check the stored refresh token and replace it in Redis
+        rotated = await rotate_refresh_token_script(
+            keys=[_refresh_tokens_key(user.id)],
+            args=[
+                _hash_refresh_token(refresh_token),
+                _hash_refresh_token(new_refresh_token),
+                int(time.time()),
+                settings.REFRESH_TOKEN_EXPIRE_MINUTES * 60
+            ]
         )
+        if not rotated:
+            raise HTTPException(
+                status_code=status.HTTP_401_UNAUTHORIZED,
+                detail="Invalid refresh token"
+            )
         
         return access_token, new_refresh_token, settings.ACCESS_TOKEN_EXPIRE_MINUTES * 60
     
     @staticmethod
     async def logout_user(user_id: int, token: str):
         """Logout user and invalidate tokens"""
-        # Remove refresh token from Redis
-        redis_client.delete(f"refresh_token:{user_id}")
-        
-        # Add access token to blacklist
-        redis_client.setex(
-            f"blacklist:{token}",
-            settings.ACCESS_TOKEN_EXPIRE_MINUTES * 60,
-            "1"
-        )
+        async with redis_client.pipeline(transaction=True) as pipe:
+            # Remove the user's refresh tokens from Redis
+            pipe.delete(_refresh_tokens_key(user_id))
+            
+            # Add access token to blacklist
+            pipe.setex(
+                token_blacklist_key(token),
+                settings.ACCESS_TOKEN_EXPIRE_MINUTES * 60,
+                "1"
+            )
+            await pipe.execute()
     
     @staticmethod
     async def change_password(
@@ -246,7 +345,7 @@ class AuthService:
         await db.commit()
         
         # Invalidate all existing tokens for this user
-        redis_client.delete(f"refresh_token:{user.id}")
+        await redis_client.delete(_refresh_tokens_key(user.id))
         
         return True
     
@@ -309,7 +408,7 @@ class AuthService:
         await db.commit()
         
         # Invalidate all existing tokens for this user
-        redis_client.delete(f"refresh_token:{user.id}")
+        await redis_client.delete(_refresh_tokens_key(user.id))
         
         return True
     
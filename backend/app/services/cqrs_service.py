@@ -4,32 +4,66 @@ Implements read/write separation for parking management system
 """
 
 import asyncio
-import json
 import logging
+import secrets
+import time
 import uuid
 from abc import ABC, abstractmethod
-from dataclasses import dataclass, asdict
+from dataclasses import dataclass, field
 from datetime import datetime, timezone
 from typing import Dict, List, Optional, Any, Union, Generic, TypeVar
 from enum import Enum
 
-from sqlalchemy import select, update, delete, and_, or_
+import orjson
+from sqlalchemy import select, update, delete, and_, or_, func, cast, case, literal, null, Integer, text
 from sqlalchemy.ext.asyncio import AsyncSession
-from sqlalchemy.orm import selectinload
 
 from app.db.database import get_db
 from app.db.redis import get_redis_client
+from app.db.asyncpg_pool import asyncpg_pool
+from app.db.enums import sql_enum, sql_enum_list
 from app.models.parking_spot import ParkingSpot, SpotStatus
 from app.models.reservation import Reservation, ReservationStatus
 from app.models.parking_lot import ParkingLot
 from app.models.user import User
 from app.models.vehicle import Vehicle
-from app.services.event_service import EventService, EventType, EventPriority
+from app.services.event_service import Event, EventService, EventType, EventPriority
 
 logger = logging.getLogger(__name__)
 
 T = TypeVar('T')
 
+# Command status/result TTL in Redis (seconds)
+COMMAND_TTL = 3600
+
+# Commands still running after this long (seconds) get a PROCESSING status entry
+COMMAND_STATUS_DELAY = 0.005
+
+# Per-aggregate command lock: expiry (ms) and acquisition retries with exponential backoff
+AGGREGATE_LOCK_TTL_MS = 3000
+AGGREGATE_LOCK_RETRIES = 5
+AGGREGATE_LOCK_RETRY_DELAY = 0.01
+
+# Spot status updates passed to CQRSService.submit are coalesced into batches of up to
+# this many commands, waiting at most this long (seconds) after the first one arrives
+SUBMIT_BATCH_MAX_SIZE = 64
+SUBMIT_BATCH_MAX_WAIT = 0.01
+
+# Delete the lock only if it still holds our token
+RELEASE_LOCK_SCRIPT = """
+if redis.call("get", KEYS[1]) == ARGV[1] then
+    return redis.call("del", KEYS[1])
+else
+    return 0
+end
+"""
+
+# Raw SQL below (hot reads via asyncpg, single-statement writes) compares enum columns
+# against the database labels from app.db.enums (member values), as the ORM columns do
+
+OPEN_RESERVATION_STATUSES = (ReservationStatus.PENDING, ReservationStatus.CONFIRMED, ReservationStatus.ACTIVE)
+CONFLICTING_RESERVATION_STATUSES = (ReservationStatus.CONFIRMED, ReservationStatus.ACTIVE)
+
 class CommandStatus(Enum):
     PENDING = "pending"
     PROCESSING = "processing"
@@ -51,13 +85,12 @@ class CommandResult:
         if self.events_generated is None:
             self.events_generated = []
 
+@dataclass(slots=True, kw_only=True)
 class Command(ABC):
-    """Base command interface"""
-    
-    def __init__(self, command_id: str = None, correlation_id: str = None):
-        self.command_id = command_id or str(uuid.uuid4())
-        self.correlation_id = correlation_id
-        self.timestamp = datetime.now(timezone.utc)
+    """Base command interface (slotted; subclasses are keyword-only slotted dataclasses)"""
+    command_id: str = field(default_factory=lambda: str(uuid.uuid4()))
+    correlation_id: Optional[str] = None
+    timestamp: datetime = field(default_factory=lambda: datetime.now(timezone.utc))
     
     @abstractmethod
     async def execute(self, session: AsyncSession, event_service: EventService) -> CommandResult:
@@ -68,18 +101,22 @@ class Command(ABC):
     def validate(self) -> bool:
         """Validate command parameters"""
         pass
+    
+    def aggregate_key(self) -> Optional[tuple]:
+        """(aggregate_type, aggregate_id) that concurrent commands must not modify together"""
+        return None
 
 class Query(ABC):
-    """Base query interface"""
+    """Base query interface (queries read through the asyncpg pool, not an ORM session)"""
     
     @abstractmethod
-    async def execute(self, session: AsyncSession) -> Any:
+    async def execute(self) -> Any:
         """Execute the query"""
         pass
 
 # Command Implementations
 
-@dataclass
+@dataclass(slots=True, kw_only=True)
 class CreateReservationCommand(Command):
     """Command to create a new reservation"""
     user_id: int
@@ -105,7 +142,8 @@ class CreateReservationCommand(Command):
         import uuid
         from app.models.reservation import ReservationType
         
-        start_time = datetime.now(timezone.utc)
+        t0 = time.monotonic()
+        now = datetime.now(timezone.utc)
         
         try:
             # Validate command
@@ -117,7 +155,7 @@ class CreateReservationCommand(Command):
                 )
             
             # Generate reservation number and confirmation code
-            reservation_number = f"RES-{datetime.now().strftime('%Y%m%d')}-{str(uuid.uuid4())[:8].upper()}"
+            reservation_number = f"RES-{now.strftime('%Y%m%d')}-{str(uuid.uuid4())[:8].upper()}"
             confirmation_code = str(uuid.uuid4())[:8].upper()
             
             # Create reservation
@@ -151,17 +189,19 @@ class CreateReservationCommand(Command):
                     "vehicle_id": self.vehicle_id,
                     "parking_lot_id": self.parking_lot_id,
                     "parking_spot_id": self.parking_spot_id,
-                    "start_time": self.start_time.isoformat(),
-                    "end_time": self.end_time.isoformat(),
+                    "start_time": self.start_time,
+                    "end_time": self.end_time,
                     "reservation_number": reservation_number,
                     "confirmation_code": confirmation_code
                 },
                 correlation_id=self.correlation_id
             )
             
+            # Persist this command's events in one batch, just before committing
+            await event_service.flush_events()
             await session.commit()
             
-            execution_time = int((datetime.now(timezone.utc) - start_time).total_seconds() * 1000)
+            execution_time = int((time.monotonic() - t0) * 1000)
             
             return CommandResult(
                 command_id=self.command_id,
@@ -179,7 +219,7 @@ class CreateReservationCommand(Command):
             await session.rollback()
             logger.error(f"Failed to create reservation: {e}")
             
-            execution_time = int((datetime.now(timezone.utc) - start_time).total_seconds() * 1000)
+            execution_time = int((time.monotonic() - t0) * 1000)
             
             return CommandResult(
                 command_id=self.command_id,
@@ -188,7 +228,7 @@ class CreateReservationCommand(Command):
                 execution_time_ms=execution_time
             )
 
-@dataclass
+@dataclass(slots=True, kw_only=True)
 class UpdateSpotStatusCommand(Command):
     """Command to update parking spot status"""
     spot_id: int
@@ -200,8 +240,12 @@ class UpdateSpotStatusCommand(Command):
     def validate(self) -> bool:
         return self.spot_id > 0 and isinstance(self.new_status, SpotStatus)
     
+    def aggregate_key(self) -> Optional[tuple]:
+        return ("spot", self.spot_id)
+    
     async def execute(self, session: AsyncSession, event_service: EventService) -> CommandResult:
-        start_time = datetime.now(timezone.utc)
+        t0 = time.monotonic()
+        now = datetime.now(timezone.utc)
         
         try:
             if not self.validate():
@@ -211,83 +255,64 @@ class UpdateSpotStatusCommand(Command):
                     error_message="Invalid spot status update parameters"
                 )
             
-            # Get current spot
+            # Lock the current row to capture its pre-update status and occupancy start,
+            # then update it in the same statement (UPDATE ... FROM prev RETURNING)
+            prev = (
+                select(ParkingSpot.id, ParkingSpot.status, ParkingSpot.occupied_since)
+                .where(ParkingSpot.id == self.spot_id)
+                .with_for_update()
+                .cte('prev')
+            )
+            
+            values = {
+                'status': self.new_status,
+                'status_changed_at': now
+            }
+            
+            if self.new_status == SpotStatus.OCCUPIED:
+                values['current_vehicle_id'] = self.vehicle_id
+                values['occupied_since'] = now
+            elif self.new_status == SpotStatus.AVAILABLE:
+                # Accumulate occupancy time in whole minutes
+                occupied_minutes = cast(
+                    func.floor(func.extract('epoch', now - prev.c.occupied_since) / 60), Integer
+                )
+                values['total_occupancy_time'] = (
+                    ParkingSpot.total_occupancy_time + func.coalesce(occupied_minutes, 0)
+                )
+                values['current_vehicle_id'] = None
+                values['occupied_since'] = None
+                values['last_occupied_at'] = now
+            
             result = await session.execute(
-                select(ParkingSpot).where(ParkingSpot.id == self.spot_id)
+                update(ParkingSpot)
+                .where(ParkingSpot.id == prev.c.id)
+                .values(**values)
+                .returning(prev.c.status.label('old_status'), ParkingSpot.parking_lot_id)
+                .execution_options(synchronize_session=False)
             )
-            spot = result.scalar_one_or_none()
+            updated = result.one_or_none()
             
-            if not spot:
+            if not updated:
                 return CommandResult(
                     command_id=self.command_id,
                     status=CommandStatus.FAILED,
                     error_message=f"Parking spot {self.spot_id} not found"
                 )
             
-            old_status = spot.status
-            
-            # Update spot status
-            spot.status = self.new_status
-            spot.status_changed_at = datetime.now(timezone.utc)
-            
-            if self.new_status == SpotStatus.OCCUPIED:
-                spot.current_vehicle_id = self.vehicle_id
-                spot.occupied_since = datetime.now(timezone.utc)
-            elif self.new_status == SpotStatus.AVAILABLE:
-                if spot.occupied_since:
-                    # Calculate occupancy time
-                    occupancy_time = (datetime.now(timezone.utc) - spot.occupied_since).total_seconds() / 60
-                    spot.total_occupancy_time += int(occupancy_time)
-                
-                spot.current_vehicle_id = None
-                spot.occupied_since = None
-                spot.last_occupied_at = datetime.now(timezone.utc)
-            
-            # Generate appropriate event
-            if self.new_status == SpotStatus.OCCUPIED:
-                event_type = EventType.SPOT_OCCUPIED
-            elif self.new_status == SpotStatus.AVAILABLE and old_status == SpotStatus.OCCUPIED:
-                event_type = EventType.SPOT_VACATED
-            else:
-                event_type = EventType.SPOT_STATUS_CHANGED
-            
-            event = await event_service.publish_event(
-                event_type=event_type,
-                aggregate_type="parking_spot",
-                aggregate_id=str(self.spot_id),
-                event_data={
-                    "spot_id": self.spot_id,
-                    "old_status": old_status.value,
-                    "new_status": self.new_status.value,
-                    "user_id": self.user_id,
-                    "vehicle_id": self.vehicle_id,
-                    "reason": self.reason,
-                    "parking_lot_id": spot.parking_lot_id
-                },
-                correlation_id=self.correlation_id
-            )
+            event = await self._publish_event(event_service, updated.old_status, updated.parking_lot_id)
             
+            # Persist this command's events in one batch, just before committing
+            await event_service.flush_events()
             await session.commit()
             
-            execution_time = int((datetime.now(timezone.utc) - start_time).total_seconds() * 1000)
-            
-            return CommandResult(
-                command_id=self.command_id,
-                status=CommandStatus.SUCCESS,
-                result={
-                    "spot_id": self.spot_id,
-                    "old_status": old_status.value,
-                    "new_status": self.new_status.value
-                },
-                execution_time_ms=execution_time,
-                events_generated=[event.event_id]
-            )
+            return self._success_result(updated.old_status, event, t0)
             
         except Exception as e:
             await session.rollback()
             logger.error(f"Failed to update spot status: {e}")
             
-            execution_time = int((datetime.now(timezone.utc) - start_time).total_seconds() * 1000)
+            execution_time = int((time.monotonic() - t0) * 1000)
             
             return CommandResult(
                 command_id=self.command_id,
@@ -295,8 +320,201 @@ class UpdateSpotStatusCommand(Command):
                 error_message=str(e),
                 execution_time_ms=execution_time
             )
+    
+    def _publish_event(self, event_service: EventService, old_status: SpotStatus, parking_lot_id: int):
+        """Publish the event for this status transition (returns the publish coroutine)"""
+        if self.new_status == SpotStatus.OCCUPIED:
+            event_type = EventType.SPOT_OCCUPIED
+        elif self.new_status == SpotStatus.AVAILABLE and old_status == SpotStatus.OCCUPIED:
+            event_type = EventType.SPOT_VACATED
+        else:
+            event_type = EventType.SPOT_STATUS_CHANGED
+        
+        return event_service.publish_event(
+            event_type=event_type,
+            aggregate_type="parking_spot",
+            aggregate_id=str(self.spot_id),
+            event_data={
+                "spot_id": self.spot_id,
+                "old_status": old_status.value,
+                "new_status": self.new_status.value,
+                "user_id": self.user_id,
+                "vehicle_id": self.vehicle_id,
+                "reason": self.reason,
+                "parking_lot_id": parking_lot_id
+            },
+            correlation_id=self.correlation_id
+        )
+    
+    def _success_result(self, old_status: SpotStatus, event: Event, t0: float) -> CommandResult:
+        return CommandResult(
+            command_id=self.command_id,
+            status=CommandStatus.SUCCESS,
+            result={
+                "spot_id": self.spot_id,
+                "old_status": old_status.value,
+                "new_status": self.new_status.value
+            },
+            execution_time_ms=int((time.monotonic() - t0) * 1000),
+            events_generated=[event.event_id]
+        )
+    
+    @classmethod
+    async def execute_batch(cls, commands: List["UpdateSpotStatusCommand"], session: AsyncSession,
+                            event_service: EventService) -> Dict[str, CommandResult]:
+        """Apply status updates for distinct spots in one UPDATE and one commit.
+        
+        Returns results keyed by command_id. A database error rolls back and is re-raised,
+        since it may have been caused by any one of the commands.
+        """
+        t0 = time.monotonic()
+        now = datetime.now(timezone.utc)
+        
+        results = {}
+        for command in commands:
+            if not command.validate():
+                results[command.command_id] = CommandResult(
+                    command_id=command.command_id,
+                    status=CommandStatus.FAILED,
+                    error_message="Invalid spot status update parameters"
+                )
+        commands = [command for command in commands if command.command_id not in results]
+        
+        try:
+            if commands:
+                occupied = [c for c in commands if c.new_status == SpotStatus.OCCUPIED]
+                available_ids = [c.spot_id for c in commands if c.new_status == SpotStatus.AVAILABLE]
+                
+                prev = (
+                    select(ParkingSpot.id, ParkingSpot.status, ParkingSpot.occupied_since)
+                    .where(ParkingSpot.id.in_([c.spot_id for c in commands]))
+                    .with_for_update()
+                    .cte('prev')
+                )
+                
+                # Same per-status column changes as execute(), chosen per row with CASE
+                occupied_minutes = cast(
+                    func.floor(func.extract('epoch', now - prev.c.occupied_since) / 60), Integer
+                )
+                values = {
+                    'status': case(
+                        *[(ParkingSpot.id == c.spot_id, literal(c.new_status, ParkingSpot.status.type))
+                          for c in commands]
+                    ),
+                    'status_changed_at': now,
+                    'current_vehicle_id': case(
+                        *[(ParkingSpot.id == c.spot_id, literal(c.vehicle_id, Integer)) for c in occupied],
+                        (ParkingSpot.id.in_(available_ids), null()),
+                        else_=ParkingSpot.current_vehicle_id
+                    ),
+                    'occupied_since': case(
+                        (ParkingSpot.id.in_([c.spot_id for c in occupied]), now),
+                        (ParkingSpot.id.in_(available_ids), null()),
+                        else_=ParkingSpot.occupied_since
+                    ),
+                    'total_occupancy_time': case(
+                        (ParkingSpot.id.in_(available_ids),
+                         ParkingSpot.total_occupancy_time + func.coalesce(occupied_minutes, 0)),
+                        else_=ParkingSpot.total_occupancy_time
+                    ),
+                    'last_occupied_at': case(
+                        (ParkingSpot.id.in_(available_ids), now),
+                        else_=ParkingSpot.last_occupied_at
+                    )
+                }
+                
+                result = await session.execute(
+                    update(ParkingSpot)
+                    .where(ParkingSpot.id == prev.c.id)
+                    .values(**values)
+                    .returning(ParkingSpot.id, prev.c.status.label('old_status'), ParkingSpot.parking_lot_id)
+                    .execution_options(synchronize_session=False)
+                )
+                updated = {row.id: row for row in result}
+                
+                found = [c for c in commands if c.spot_id in updated]
+                events = await asyncio.gather(*[
+                    c._publish_event(event_service, updated[c.spot_id].old_status, updated[c.spot_id].parking_lot_id)
+                    for c in found
+                ])
+                
+                await event_service.flush_events()
+                await session.commit()
+                
+                for command, event in zip(found, events):
+                    results[command.command_id] = command._success_result(
+                        updated[command.spot_id].old_status, event, t0
+                    )
+                for command in commands:
+                    if command.spot_id not in updated:
+                        results[command.command_id] = CommandResult(
+                            command_id=command.command_id,
+                            status=CommandStatus.FAILED,
+                            error_message=f"Parking spot {command.spot_id} not found"
+                        )
+            
+        except Exception as e:
+            await session.rollback()
+            logger.error(f"Failed to update {len(commands)} spot statuses: {e}")
+            raise
+        
+        return results
 
-@dataclass
+# Confirm a pending reservation and reserve its spot (if still available) in one statement.
+# Reservations without a spot claim the first free matching one in the lot; SKIP LOCKED lets
+# concurrent confirms each take a different spot instead of queueing on the same row.
+# The outer join on the existing row tells "not found" apart from "not pending".
+CONFIRM_RESERVATION_SQL = f"""
+    WITH target AS (
+        SELECT id, parking_lot_id, parking_spot_id, start_time, end_time,
+               requires_ev_charging, requires_handicapped_access
+        FROM reservations
+        WHERE id = :reservation_id AND status = {sql_enum(ReservationStatus.PENDING)}
+    ), free_spot AS (
+        SELECT ps.id
+        FROM parking_spots ps, target t
+        WHERE t.parking_spot_id IS NULL
+        AND ps.parking_lot_id = t.parking_lot_id
+        AND ps.status = {sql_enum(SpotStatus.AVAILABLE)}
+        AND ps.is_active = true
+        AND ps.is_reservable = true
+        AND (NOT t.requires_ev_charging OR ps.has_ev_charging)
+        AND (NOT t.requires_handicapped_access OR ps.is_handicapped_accessible)
+        AND NOT EXISTS (
+            SELECT 1 FROM reservations other
+            WHERE other.parking_spot_id = ps.id
+            AND other.status IN ({sql_enum_list(CONFLICTING_RESERVATION_STATUSES)})
+            AND other.start_time < t.end_time
+            AND other.end_time > t.start_time
+        )
+        ORDER BY ps.id
+        LIMIT 1
+        FOR UPDATE OF ps SKIP LOCKED
+    ), r AS (
+        UPDATE reservations
+        SET status = {sql_enum(ReservationStatus.CONFIRMED)}, confirmed_at = :now, is_paid = true,
+            parking_spot_id = COALESCE(reservations.parking_spot_id, (SELECT id FROM free_spot))
+        FROM target
+        WHERE reservations.id = target.id AND reservations.status = {sql_enum(ReservationStatus.PENDING)}
+        RETURNING reservations.id, reservations.parking_spot_id, reservations.parking_lot_id,
+                  reservations.user_id, reservations.start_time, reservations.end_time,
+                  reservations.confirmed_at
+    ), s AS (
+        UPDATE parking_spots
+        SET status = {sql_enum(SpotStatus.RESERVED)}, status_changed_at = :now
+        WHERE id = (SELECT parking_spot_id FROM r) AND status = {sql_enum(SpotStatus.AVAILABLE)}
+        RETURNING id
+    )
+    SELECT
+        r.id AS confirmed_id, r.parking_spot_id, r.parking_lot_id, r.user_id,
+        r.start_time, r.end_time, r.confirmed_at,
+        (SELECT id FROM s) AS reserved_spot_id
+    FROM reservations existing
+    LEFT JOIN r ON r.id = existing.id
+    WHERE existing.id = :reservation_id
+"""
+
+@dataclass(slots=True, kw_only=True)
 class ConfirmReservationCommand(Command):
     """Command to confirm a reservation after payment"""
     reservation_id: int
@@ -305,8 +523,12 @@ class ConfirmReservationCommand(Command):
     def validate(self) -> bool:
         return self.reservation_id > 0
     
+    def aggregate_key(self) -> Optional[tuple]:
+        return ("reservation", self.reservation_id)
+    
     async def execute(self, session: AsyncSession, event_service: EventService) -> CommandResult:
-        start_time = datetime.now(timezone.utc)
+        t0 = time.monotonic()
+        now = datetime.now(timezone.utc)
         
         try:
             if not self.validate():
@@ -316,11 +538,11 @@ class ConfirmReservationCommand(Command):
                     error_message="Invalid reservation confirmation parameters"
                 )
             
-            # Get reservation
             result = await session.execute(
-                select(Reservation).where(Reservation.id == self.reservation_id)
+                text(CONFIRM_RESERVATION_SQL),
+                {"reservation_id": self.reservation_id, "now": now}
             )
-            reservation = result.scalar_one_or_none()
+            reservation = result.one_or_none()
             
             if not reservation:
                 return CommandResult(
@@ -329,49 +551,33 @@ class ConfirmReservationCommand(Command):
                     error_message=f"Reservation {self.reservation_id} not found"
                 )
             
-            if reservation.status != ReservationStatus.PENDING:
+            if reservation.confirmed_id is None:
                 return CommandResult(
                     command_id=self.command_id,
                     status=CommandStatus.FAILED,
                     error_message=f"Reservation {self.reservation_id} is not in pending status"
                 )
             
-            # Update reservation status
-            reservation.status = ReservationStatus.CONFIRMED
-            reservation.confirmed_at = datetime.now(timezone.utc)
-            reservation.is_paid = True
-            
-            # If specific spot assigned, mark it as reserved
-            if reservation.parking_spot_id:
-                spot_result = await session.execute(
-                    select(ParkingSpot).where(ParkingSpot.id == reservation.parking_spot_id)
+            # Generate events; they are independent, so publish them concurrently
+            event_publishes = [
+                # Reservation confirmed event
+                event_service.publish_event(
+                    event_type=EventType.RESERVATION_CONFIRMED,
+                    aggregate_type="reservation",
+                    aggregate_id=str(self.reservation_id),
+                    event_data={
+                        "reservation_id": self.reservation_id,
+                        "payment_id": self.payment_id,
+                        "confirmed_at": reservation.confirmed_at,
+                        "parking_spot_id": reservation.parking_spot_id
+                    },
+                    correlation_id=self.correlation_id
                 )
-                spot = spot_result.scalar_one_or_none()
-                if spot and spot.status == SpotStatus.AVAILABLE:
-                    spot.status = SpotStatus.RESERVED
-                    spot.status_changed_at = datetime.now(timezone.utc)
-            
-            # Generate events
-            events = []
-            
-            # Reservation confirmed event
-            confirm_event = await event_service.publish_event(
-                event_type=EventType.RESERVATION_CONFIRMED,
-                aggregate_type="reservation",
-                aggregate_id=str(self.reservation_id),
-                event_data={
-                    "reservation_id": self.reservation_id,
-                    "payment_id": self.payment_id,
-                    "confirmed_at": reservation.confirmed_at.isoformat(),
-                    "parking_spot_id": reservation.parking_spot_id
-                },
-                correlation_id=self.correlation_id
-            )
-            events.append(confirm_event.event_id)
+            ]
             
             # Spot reserved event if applicable
             if reservation.parking_spot_id:
-                spot_event = await event_service.publish_event(
+                event_publishes.append(event_service.publish_event(
                     event_type=EventType.SPOT_RESERVED,
                     aggregate_type="parking_spot",
                     aggregate_id=str(reservation.parking_spot_id),
@@ -379,16 +585,24 @@ class ConfirmReservationCommand(Command):
                         "spot_id": reservation.parking_spot_id,
                         "reservation_id": self.reservation_id,
                         "user_id": reservation.user_id,
-                        "start_time": reservation.start_time.isoformat(),
-                        "end_time": reservation.end_time.isoformat()
+                        "parking_lot_id": reservation.parking_lot_id,
+                        # Only set when the confirm actually moved the spot AVAILABLE -> RESERVED
+                        "old_status": SpotStatus.AVAILABLE.value if reservation.reserved_spot_id else None,
+                        "new_status": SpotStatus.RESERVED.value if reservation.reserved_spot_id else None,
+                        "start_time": reservation.start_time,
+                        "end_time": reservation.end_time
                     },
                     correlation_id=self.correlation_id
-                )
-                events.append(spot_event.event_id)
+                ))
+            
+            # publish_event doesn't touch the session, so the coroutines can run together
+            events = [event.event_id for event in await asyncio.gather(*event_publishes)]
             
+            # Persist this command's events in one batch, just before committing
+            await event_service.flush_events()
             await session.commit()
             
-            execution_time = int((datetime.now(timezone.utc) - start_time).total_seconds() * 1000)
+            execution_time = int((time.monotonic() - t0) * 1000)
             
             return CommandResult(
                 command_id=self.command_id,
@@ -406,7 +620,7 @@ class ConfirmReservationCommand(Command):
             await session.rollback()
             logger.error(f"Failed to confirm reservation: {e}")
             
-            execution_time = int((datetime.now(timezone.utc) - start_time).total_seconds() * 1000)
+            execution_time = int((time.monotonic() - t0) * 1000)
             
             return CommandResult(
                 command_id=self.command_id,
@@ -417,6 +631,48 @@ class ConfirmReservationCommand(Command):
 
 # Query Implementations
 
+AVAILABLE_SPOTS_SQL = f"""
+    SELECT 
+        ps.id, ps.spot_number, ps.spot_type, ps.floor, ps.section,
+        ps.has_ev_charging, ps.is_handicapped_accessible, ps.is_covered,
+        ps.hourly_rate, ps.latitude, ps.longitude,
+        pl.id AS lot_id, pl.name AS lot_name, pl.address AS lot_address
+    FROM parking_spots ps
+    LEFT JOIN parking_lots pl ON pl.id = ps.parking_lot_id
+    WHERE ps.status = {sql_enum(SpotStatus.AVAILABLE)}
+    AND ps.is_active = true
+    AND ps.is_reservable = true
+"""
+
+# Half-open interval overlap against the requested window
+AVAILABLE_SPOTS_CONFLICT_SQL = f"""NOT EXISTS (
+        SELECT 1 FROM reservations r
+        WHERE r.parking_spot_id = ps.id
+        AND r.status IN ({sql_enum_list(CONFLICTING_RESERVATION_STATUSES)})
+        AND r.start_time < ${{end}}
+        AND r.end_time > ${{start}}
+    )"""
+
+USER_RESERVATIONS_SQL = """
+    SELECT 
+        r.id, r.reservation_number, r.confirmation_code, r.status,
+        r.start_time, r.end_time, r.total_cost,
+        ps.id AS spot_id, ps.spot_number, ps.floor AS spot_floor, ps.section AS spot_section,
+        pl.id AS lot_id, pl.name AS lot_name, pl.address AS lot_address,
+        v.id AS vehicle_id, v.license_plate, v.make AS vehicle_make, v.model AS vehicle_model
+    FROM reservations r
+    LEFT JOIN parking_spots ps ON ps.id = r.parking_spot_id
+    LEFT JOIN parking_lots pl ON pl.id = r.parking_lot_id
+    LEFT JOIN vehicles v ON v.id = r.vehicle_id
+    WHERE r.user_id = $1
+"""
+
+# Available-spot listings are cached briefly and dropped on spot events for the lot
+AVAILABLE_SPOTS_CACHE_TTL = 5
+
+def available_spots_cache_prefix(parking_lot_id: Optional[int]) -> str:
+    return f"spots:v1:{parking_lot_id or 'all'}:"
+
 class GetAvailableSpotsQuery(Query):
     """Query to get available parking spots"""
     
@@ -431,86 +687,62 @@ class GetAvailableSpotsQuery(Query):
         self.start_time = start_time
         self.end_time = end_time
     
-    async def execute(self, session: AsyncSession) -> List[Dict[str, Any]]:
-        """Get available spots with filters"""
-        query = select(ParkingSpot).where(
-            and_(
-                ParkingSpot.status == SpotStatus.AVAILABLE,
-                ParkingSpot.is_active == True,
-                ParkingSpot.is_reservable == True
-            )
+    @property
+    def cache_key(self) -> str:
+        """Redis key for this filter combination"""
+        start_ts = int(self.start_time.timestamp()) if self.start_time else "-"
+        end_ts = int(self.end_time.timestamp()) if self.end_time else "-"
+        return (
+            f"{available_spots_cache_prefix(self.parking_lot_id)}"
+            f"{int(self.requires_ev_charging)}:{int(self.requires_handicapped_access)}:{start_ts}:{end_ts}"
         )
+    
+    async def execute(self) -> List[Dict[str, Any]]:
+        """Get available spots with filters (raw asyncpg read, no ORM hydration)"""
+        conditions = []
+        args = []
         
         # Apply filters
         if self.parking_lot_id:
-            query = query.where(ParkingSpot.parking_lot_id == self.parking_lot_id)
+            args.append(self.parking_lot_id)
+            conditions.append(f"ps.parking_lot_id = ${len(args)}")
         
         if self.requires_ev_charging:
-            query = query.where(ParkingSpot.has_ev_charging == True)
+            conditions.append("ps.has_ev_charging = true")
         
         if self.requires_handicapped_access:
-            query = query.where(ParkingSpot.is_handicapped_accessible == True)
-        
-        # Include parking lot information
-        query = query.options(selectinload(ParkingSpot.parking_lot))
+            conditions.append("ps.is_handicapped_accessible = true")
         
-        result = await session.execute(query)
-        spots = result.scalars().all()
-        
-        # If time range specified, check for conflicting reservations
+        # If time range specified, exclude spots with overlapping reservations
         if self.start_time and self.end_time:
-            available_spots = []
-            for spot in spots:
-                conflicts = await session.execute(
-                    select(Reservation).where(
-                        and_(
-                            Reservation.parking_spot_id == spot.id,
-                            Reservation.status.in_([
-                                ReservationStatus.CONFIRMED,
-                                ReservationStatus.ACTIVE
-                            ]),
-                            or_(
-                                and_(
-                                    Reservation.start_time <= self.start_time,
-                                    Reservation.end_time > self.start_time
-                                ),
-                                and_(
-                                    Reservation.start_time < self.end_time,
-                                    Reservation.end_time >= self.end_time
-                                ),
-                                and_(
-                                    Reservation.start_time >= self.start_time,
-                                    Reservation.end_time <= self.end_time
-                                )
-                            )
-                        )
-                    )
-                )
-                
-                if not conflicts.scalars().first():
-                    available_spots.append(spot)
-            
-            spots = available_spots
+            args.extend([self.end_time, self.start_time])
+            conditions.append(AVAILABLE_SPOTS_CONFLICT_SQL.format(end=len(args) - 1, start=len(args)))
+        
+        sql = AVAILABLE_SPOTS_SQL + "".join(f" AND {condition}" for condition in conditions)
+        rows = await asyncpg_pool.fetch(sql, *args)
         
         return [
             {
-                "id": spot.id,
-                "spot_number": spot.spot_number,
-                "spot_type": spot.spot_type.value,
-                "floor": spot.floor,
-                "section": spot.section,
-                "has_ev_charging": spot.has_ev_charging,
-                "is_handicapped_accessible": spot.is_handicapped_accessible,
-                "is_covered": spot.is_covered,
-                "hourly_rate": float(spot.hourly_rate) if spot.hourly_rate else None,
+                "id": row["id"],
+                "spot_number": row["spot_number"],
+                "spot_type": row["spot_type"],
+                "floor": row["floor"],
+                "section": row["section"],
+                "has_ev_charging": row["has_ev_charging"],
+                "is_handicapped_accessible": row["is_handicapped_accessible"],
+                "is_covered": row["is_covered"],
+                "hourly_rate": float(row["hourly_rate"]) if row["hourly_rate"] else None,
                 "parking_lot": {
-                    "id": spot.parking_lot.id,
-                    "name": spot.parking_lot.name,
-                    "address": spot.parking_lot.address
-                } if spot.parking_lot else None,
-                "coordinates": spot.coordinates
+                    "id": row["lot_id"],
+                    "name": row["lot_name"],
+                    "address": row["lot_address"]
+                } if row["lot_id"] is not None else None,
+                "coordinates": {
+                    "latitude": float(row["latitude"]),
+                    "longitude": float(row["longitude"])
+                } if row["latitude"] and row["longitude"] else None
             }
-            for spot in spots
+            for row in rows
         ]
 
 class GetUserReservationsQuery(Query):
@@ -522,59 +754,51 @@ class GetUserReservationsQuery(Query):
         self.status = status
         self.include_history = include_history
     
-    async def execute(self, session: AsyncSession) -> List[Dict[str, Any]]:
-        """Get user reservations"""
-        query = select(Reservation).where(Reservation.user_id == self.user_id)
+    async def execute(self) -> List[Dict[str, Any]]:
+        """Get user reservations (raw asyncpg read, no ORM hydration)"""
+        args = [self.user_id]
         
         if self.status:
-            query = query.where(Reservation.status == self.status)
+            args.append(self.status.value)
+            status_filter = " AND r.status = $2"
         elif not self.include_history:
             # Only active/future reservations
-            query = query.where(
-                Reservation.status.in_([
-                    ReservationStatus.PENDING,
-                    ReservationStatus.CONFIRMED,
-                    ReservationStatus.ACTIVE
-                ])
-            )
-        
-        query = query.options(
-            selectinload(Reservation.parking_spot),
-            selectinload(Reservation.parking_lot),
-            selectinload(Reservation.vehicle)
-        ).order_by(Reservation.start_time.desc())
+            status_filter = f" AND r.status IN ({sql_enum_list(OPEN_RESERVATION_STATUSES)})"
+        else:
+            status_filter = ""
         
-        result = await session.execute(query)
-        reservations = result.scalars().all()
+        rows = await asyncpg_pool.fetch(
+            USER_RESERVATIONS_SQL + status_filter + " ORDER BY r.start_time DESC", *args
+        )
         
         return [
             {
-                "id": res.id,
-                "reservation_number": res.reservation_number,
-                "confirmation_code": res.confirmation_code,
-                "status": res.status.value,
-                "start_time": res.start_time.isoformat(),
-                "end_time": res.end_time.isoformat(),
-                "total_cost": float(res.total_cost),
+                "id": row["id"],
+                "reservation_number": row["reservation_number"],
+                "confirmation_code": row["confirmation_code"],
+                "status": row["status"],
+                "start_time": row["start_time"].isoformat(),
+                "end_time": row["end_time"].isoformat(),
+                "total_cost": float(row["total_cost"]),
                 "parking_spot": {
-                    "id": res.parking_spot.id,
-                    "spot_number": res.parking_spot.spot_number,
-                    "floor": res.parking_spot.floor,
-                    "section": res.parking_spot.section
-                } if res.parking_spot else None,
+                    "id": row["spot_id"],
+                    "spot_number": row["spot_number"],
+                    "floor": row["spot_floor"],
+                    "section": row["spot_section"]
+                } if row["spot_id"] is not None else None,
                 "parking_lot": {
-                    "id": res.parking_lot.id,
-                    "name": res.parking_lot.name,
-                    "address": res.parking_lot.address
-                } if res.parking_lot else None,
+                    "id": row["lot_id"],
+                    "name": row["lot_name"],
+                    "address": row["lot_address"]
+                } if row["lot_id"] is not None else None,
                 "vehicle": {
-                    "id": res.vehicle.id,
-                    "license_plate": res.vehicle.license_plate,
-                    "make": res.vehicle.make,
-                    "model": res.vehicle.model
-                } if res.vehicle else None
+                    "id": row["vehicle_id"],
+                    "license_plate": row["license_plate"],
+                    "make": row["vehicle_make"],
+                    "model": row["vehicle_model"]
+                } if row["vehicle_id"] is not None else None
             }
-            for res in reservations
+            for row in rows
         ]
 
 class CQRSService:
@@ -583,6 +807,14 @@ class CQRSService:
     def __init__(self, event_service: EventService):
         self.event_service = event_service
         self.redis_client = get_redis_client()
+        self.release_lock_script = self.redis_client.register_script(RELEASE_LOCK_SCRIPT)
+        
+        # In-flight background result writes (held so they aren't garbage collected)
+        self._pending_writes = set()
+        
+        # Spot status updates waiting to be written as one batch
+        self._submit_queue = asyncio.Queue()
+        self._batch_worker = None
         
         # Command handlers registry
         self.command_handlers = {}
@@ -596,35 +828,55 @@ class CQRSService:
         # This would typically be done via dependency injection
         pass
     
-    async def execute_command(self, command: Command) -> CommandResult:
-        """Execute a command"""
-        start_time = datetime.now(timezone.utc)
+    async def execute_command(self, command: Command, wait_persist: bool = False) -> CommandResult:
+        """Execute a command.
+        
+        The status/result written for get_command_status/get_command_result is persisted in
+        the background unless wait_persist is set.
+        """
+        t0 = time.monotonic()
+        lock_key = None
         
         try:
-            # Store command execution start
-            await self.redis_client.setex(
-                f"command:{command.command_id}:status",
-                3600,  # 1 hour TTL
-                CommandStatus.PROCESSING.value
-            )
+            # Serialize commands on the same aggregate with a short Redis token
+            # rather than holding database row locks
+            aggregate_key = command.aggregate_key()
+            if aggregate_key:
+                lock_key = f"lock:{aggregate_key[0]}:{aggregate_key[1]}"
+                lock_token = secrets.token_hex(8)
+                if not await self._acquire_aggregate_lock(lock_key, lock_token):
+                    lock_key = None
+                    cancelled_result = CommandResult(
+                        command_id=command.command_id,
+                        status=CommandStatus.CANCELLED,
+                        error_message=f"{aggregate_key[0]} {aggregate_key[1]} is being modified by another command"
+                    )
+                    await self._persist_command_result(cancelled_result, wait_persist)
+                    return cancelled_result
+            
+            command_task = asyncio.ensure_future(self._run_command(command))
+            
+            # Only record the PROCESSING status for commands that don't finish almost
+            # immediately - short commands write their status and result once
+            done, _ = await asyncio.wait({command_task}, timeout=COMMAND_STATUS_DELAY)
+            if not done:
+                await self.redis_client.setex(
+                    f"command:{command.command_id}:status",
+                    COMMAND_TTL,
+                    CommandStatus.PROCESSING.value
+                )
             
-            # Get database session
-            async with get_db() as session:
-                result = await command.execute(session, self.event_service)
+            result = await command_task
             
             # Store command result
-            await self.redis_client.setex(
-                f"command:{command.command_id}:result",
-                3600,
-                json.dumps(asdict(result))
-            )
+            await self._persist_command_result(result, wait_persist)
             
             return result
             
         except Exception as e:
             logger.error(f"Command execution failed: {e}")
             
-            execution_time = int((datetime.now(timezone.utc) - start_time).total_seconds() * 1000)
+            execution_time = int((time.monotonic() - t0) * 1000)
             
             error_result = CommandResult(
                 command_id=command.command_id,
@@ -634,23 +886,233 @@ class CQRSService:
             )
             
             # Store error result
-            await self.redis_client.setex(
-                f"command:{command.command_id}:result",
-                3600,
-                json.dumps(asdict(error_result))
-            )
+            await self._persist_command_result(error_result, wait_persist)
             
             return error_result
+        
+        finally:
+            if lock_key:
+                await self._release_aggregate_lock(lock_key, lock_token)
+    
+    async def submit(self, command: Command) -> CommandResult:
+        """Execute a command, coalescing concurrent spot status updates into batched writes"""
+        if not isinstance(command, UpdateSpotStatusCommand):
+            return await self.execute_command(command)
+        
+        if self._batch_worker is None or self._batch_worker.done():
+            self._batch_worker = asyncio.create_task(self._run_spot_status_batches())
+        
+        future = asyncio.get_running_loop().create_future()
+        await self._submit_queue.put((command, future))
+        return await future
+    
+    async def _run_spot_status_batches(self):
+        """Drain submitted spot status updates in small time windows and write each window at once"""
+        loop = asyncio.get_running_loop()
+        
+        while True:
+            items = [await self._submit_queue.get()]
+            deadline = loop.time() + SUBMIT_BATCH_MAX_WAIT
+            
+            while len(items) < SUBMIT_BATCH_MAX_SIZE:
+                timeout = deadline - loop.time()
+                if timeout <= 0:
+                    break
+                try:
+                    items.append(await asyncio.wait_for(self._submit_queue.get(), timeout))
+                except asyncio.TimeoutError:
+                    break
+            
+            try:
+                await self._execute_spot_status_batch(items)
+            except Exception as e:
+                logger.error(f"Spot status batch failed: {e}")
+                for command, future in items:
+                    if not future.done():
+                        future.set_result(CommandResult(
+                            command_id=command.command_id,
+                            status=CommandStatus.FAILED,
+                            error_message=str(e)
+                        ))
+    
+    async def _execute_spot_status_batch(self, items: List[tuple]):
+        """Run a window of submitted spot status updates and resolve their futures"""
+        # Repeated updates to one spot are applied in arrival order, one per round
+        rounds = []
+        occurrences = {}
+        for command, future in items:
+            round_index = occurrences.get(command.spot_id, 0)
+            occurrences[command.spot_id] = round_index + 1
+            if round_index == len(rounds):
+                rounds.append([])
+            rounds[round_index].append((command, future))
+        
+        for round_items in rounds:
+            commands = [command for command, _ in round_items]
+            tokens = [secrets.token_hex(8) for _ in commands]
+            lock_keys = [f"lock:spot:{command.spot_id}" for command in commands]
+            
+            # A Redis error while locking fails that command only, as a FAILED result
+            acquired = await asyncio.gather(*[
+                self._acquire_aggregate_lock(lock_key, token) for lock_key, token in zip(lock_keys, tokens)
+            ], return_exceptions=True)
+            
+            results = {}
+            for command, locked in zip(commands, acquired):
+                if isinstance(locked, Exception):
+                    results[command.command_id] = CommandResult(
+                        command_id=command.command_id,
+                        status=CommandStatus.FAILED,
+                        error_message=f"Failed to lock spot {command.spot_id}: {locked}"
+                    )
+                elif not locked:
+                    results[command.command_id] = CommandResult(
+                        command_id=command.command_id,
+                        status=CommandStatus.CANCELLED,
+                        error_message=f"spot {command.spot_id} is being modified by another command"
+                    )
+            
+            try:
+                locked_commands = [command for command, locked in zip(commands, acquired) if locked is True]
+                if locked_commands:
+                    try:
+                        async with get_db() as session, self.event_service.event_batch():
+                            results.update(
+                                await UpdateSpotStatusCommand.execute_batch(locked_commands, session, self.event_service)
+                            )
+                    except Exception as e:
+                        # One bad command (e.g. an unknown vehicle_id) rolls back the shared UPDATE;
+                        # re-run the window one command at a time so only the offender fails
+                        logger.warning(f"Spot status batch of {len(locked_commands)} failed, retrying individually: {e}")
+                        for command in locked_commands:
+                            results[command.command_id] = await self._run_isolated_command(command)
+            finally:
+                await asyncio.gather(*[
+                    self._release_aggregate_lock(lock_key, token)
+                    for lock_key, token, locked in zip(lock_keys, tokens, acquired) if locked is True
+                ])
+            
+            for command, future in round_items:
+                result = results[command.command_id]
+                await self._persist_command_result(result, wait_persist=False)
+                if not future.done():
+                    future.set_result(result)
+    
+    async def _acquire_aggregate_lock(self, lock_key: str, token: str) -> bool:
+        """Try to take the aggregate lock, backing off between attempts"""
+        delay = AGGREGATE_LOCK_RETRY_DELAY
+        for attempt in range(AGGREGATE_LOCK_RETRIES):
+            if await self.redis_client.set(lock_key, token, nx=True, px=AGGREGATE_LOCK_TTL_MS):
+                return True
+            if attempt < AGGREGATE_LOCK_RETRIES - 1:
+                await asyncio.sleep(delay)
+                delay *= 2
+        return False
+    
+    async def _release_aggregate_lock(self, lock_key: str, token: str):
+        """Release the aggregate lock if it is still ours"""
+        try:
+            await self.release_lock_script(keys=[lock_key], args=[token])
+        except Exception as e:
+            logger.error(f"Failed to release {lock_key}: {e}")
+    
+    async def _run_isolated_command(self, command: Command) -> CommandResult:
+        """Run a command on its own (its aggregate lock is already held), never raising"""
+        t0 = time.monotonic()
+        try:
+            return await self._run_command(command)
+        except Exception as e:
+            logger.error(f"Command execution failed: {e}")
+            return CommandResult(
+                command_id=command.command_id,
+                status=CommandStatus.FAILED,
+                error_message=str(e),
+                execution_time_ms=int((time.monotonic() - t0) * 1000)
+            )
+    
+    async def _run_command(self, command: Command) -> CommandResult:
+        """Run a command in its own database session, batching the events it publishes"""
+        async with get_db() as session, self.event_service.event_batch():
+            return await command.execute(session, self.event_service)
+    
+    async def _persist_command_result(self, result: CommandResult, wait_persist: bool):
+        """Store the command result, off the caller's critical path unless asked to wait"""
+        if wait_persist:
+            await self._store_command_result(result)
+            return
+        
+        task = asyncio.create_task(self._store_command_result(result))
+        self._pending_writes.add(task)
+        task.add_done_callback(self._pending_writes.discard)
+    
+    async def _store_command_result(self, result: CommandResult):
+        """Store final status and result of a command in one round trip"""
+        try:
+            async with self.redis_client.pipeline(transaction=False) as pipe:
+                pipe.setex(f"command:{result.command_id}:status", COMMAND_TTL, result.status.value)
+                # orjson serializes the dataclass (and its Enum status) directly, without an asdict() copy
+                pipe.setex(f"command:{result.command_id}:result", COMMAND_TTL, orjson.dumps(result, default=str))
+                await pipe.execute()
+        except Exception as e:
+            logger.error(f"Failed to store result of command {result.command_id}: {e}")
     
     async def execute_query(self, query: Query) -> Any:
         """Execute a query"""
+        if isinstance(query, GetAvailableSpotsQuery):
+            return await self._execute_cached_spots_query(query)
+        
         try:
-            async with get_db() as session:
-                return await query.execute(session)
+            return await query.execute()
         except Exception as e:
             logger.error(f"Query execution failed: {e}")
             raise
     
+    async def _execute_cached_spots_query(self, query: GetAvailableSpotsQuery) -> List[Dict[str, Any]]:
+        """Serve available-spot listings from Redis, falling back to the database"""
+        cache_key = query.cache_key
+        try:
+            cached = await self.redis_client.get(cache_key)
+            if cached:
+                return orjson.loads(cached)
+        except Exception as e:
+            logger.error(f"Failed to read available spots cache: {e}")
+        
+        try:
+            spots = await query.execute()
+        except Exception as e:
+            logger.error(f"Query execution failed: {e}")
+            raise
+        
+        # Track keys per lot so spot events can drop every filter variant for that lot
+        keys_set = f"{available_spots_cache_prefix(query.parking_lot_id)}keys"
+        try:
+            async with self.redis_client.pipeline(transaction=False) as pipe:
+                pipe.setex(cache_key, AVAILABLE_SPOTS_CACHE_TTL, orjson.dumps(spots))
+                pipe.sadd(keys_set, cache_key)
+                pipe.expire(keys_set, AVAILABLE_SPOTS_CACHE_TTL)
+                await pipe.execute()
+        except Exception as e:
+            logger.error(f"Failed to cache available spots: {e}")
+        
+        return spots
+    
+    async def invalidate_available_spots(self, event: Event):
+        """Drop cached available-spot listings affected by a spot event"""
+        try:
+            parking_lot_id = event.event_data.get("parking_lot_id")
+            keys_sets = [f"{available_spots_cache_prefix(None)}keys"]
+            if parking_lot_id:
+                keys_sets.append(f"{available_spots_cache_prefix(parking_lot_id)}keys")
+            
+            async with self.redis_client.pipeline(transaction=False) as pipe:
+                for keys_set in keys_sets:
+                    pipe.smembers(keys_set)
+                cached_keys = set().union(*await pipe.execute())
+            
+            await self.redis_client.delete(*cached_keys, *keys_sets)
+        except Exception as e:
+            logger.error(f"Failed to invalidate available spots cache: {e}")
+    
     async def get_command_status(self, command_id: str) -> Optional[CommandStatus]:
         """Get command execution status"""
         try:
@@ -664,7 +1126,8 @@ class CQRSService:
         try:
             result_data = await self.redis_client.get(f"command:{command_id}:result")
             if result_data:
-                data = json.loads(result_data)
+                data = orjson.loads(result_data)
+                data['status'] = CommandStatus(data['status'])
                 return CommandResult(**data)
             return None
         except Exception:
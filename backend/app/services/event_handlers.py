@@ -4,13 +4,18 @@ Handles events for notifications, state changes, and system responses
 """
 
 import asyncio
-import json
 import logging
+import random
+import time
+from collections import ChainMap
 from datetime import datetime, timezone, timedelta
-from typing import Dict, List, Optional, Any
-from dataclasses import dataclass
+from typing import Dict, List, Optional, Any, Callable, Tuple
+from dataclasses import dataclass, field
+
+import orjson
 
 from app.db.database import get_db
+from app.db.asyncpg_pool import asyncpg_pool
 from app.db.redis import get_redis_client
 from app.models.parking_spot import ParkingSpot, SpotStatus
 from app.models.reservation import Reservation, ReservationStatus
@@ -19,7 +24,72 @@ from app.services.event_service import Event, EventType, EventPriority
 
 logger = logging.getLogger(__name__)
 
-@dataclass
+# Per-connection outbound queue depth and per-send timeout (seconds); clients that
+# fall this far behind are dropped instead of blocking the producers
+WEBSOCKET_QUEUE_SIZE = 256
+WEBSOCKET_SEND_TIMEOUT = 5.0
+
+# Most queued envelopes a writer merges into one notification_batch frame
+WEBSOCKET_MERGE_MAX = 32
+
+# Pub/Sub channel every worker relays broadcasts from to its own websocket connections
+BROADCAST_CHANNEL = "events:broadcast"
+
+# Notification preference flags, cached per user as a Redis hash of "1"/"0"
+NOTIFICATION_PREF_FIELDS = ("email", "sms", "push", "websocket")
+
+# Preference cache TTL (seconds) plus random jitter so entries don't expire together.
+# There is no preference-update path yet, so expiry is the only invalidation
+NOTIFICATION_PREFS_TTL = 3600
+NOTIFICATION_PREFS_TTL_JITTER = 600
+
+# Process-local preference cache: entry lifetime (seconds) and size bound
+NOTIFICATION_PREFS_LOCAL_TTL = 60.0
+NOTIFICATION_PREFS_LOCAL_MAX = 10000
+
+# Approximate number of capacity alerts retained per lot stream
+CAPACITY_ALERTS_MAXLEN = 100
+
+# Mark a reservation active on arrival; status is bound as the database label (see app.db.enums)
+UPDATE_ARRIVAL_SQL = """
+    UPDATE reservations
+    SET status = $1, actual_arrival_time = $2, updated_at = now()
+    WHERE id = $3
+"""
+
+# Preferences assumed for users that can't be found or loaded
+DEFAULT_NOTIFICATION_PREFS = {"websocket": True}
+
+# Spot statuses that count towards a lot's occupancy
+OCCUPYING_STATUSES = {SpotStatus.OCCUPIED.value, SpotStatus.RESERVED.value}
+
+# Incremental per-lot counters expire after this long (seconds) and are recounted from the database
+LOT_STATS_TTL = 300
+
+# Last seen occupancy flag per spot, kept longer than the counters so deltas stay idempotent
+SPOT_OCCUPANCY_TTL = 3600
+
+# Record a spot's occupancy flag (1/0) and move the lot counter by the change from the last
+# recorded flag (falling back to the event's old status). Redelivered events change nothing.
+# Applied only if the counters are seeded; returns [total, occupied] or nil
+INCR_LOT_OCCUPANCY_SCRIPT = """
+local last = redis.call("hget", KEYS[2], ARGV[1]) or ARGV[3]
+redis.call("hset", KEYS[2], ARGV[1], ARGV[2])
+redis.call("expire", KEYS[2], ARGV[4])
+if redis.call("exists", KEYS[1]) == 0 then
+    return false
+end
+redis.call("hincrby", KEYS[1], "occupied", tonumber(ARGV[2]) - tonumber(last))
+return redis.call("hmget", KEYS[1], "total", "occupied")
+"""
+
+class _SafeFormatMap(ChainMap):
+    """Template lookup that renders fields missing from partial events as empty strings"""
+    
+    def __missing__(self, key):
+        return ""
+
+@dataclass(slots=True, frozen=True)
 class NotificationChannel:
     """Notification delivery channel"""
     type: str  # email, sms, push, websocket
@@ -27,14 +97,22 @@ class NotificationChannel:
     enabled: bool = True
     priority: int = 1
 
-@dataclass
+@dataclass(slots=True, frozen=True)
 class NotificationTemplate:
     """Notification message template"""
     event_type: EventType
-    channels: List[str]
+    channels: Tuple[str, ...]
     subject_template: str
     body_template: str
     urgency: str = "normal"  # low, normal, high, critical
+    render_subject: Callable[..., str] = field(init=False, repr=False, compare=False)
+    render_body: Callable[..., str] = field(init=False, repr=False, compare=False)
+    
+    def __post_init__(self):
+        # Bound once per template; format_map accepts any mapping, so event data isn't copied to render
+        object.__setattr__(self, "channels", tuple(self.channels))
+        object.__setattr__(self, "render_subject", self.subject_template.format_map)
+        object.__setattr__(self, "render_body", self.body_template.format_map)
 
 class NotificationService:
     """Handles real-time notifications"""
@@ -42,14 +120,19 @@ class NotificationService:
     def __init__(self):
         self.redis_client = get_redis_client()
         self.templates = self._load_notification_templates()
-        self.websocket_connections = {}  # user_id -> websocket connection
+        self.websocket_connections = {}  # user_id -> outbound message queue
+        self.websocket_writers = {}  # user_id -> writer task draining that queue
+        self._broadcast_pubsub = None
+        self._broadcast_relay_task: Optional[asyncio.Task] = None
+        self._prefs_cache: Dict[int, tuple] = {}  # user_id -> (loaded_at, prefs)
+        self._prefs_locks: Dict[int, asyncio.Lock] = {}
     
     def _load_notification_templates(self) -> Dict[EventType, NotificationTemplate]:
         """Load notification templates for different event types"""
         return {
             EventType.RESERVATION_CREATED: NotificationTemplate(
                 event_type=EventType.RESERVATION_CREATED,
-                channels=["email", "push", "websocket"],
+                channels=("email", "push", "websocket"),
                 subject_template="Reservation Created - {reservation_number}",
                 body_template="Your parking reservation {reservation_number} has been created for {start_time}. Confirmation code: {confirmation_code}",
                 urgency="normal"
@@ -57,7 +140,7 @@ class NotificationService:
             
             EventType.RESERVATION_CONFIRMED: NotificationTemplate(
                 event_type=EventType.RESERVATION_CONFIRMED,
-                channels=["email", "push", "websocket"],
+                channels=("email", "push", "websocket"),
                 subject_template="Reservation Confirmed - {reservation_number}",
                 body_template="Your parking reservation {reservation_number} has been confirmed. Spot: {spot_number}, Time: {start_time} - {end_time}",
                 urgency="high"
@@ -65,7 +148,7 @@ class NotificationService:
             
             EventType.RESERVATION_EXPIRED: NotificationTemplate(
                 event_type=EventType.RESERVATION_EXPIRED,
-                channels=["email", "sms", "push", "websocket"],
+                channels=("email", "sms", "push", "websocket"),
                 subject_template="Reservation Expired - {reservation_number}",
                 body_template="Your parking reservation {reservation_number} has expired. Please create a new reservation if needed.",
                 urgency="high"
@@ -73,7 +156,7 @@ class NotificationService:
             
             EventType.SPOT_OCCUPIED: NotificationTemplate(
                 event_type=EventType.SPOT_OCCUPIED,
-                channels=["websocket"],
+                channels=("websocket",),
                 subject_template="Parking Spot Occupied",
                 body_template="Parking spot {spot_number} is now occupied",
                 urgency="normal"
@@ -81,7 +164,7 @@ class NotificationService:
             
             EventType.SPOT_VACATED: NotificationTemplate(
                 event_type=EventType.SPOT_VACATED,
-                channels=["websocket"],
+                channels=("websocket",),
                 subject_template="Parking Spot Available",
                 body_template="Parking spot {spot_number} is now available",
                 urgency="normal"
@@ -89,7 +172,7 @@ class NotificationService:
             
             EventType.USER_ARRIVED: NotificationTemplate(
                 event_type=EventType.USER_ARRIVED,
-                channels=["websocket"],
+                channels=("websocket",),
                 subject_template="User Arrived",
                 body_template="User has arrived at parking spot {spot_number}",
                 urgency="normal"
@@ -97,7 +180,7 @@ class NotificationService:
             
             EventType.CAPACITY_THRESHOLD: NotificationTemplate(
                 event_type=EventType.CAPACITY_THRESHOLD,
-                channels=["websocket", "email"],
+                channels=("websocket", "email"),
                 subject_template="Parking Lot Capacity Alert",
                 body_template="Parking lot {lot_name} is at {capacity_percentage}% capacity",
                 urgency="high"
@@ -106,15 +189,64 @@ class NotificationService:
     
     async def register_websocket(self, user_id: int, websocket):
         """Register websocket connection for user"""
-        self.websocket_connections[user_id] = websocket
+        if user_id in self.websocket_connections:
+            self._drop_websocket(user_id)
+        
+        queue = asyncio.Queue(maxsize=WEBSOCKET_QUEUE_SIZE)
+        self.websocket_connections[user_id] = queue
+        self.websocket_writers[user_id] = asyncio.create_task(
+            self._websocket_writer(user_id, websocket, queue)
+        )
         logger.info(f"Registered websocket for user {user_id}")
     
     async def unregister_websocket(self, user_id: int):
         """Unregister websocket connection"""
         if user_id in self.websocket_connections:
-            del self.websocket_connections[user_id]
+            self._drop_websocket(user_id)
             logger.info(f"Unregistered websocket for user {user_id}")
     
+    def _drop_websocket(self, user_id: int):
+        """Forget a user's outbound queue and stop its writer task"""
+        self.websocket_connections.pop(user_id, None)
+        writer = self.websocket_writers.pop(user_id, None)
+        if writer is not None and writer is not asyncio.current_task():
+            writer.cancel()
+    
+    async def _websocket_writer(self, user_id: int, websocket, queue: asyncio.Queue):
+        """Single consumer that owns all sends on one websocket"""
+        while True:
+            drain = [await queue.get()]
+            while not queue.empty() and len(drain) < WEBSOCKET_MERGE_MAX:
+                drain.append(queue.get_nowait())
+            
+            # A backlog goes out as one frame; envelopes are already JSON, so splice them
+            if len(drain) == 1:
+                message = drain[0]
+            else:
+                message = '{"type":"notification_batch","items":[' + ",".join(drain) + "]}"
+            
+            try:
+                await asyncio.wait_for(websocket.send_text(message), timeout=WEBSOCKET_SEND_TIMEOUT)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"Failed to send websocket message to user {user_id}: {e}")
+                # Remove broken connection, unless it has already been replaced
+                if self.websocket_connections.get(user_id) is queue:
+                    self._drop_websocket(user_id)
+                return
+    
+    def _enqueue_websocket_message(self, user_id: int, prepared: str):
+        """Hand an encoded envelope to the user's writer without waiting on the socket"""
+        queue = self.websocket_connections.get(user_id)
+        if queue is None:
+            return
+        try:
+            queue.put_nowait(prepared)
+        except asyncio.QueueFull:
+            logger.warning(f"Dropping slow websocket client for user {user_id}")
+            self._drop_websocket(user_id)
+    
     async def send_notification(self, user_id: int, event: Event):
         """Send notification to user based on event"""
         try:
@@ -123,110 +255,250 @@ class NotificationService:
                 logger.warning(f"No template found for event type {event.event_type}")
                 return
             
-            # Get user notification preferences
-            preferences = await self._get_user_notification_preferences(user_id)
-            
             # Format message
             message_data = await self._format_notification_message(template, event)
             
-            # Send through enabled channels
-            for channel in template.channels:
-                if channel in preferences and preferences[channel]:
-                    await self._send_through_channel(user_id, channel, message_data, template.urgency)
+            await self.send_preformatted(user_id, message_data, template.urgency, template.channels)
             
         except Exception as e:
             logger.error(f"Failed to send notification to user {user_id}: {e}")
     
+    async def send_preformatted(self, user_id: int, message_data: Dict[str, Any], urgency: str,
+                                channels: Tuple[str, ...], prepared: Optional[str] = None):
+        """Send an already formatted notification (and optionally its encoded websocket envelope)"""
+        try:
+            # Get user notification preferences
+            preferences = await self._get_user_notification_preferences(user_id)
+            
+            # Send through enabled channels concurrently
+            await asyncio.gather(*[
+                self._send_through_channel(user_id, channel, message_data, urgency, prepared)
+                for channel in channels
+                if preferences.get(channel)
+            ], return_exceptions=True)
+            
+        except Exception as e:
+            logger.error(f"Failed to send notification to user {user_id}: {e}")
+    
+    async def send_preformatted_many(self, user_ids: List[int], message_data: Dict[str, Any],
+                                     urgency: str, channels: Tuple[str, ...],
+                                     prepared: Optional[str] = None):
+        """Send one formatted notification to many users with a single provider call per channel"""
+        try:
+            all_preferences = await asyncio.gather(*[
+                self._get_user_notification_preferences(user_id) for user_id in user_ids
+            ])
+            
+            # Bucket recipients by the channels they have enabled
+            recipients = {channel: [] for channel in channels}
+            for user_id, preferences in zip(user_ids, all_preferences):
+                for channel in channels:
+                    if preferences.get(channel):
+                        recipients[channel].append(user_id)
+            
+            if recipients.get("websocket"):
+                prepared = prepared or self.encode_envelope(message_data)
+                for user_id in recipients["websocket"]:
+                    self._enqueue_websocket_message(user_id, prepared)
+            
+            batch_senders = {
+                "email": self._send_batch_email,
+                "push": self._send_batch_push,
+                "sms": self._send_batch_sms
+            }
+            await asyncio.gather(*[
+                batch_senders[channel](channel_users, message_data)
+                for channel, channel_users in recipients.items()
+                if channel_users and channel in batch_senders
+            ], return_exceptions=True)
+            
+        except Exception as e:
+            logger.error(f"Failed to send notification to users {user_ids}: {e}")
+    
     async def broadcast_notification(self, event: Event, target_users: Optional[List[int]] = None):
         """Broadcast notification to multiple users"""
         try:
+            # Broadcasts only go out over websockets
             template = self.templates.get(event.event_type)
-            if not template:
+            if not template or "websocket" not in template.channels:
                 return
             
-            # If no target users specified, send to all websocket connections
-            if target_users is None:
-                target_users = list(self.websocket_connections.keys())
+            # Nobody to reach: skip formatting and serialization entirely
+            if target_users is not None and not target_users:
+                return
+            if self._broadcast_relay_task is None and not self.websocket_connections:
+                return
             
             message_data = await self._format_notification_message(template, event)
             
-            # Send to all target users
-            tasks = []
-            for user_id in target_users:
-                if user_id in self.websocket_connections:
-                    tasks.append(
-                        self._send_websocket_message(user_id, message_data)
-                    )
+            # Every recipient gets the same envelope, so serialize it once
+            prepared = self.encode_envelope(message_data)
             
-            if tasks:
-                await asyncio.gather(*tasks, return_exceptions=True)
+            if self._broadcast_relay_task is None:
+                # No relay running (single process), deliver straight to local connections
+                self._fan_out_locally(prepared, target_users)
+                return
+            
+            # Each worker's relay delivers to the connections it holds; None targets everyone
+            await self.redis_client.publish(BROADCAST_CHANNEL, orjson.dumps({
+                "target_users": target_users,
+                "payload": prepared
+            }))
             
         except Exception as e:
             logger.error(f"Failed to broadcast notification: {e}")
     
+    def _fan_out_locally(self, prepared: str, target_users: Optional[List[int]] = None):
+        """Enqueue an encoded envelope for the targeted users connected to this process"""
+        if target_users is None:
+            target_users = list(self.websocket_connections.keys())
+        
+        # Each connection's writer does the actual send
+        for user_id in target_users:
+            self._enqueue_websocket_message(user_id, prepared)
+    
+    async def start_broadcast_relay(self):
+        """Subscribe this worker to the broadcast channel and start relaying"""
+        if self._broadcast_relay_task is not None:
+            return
+        
+        pubsub = self.redis_client.pubsub()
+        await pubsub.subscribe(BROADCAST_CHANNEL)
+        self._broadcast_pubsub = pubsub
+        self._broadcast_relay_task = asyncio.create_task(self._relay_broadcasts(pubsub))
+        logger.info(f"Relaying broadcasts from {BROADCAST_CHANNEL}")
+    
+    async def stop_broadcast_relay(self):
+        """Stop relaying broadcasts and release the subscription"""
+        task, self._broadcast_relay_task = self._broadcast_relay_task, None
+        pubsub, self._broadcast_pubsub = self._broadcast_pubsub, None
+        if task is not None:
+            task.cancel()
+            try:
+                await task
+            except asyncio.CancelledError:
+                pass
+        if pubsub is not None:
+            try:
+                await pubsub.unsubscribe(BROADCAST_CHANNEL)
+                await pubsub.close()
+            except Exception as e:
+                logger.error(f"Failed to close broadcast subscription: {e}")
+    
+    async def _relay_broadcasts(self, pubsub):
+        """Fan broadcast messages out to this worker's websocket connections"""
+        async for message in pubsub.listen():
+            if message["type"] != "message" or not self.websocket_connections:
+                continue
+            try:
+                data = orjson.loads(message["data"])
+                self._fan_out_locally(data["payload"], data.get("target_users"))
+            except Exception as e:
+                logger.error(f"Failed to relay broadcast: {e}")
+    
     async def _get_user_notification_preferences(self, user_id: int) -> Dict[str, bool]:
-        """Get user notification preferences from Redis cache or database"""
+        """Get user notification preferences, from the local cache when fresh"""
+        cached = self._prefs_cache.get(user_id)
+        if cached is not None and time.monotonic() - cached[0] < NOTIFICATION_PREFS_LOCAL_TTL:
+            return cached[1]
+        
+        # One loader per user; concurrent callers wait and reuse its result
+        lock = self._prefs_locks.setdefault(user_id, asyncio.Lock())
         try:
-            # Try Redis first
-            prefs_key = f"user_notifications:{user_id}"
-            cached_prefs = await self.redis_client.get(prefs_key)
-            
-            if cached_prefs:
-                return json.loads(cached_prefs)
-            
-            # Fallback to database
-            async with get_db() as session:
-                from sqlalchemy import select
-                result = await session.execute(
-                    select(User).where(User.id == user_id)
+            async with lock:
+                cached = self._prefs_cache.get(user_id)
+                if cached is not None and time.monotonic() - cached[0] < NOTIFICATION_PREFS_LOCAL_TTL:
+                    return cached[1]
+                
+                try:
+                    prefs = await self._load_user_notification_preferences(user_id)
+                except Exception as e:
+                    logger.error(f"Failed to get notification preferences for user {user_id}: {e}")
+                    return DEFAULT_NOTIFICATION_PREFS
+                
+                # Unknown users are cached too, so repeated misses don't reach the database
+                if prefs is None:
+                    prefs = DEFAULT_NOTIFICATION_PREFS
+                
+                self._prefs_cache.pop(user_id, None)
+                if len(self._prefs_cache) >= NOTIFICATION_PREFS_LOCAL_MAX:
+                    del self._prefs_cache[next(iter(self._prefs_cache))]
+                self._prefs_cache[user_id] = (time.monotonic(), prefs)
+                return prefs
+        finally:
+            # Drop the entry only once released, and only if no newer lock replaced it;
+            # callers still queued on it will find the freshly cached result
+            if self._prefs_locks.get(user_id) is lock:
+                del self._prefs_locks[user_id]
+    
+    async def _load_user_notification_preferences(self, user_id: int) -> Optional[Dict[str, bool]]:
+        """Load user notification preferences from Redis cache or database"""
+        # Try Redis first
+        prefs_key = f"user_prefs:{user_id}"
+        cached_prefs = await self.redis_client.hmget(prefs_key, *NOTIFICATION_PREF_FIELDS)
+        
+        if any(value is not None for value in cached_prefs):
+            return {
+                field: value in ("1", b"1")
+                for field, value in zip(NOTIFICATION_PREF_FIELDS, cached_prefs)
+            }
+        
+        # Fallback to database
+        async with get_db() as session:
+            from sqlalchemy import select
+            result = await session.execute(
+                select(User).where(User.id == user_id)
+            )
+            user = result.scalar_one_or_none()
+            
+            if user:
+                prefs = {
+                    "email": True,  # Default preferences
+                    "sms": False,
+                    "push": True,
+                    "websocket": True
+                }
+                
+                # Cache for about an hour, jittered to spread re-fetches
+                pipe = self.redis_client.pipeline(transaction=False)
+                pipe.hset(prefs_key, mapping={
+                    field: int(enabled) for field, enabled in prefs.items()
+                })
+                pipe.expire(
+                    prefs_key,
+                    NOTIFICATION_PREFS_TTL + random.randint(0, NOTIFICATION_PREFS_TTL_JITTER)
                 )
-                user = result.scalar_one_or_none()
+                await pipe.execute()
                 
-                if user:
-                    prefs = {
-                        "email": True,  # Default preferences
-                        "sms": False,
-                        "push": True,
-                        "websocket": True
-                    }
-                    
-                    # Cache for 1 hour
-                    await self.redis_client.setex(
-                        prefs_key, 3600, json.dumps(prefs)
-                    )
-                    
-                    return prefs
-            
-            return {"websocket": True}  # Minimal default
-            
-        except Exception as e:
-            logger.error(f"Failed to get notification preferences for user {user_id}: {e}")
-            return {"websocket": True}
+                return prefs
+        
+        return None
     
     async def _format_notification_message(self, template: NotificationTemplate, 
                                          event: Event) -> Dict[str, Any]:
         """Format notification message using template and event data"""
         try:
-            # Extract common data from event
-            data = event.event_data.copy()
-            data.update({
+            # Common event fields layered over the event data
+            event_type = event.event_type.value
+            timestamp = event.iso_timestamp
+            data = _SafeFormatMap({
                 "event_id": event.event_id,
-                "event_type": event.event_type.value,
-                "timestamp": event.timestamp.isoformat()
-            })
+                "event_type": event_type,
+                "timestamp": timestamp
+            }, event.event_data)
             
             # Format subject and body
-            subject = template.subject_template.format(**data)
-            body = template.body_template.format(**data)
+            subject = template.render_subject(data)
+            body = template.render_body(data)
             
             return {
                 "id": event.event_id,
-                "type": event.event_type.value,
+                "type": event_type,
                 "subject": subject,
                 "body": body,
                 "urgency": template.urgency,
-                "timestamp": event.timestamp.isoformat(),
-                "data": data
+                "timestamp": timestamp,
+                "data": dict(data)
             }
             
         except Exception as e:
@@ -237,15 +509,23 @@ class NotificationService:
                 "subject": "Parking System Notification",
                 "body": "A parking system event occurred",
                 "urgency": "normal",
-                "timestamp": event.timestamp.isoformat()
+                "timestamp": event.iso_timestamp
             }
     
+    def encode_envelope(self, message_data: Dict[str, Any]) -> str:
+        """Encode the websocket envelope for a formatted notification"""
+        return orjson.dumps({
+            "type": "notification",
+            "data": message_data
+        }).decode()
+    
     async def _send_through_channel(self, user_id: int, channel: str, 
-                                  message_data: Dict[str, Any], urgency: str):
+                                  message_data: Dict[str, Any], urgency: str,
+                                  prepared: Optional[str] = None):
         """Send notification through specific channel"""
         try:
             if channel == "websocket":
-                await self._send_websocket_message(user_id, message_data)
+                await self._send_websocket_message(user_id, message_data, prepared)
             elif channel == "email":
                 await self._send_email_notification(user_id, message_data)
             elif channel == "push":
@@ -256,19 +536,11 @@ class NotificationService:
         except Exception as e:
             logger.error(f"Failed to send notification via {channel} to user {user_id}: {e}")
     
-    async def _send_websocket_message(self, user_id: int, message_data: Dict[str, Any]):
+    async def _send_websocket_message(self, user_id: int, message_data: Dict[str, Any],
+                                      prepared: Optional[str] = None):
         """Send real-time notification via WebSocket"""
         if user_id in self.websocket_connections:
-            try:
-                websocket = self.websocket_connections[user_id]
-                await websocket.send_text(json.dumps({
-                    "type": "notification",
-                    "data": message_data
-                }))
-            except Exception as e:
-                logger.error(f"Failed to send websocket message to user {user_id}: {e}")
-                # Remove broken connection
-                await self.unregister_websocket(user_id)
+            self._enqueue_websocket_message(user_id, prepared or self.encode_envelope(message_data))
     
     async def _send_email_notification(self, user_id: int, message_data: Dict[str, Any]):
         """Send email notification (placeholder)"""
@@ -284,6 +556,21 @@ class NotificationService:
         """Send SMS notification (placeholder)"""
         # This would integrate with Twilio or similar service
         logger.info(f"SMS notification to user {user_id}: {message_data['body']}")
+    
+    async def _send_batch_email(self, user_ids: List[int], message_data: Dict[str, Any]):
+        """Send one email to many users (placeholder)"""
+        # This would use the email provider's bulk send endpoint
+        logger.info(f"Email notification to {len(user_ids)} users: {message_data['subject']}")
+    
+    async def _send_batch_push(self, user_ids: List[int], message_data: Dict[str, Any]):
+        """Send one push notification to many users (placeholder)"""
+        # This would use FCM multicast or a similar batch API
+        logger.info(f"Push notification to {len(user_ids)} users: {message_data['subject']}")
+    
+    async def _send_batch_sms(self, user_ids: List[int], message_data: Dict[str, Any]):
+        """Send one SMS to many users (placeholder)"""
+        # This would use Twilio's bulk messaging or a similar service
+        logger.info(f"SMS notification to {len(user_ids)} users: {message_data['body']}")
 
 class SystemEventHandler:
     """Handles system-level events and state management"""
@@ -291,21 +578,44 @@ class SystemEventHandler:
     def __init__(self, notification_service: NotificationService):
         self.notification_service = notification_service
         self.redis_client = get_redis_client()
+        self.incr_lot_occupancy_script = self.redis_client.register_script(INCR_LOT_OCCUPANCY_SCRIPT)
+        
+        # Event type -> bound handler, resolved once instead of per event
+        self.handlers = {
+            EventType.SPOT_STATUS_CHANGED: self.handle_spot_status_change,
+            EventType.SPOT_OCCUPIED: self.handle_spot_status_change,
+            EventType.SPOT_VACATED: self.handle_spot_status_change,
+            EventType.SPOT_RESERVED: self.handle_spot_status_change,
+            EventType.RESERVATION_CREATED: self.handle_reservation_created,
+            EventType.CAPACITY_THRESHOLD: self.handle_capacity_threshold,
+            EventType.USER_ARRIVED: self.handle_user_arrival
+        }
+    
+    async def dispatch(self, event: Event):
+        """Route an event to its handler, if it has one"""
+        handler = self.handlers.get(event.event_type)
+        if handler:
+            await handler(event)
     
     async def handle_spot_status_change(self, event: Event):
         """Handle parking spot status changes"""
         try:
             spot_id = event.event_data.get("spot_id")
+            old_status = event.event_data.get("old_status")
             new_status = event.event_data.get("new_status")
             parking_lot_id = event.event_data.get("parking_lot_id")
             
+            # e.g. SPOT_RESERVED for a spot that wasn't free to reserve
+            if new_status is None:
+                return
+            
             # Update real-time spot status in Redis
             await self.redis_client.setex(
                 f"spot_status:{spot_id}",
                 3600,  # 1 hour TTL
-                json.dumps({
+                orjson.dumps({
                     "status": new_status,
-                    "updated_at": event.timestamp.isoformat(),
+                    "updated_at": event.timestamp,
                     "parking_lot_id": parking_lot_id
                 })
             )
@@ -313,8 +623,10 @@ class SystemEventHandler:
             # Broadcast to interested users (admin, nearby users)
             await self.notification_service.broadcast_notification(event)
             
-            # Update parking lot capacity statistics
-            await self._update_lot_capacity_stats(parking_lot_id)
+            # Update parking lot capacity statistics by this transition's occupancy change
+            await self._update_lot_capacity_stats(
+                parking_lot_id, spot_id, new_status in OCCUPYING_STATUSES, old_status in OCCUPYING_STATUSES
+            )
             
         except Exception as e:
             logger.error(f"Failed to handle spot status change: {e}")
@@ -344,23 +656,28 @@ class SystemEventHandler:
             # Get admin users for this parking lot
             admin_users = await self._get_lot_admin_users(parking_lot_id)
             
-            # Send alert notifications
-            for admin_user_id in admin_users:
-                await self.notification_service.send_notification(admin_user_id, event)
+            # Send alert notifications, formatting once and batching deliveries per channel
+            template = self.notification_service.templates.get(event.event_type)
+            if template and admin_users:
+                message_data = await self.notification_service._format_notification_message(template, event)
+                prepared = self.notification_service.encode_envelope(message_data)
+                await self.notification_service.send_preformatted_many(
+                    admin_users, message_data, template.urgency, template.channels, prepared
+                )
             
-            # Log capacity alert
-            await self.redis_client.lpush(
-                f"capacity_alerts:{parking_lot_id}",
-                json.dumps({
-                    "timestamp": event.timestamp.isoformat(),
-                    "capacity_percentage": capacity_percentage,
+            # Log capacity alert, keeping roughly the last 100 per lot
+            await self.redis_client.xadd(
+                f"capacity_alerts_stream:{parking_lot_id}",
+                {
+                    "timestamp": event.iso_timestamp,
+                    # Stream fields can't hold None
+                    "capacity_percentage": capacity_percentage if capacity_percentage is not None else "",
                     "event_id": event.event_id
-                })
+                },
+                maxlen=CAPACITY_ALERTS_MAXLEN,
+                approximate=True
             )
             
-            # Keep only last 100 alerts
-            await self.redis_client.ltrim(f"capacity_alerts:{parking_lot_id}", 0, 99)
-            
         except Exception as e:
             logger.error(f"Failed to handle capacity threshold: {e}")
     
@@ -373,19 +690,13 @@ class SystemEventHandler:
             
             # Update reservation status if applicable
             if reservation_id:
-                async with get_db() as session:
-                    from sqlalchemy import select, update
-                    
-                    # Update reservation to active
-                    await session.execute(
-                        update(Reservation)
-                        .where(Reservation.id == reservation_id)
-                        .values(
-                            status=ReservationStatus.ACTIVE,
-                            actual_arrival_time=event.timestamp
-                        )
-                    )
-                    await session.commit()
+                # Single-statement write on the raw pool; its plan stays prepared per connection
+                await asyncpg_pool.execute(
+                    UPDATE_ARRIVAL_SQL,
+                    ReservationStatus.ACTIVE.value,
+                    event.timestamp,
+                    int(reservation_id)
+                )
             
             # Send confirmation to user
             if user_id:
@@ -394,63 +705,73 @@ class SystemEventHandler:
         except Exception as e:
             logger.error(f"Failed to handle user arrival: {e}")
     
-    async def _update_lot_capacity_stats(self, parking_lot_id: int):
+    async def _update_lot_capacity_stats(self, parking_lot_id: int, spot_id: int,
+                                         occupied: bool, was_occupied: bool):
         """Update parking lot capacity statistics"""
         try:
-            async with get_db() as session:
-                from sqlalchemy import select, func
-                
-                # Get total and occupied spots
-                total_spots = await session.execute(
-                    select(func.count(ParkingSpot.id))
-                    .where(
-                        and_(
-                            ParkingSpot.parking_lot_id == parking_lot_id,
-                            ParkingSpot.is_active == True
-                        )
-                    )
-                )
-                total_count = total_spots.scalar()
-                
-                occupied_spots = await session.execute(
-                    select(func.count(ParkingSpot.id))
-                    .where(
-                        and_(
-                            ParkingSpot.parking_lot_id == parking_lot_id,
-                            ParkingSpot.status.in_([SpotStatus.OCCUPIED, SpotStatus.RESERVED]),
-                            ParkingSpot.is_active == True
-                        )
-                    )
-                )
-                occupied_count = occupied_spots.scalar()
-                
-                available_count = total_count - occupied_count
-                capacity_percentage = (occupied_count / total_count * 100) if total_count > 0 else 0
-                
-                # Store in Redis
-                capacity_data = {
-                    "total_spots": total_count,
-                    "occupied_spots": occupied_count,
-                    "available_spots": available_count,
-                    "capacity_percentage": round(capacity_percentage, 2),
-                    "updated_at": datetime.now(timezone.utc).isoformat()
-                }
-                
-                await self.redis_client.setex(
-                    f"lot_capacity:{parking_lot_id}",
-                    300,  # 5 minutes TTL
-                    json.dumps(capacity_data)
-                )
-                
-                # Check threshold alerts (80% and 95%)
-                if capacity_percentage >= 95:
-                    await self._trigger_capacity_alert(parking_lot_id, capacity_percentage, "critical")
-                elif capacity_percentage >= 80:
-                    await self._trigger_capacity_alert(parking_lot_id, capacity_percentage, "high")
-                
+            stats_key = f"lot_stats:{parking_lot_id}"
+            
+            # Apply the change to the cached counters; recount only when they aren't seeded
+            counts = await self.incr_lot_occupancy_script(
+                keys=[stats_key, f"lot_spot_occupancy:{parking_lot_id}"],
+                args=[spot_id, int(occupied), int(was_occupied), SPOT_OCCUPANCY_TTL]
+            )
+            if counts:
+                total_count, occupied_count = int(counts[0]), int(counts[1])
+            else:
+                total_count, occupied_count = await self._count_lot_capacity(parking_lot_id)
+                async with self.redis_client.pipeline(transaction=True) as pipe:
+                    pipe.hset(stats_key, mapping={"total": total_count, "occupied": occupied_count})
+                    pipe.expire(stats_key, LOT_STATS_TTL)
+                    await pipe.execute()
+            
+            available_count = total_count - occupied_count
+            capacity_percentage = (occupied_count / total_count * 100) if total_count > 0 else 0
+            
+            # Store in Redis
+            capacity_data = {
+                "total_spots": total_count,
+                "occupied_spots": occupied_count,
+                "available_spots": available_count,
+                "capacity_percentage": round(capacity_percentage, 2),
+                "updated_at": datetime.now(timezone.utc)
+            }
+            
+            await self.redis_client.setex(
+                f"lot_capacity:{parking_lot_id}",
+                300,  # 5 minutes TTL
+                orjson.dumps(capacity_data)
+            )
+            
+            # Check threshold alerts (80% and 95%)
+            if capacity_percentage >= 95:
+                await self._trigger_capacity_alert(parking_lot_id, capacity_percentage, "critical")
+            elif capacity_percentage >= 80:
+                await self._trigger_capacity_alert(parking_lot_id, capacity_percentage, "high")
+            
         except Exception as e:
             logger.error(f"Failed to update lot capacity stats: {e}")
     
+    async def _count_lot_capacity(self, parking_lot_id: int) -> tuple:
+        """Count total and occupied active spots of a lot from the database"""
+        async with get_db() as session:
+            from sqlalchemy import select, func
+            
+            # Get total and occupied spots in one scan
+            counts = await session.execute(
+                select(
+                    func.count(ParkingSpot.id).label("total"),
+                    func.count(ParkingSpot.id).filter(
+                        ParkingSpot.status.in_([SpotStatus.OCCUPIED, SpotStatus.RESERVED])
+                    ).label("occupied")
+                )
+                .where(
+                    ParkingSpot.parking_lot_id == parking_lot_id,
+                    ParkingSpot.is_active == True
+                )
+            )
+            return tuple(counts.one())
+    
     async def _trigger_capacity_alert(self, parking_lot_id: int, capacity_percentage: float, level: str):
         """Trigger capacity threshold alert"""
         try:
@@ -474,15 +795,18 @@ class SystemEventHandler:
     async def _update_reservation_stats(self, timestamp: datetime):
         """Update reservation statistics"""
         try:
-            # Daily reservation count
             date_key = timestamp.strftime("%Y-%m-%d")
-            await self.redis_client.incr(f"reservations_daily:{date_key}")
-            await self.redis_client.expire(f"reservations_daily:{date_key}", 86400 * 7)  # 7 days
-            
-            # Hourly reservation count
             hour_key = timestamp.strftime("%Y-%m-%d:%H")
-            await self.redis_client.incr(f"reservations_hourly:{hour_key}")
-            await self.redis_client.expire(f"reservations_hourly:{hour_key}", 86400)  # 24 hours
+            
+            async with self.redis_client.pipeline(transaction=False) as pipe:
+                # Daily reservation count
+                pipe.incr(f"reservations_daily:{date_key}")
+                pipe.expire(f"reservations_daily:{date_key}", 86400 * 7)  # 7 days
+                
+                # Hourly reservation count
+                pipe.incr(f"reservations_hourly:{hour_key}")
+                pipe.expire(f"reservations_hourly:{hour_key}", 86400)  # 24 hours
+                await pipe.execute()
             
         except Exception as e:
             logger.error(f"Failed to update reservation stats: {e}")
@@ -4,17 +4,21 @@ Implements comprehensive event streaming architecture with Kafka, event sourcing
 and CQRS pattern for parking management system.
 """
 
-import json
 import asyncio
+import os
 import uuid
+import contextvars
+from contextlib import asynccontextmanager
+from functools import lru_cache, partial
 from datetime import datetime, timezone
-from typing import Dict, List, Optional, Any, Callable
-from dataclasses import dataclass, asdict
+from types import MappingProxyType
+from typing import Dict, List, Optional, Any, Callable, Mapping
+from dataclasses import dataclass, asdict, field
 from enum import Enum
 import logging
-from concurrent.futures import ThreadPoolExecutor
 
-from kafka import KafkaProducer, KafkaConsumer
+import orjson
+from aiokafka import AIOKafkaProducer, AIOKafkaConsumer
 from kafka.admin import KafkaAdminClient, NewTopic
 from kafka.errors import TopicAlreadyExistsError
 
@@ -24,6 +28,49 @@ from app.db.redis import get_redis_client
 
 logger = logging.getLogger(__name__)
 
+# Seconds to wait for a broker acknowledgment when a publish must be durable
+PRODUCER_ACK_TIMEOUT = 10
+
+# Hash of event type -> number of events stored, and how long daily totals are kept (seconds)
+EVENT_TYPE_COUNTS_KEY = "events_by_type"
+DAILY_COUNT_TTL = 2 * 24 * 3600
+
+# Assign the aggregate's next version and store the event under it in one atomic step, so
+# concurrent writers can't collide on a version; also bumps the per-type and daily counters.
+# A stream whose top ID is ahead of its version (time-based IDs from before entry IDs were
+# versions) is rejected with a clear error instead of an opaque XADD failure
+APPEND_EVENT_SCRIPT = """
+local current = tonumber(redis.call("get", KEYS[2]) or "0")
+local top = redis.call("xrevrange", KEYS[1], "+", "-", "COUNT", 1)[1]
+if top and tonumber(string.match(top[1], "^%d+")) > current then
+    return redis.error_reply(KEYS[1] .. " has entry IDs ahead of its version (pre-versioned stream format)")
+end
+local version = redis.call("incr", KEYS[2])
+redis.call("xadd", KEYS[1], version .. "-0", "event", ARGV[1])
+redis.call("hincrby", KEYS[3], ARGV[2], 1)
+redis.call("incrby", KEYS[4], 1)
+redis.call("expire", KEYS[4], ARGV[3])
+return version
+"""
+
+# Stream entry ID scheme recorded in Redis; streams from older formats are dropped on startup
+EVENT_STORE_FORMAT = 2
+EVENT_STORE_FORMAT_KEY = "event_store:format"
+
+# Standalone appends are group-committed: written once this many are pending, or after this delay
+EVENT_APPEND_BATCH_MAX = 500
+EVENT_APPEND_FLUSH_INTERVAL = 0.02
+
+# Seconds a handler worker waits for one message's handlers before dead-lettering it
+HANDLER_TIMEOUT = 30
+
+# Publishes between INFO-level progress lines
+PUBLISH_LOG_EVERY = 1000
+
+# Handler workers per process; events are routed by aggregate so each aggregate stays in order
+HANDLER_WORKERS = os.cpu_count() or 4
+HANDLER_QUEUE_SIZE = 1000
+
 class EventType(Enum):
     # Parking Spot Events
     SPOT_STATUS_CHANGED = "spot_status_changed"
@@ -66,7 +113,7 @@ class EventPriority(Enum):
     HIGH = "high"
     CRITICAL = "critical"
 
-@dataclass
+@dataclass(slots=True)
 class Event:
     """Base event structure for event sourcing"""
     event_id: str
@@ -80,7 +127,17 @@ class Event:
     priority: EventPriority = EventPriority.NORMAL
     correlation_id: Optional[str] = None
     causation_id: Optional[str] = None
+    _iso_timestamp: Optional[str] = field(default=None, init=False, repr=False, compare=False)
     
+    @property
+    def iso_timestamp(self) -> str:
+        """ISO-8601 timestamp, formatted once per event"""
+        if self._iso_timestamp is None:
+            self._iso_timestamp = self.timestamp.isoformat()
+        return self._iso_timestamp
+    
+    # orjson serializes the dataclass itself to this same shape (enums as values, private
+    # fields skipped), so the Kafka and event store paths encode events without this dict
     def to_dict(self) -> Dict[str, Any]:
         return {
             "event_id": self.event_id,
@@ -89,7 +146,8 @@ class Event:
             "aggregate_type": self.aggregate_type,
             "event_data": self.event_data,
             "metadata": self.metadata,
-            "timestamp": self.timestamp.isoformat(),
+            # Left as a datetime; orjson writes it as RFC 3339, which from_dict parses back
+            "timestamp": self.timestamp,
             "version": self.version,
             "priority": self.priority.value,
             "correlation_id": self.correlation_id,
@@ -134,86 +192,215 @@ class KafkaTopics:
             cls.DEAD_LETTER
         ]
 
+@lru_cache(maxsize=65536)
+def _aggregate_keys(aggregate_type: str, aggregate_id: str) -> tuple:
+    """Stream key, version key and encoded Kafka partition key for an aggregate"""
+    return (
+        f"event_stream:{aggregate_type}:{aggregate_id}",
+        f"version:{aggregate_type}:{aggregate_id}",
+        f"{aggregate_type}:{aggregate_id}".encode("utf-8")
+    )
+
+# Kafka topic for each event type, built once at import
+_TOPIC_FOR_EVENT: Mapping[EventType, str] = MappingProxyType({
+    EventType.SPOT_STATUS_CHANGED: KafkaTopics.PARKING_SPOTS,
+    EventType.SPOT_OCCUPIED: KafkaTopics.PARKING_SPOTS,
+    EventType.SPOT_VACATED: KafkaTopics.PARKING_SPOTS,
+    EventType.SPOT_RESERVED: KafkaTopics.PARKING_SPOTS,
+    EventType.SPOT_MAINTENANCE: KafkaTopics.PARKING_SPOTS,
+    
+    EventType.RESERVATION_CREATED: KafkaTopics.RESERVATIONS,
+    EventType.RESERVATION_CONFIRMED: KafkaTopics.RESERVATIONS,
+    EventType.RESERVATION_STARTED: KafkaTopics.RESERVATIONS,
+    EventType.RESERVATION_EXTENDED: KafkaTopics.RESERVATIONS,
+    EventType.RESERVATION_COMPLETED: KafkaTopics.RESERVATIONS,
+    EventType.RESERVATION_CANCELLED: KafkaTopics.RESERVATIONS,
+    EventType.RESERVATION_EXPIRED: KafkaTopics.RESERVATIONS,
+    EventType.RESERVATION_NO_SHOW: KafkaTopics.RESERVATIONS,
+    
+    EventType.PAYMENT_INITIATED: KafkaTopics.PAYMENTS,
+    EventType.PAYMENT_COMPLETED: KafkaTopics.PAYMENTS,
+    EventType.PAYMENT_FAILED: KafkaTopics.PAYMENTS,
+    EventType.PAYMENT_REFUNDED: KafkaTopics.PAYMENTS,
+    
+    EventType.USER_ARRIVED: KafkaTopics.USER_ACTIONS,
+    EventType.USER_DEPARTED: KafkaTopics.USER_ACTIONS,
+    EventType.USER_CHECK_IN: KafkaTopics.USER_ACTIONS,
+    EventType.USER_CHECK_OUT: KafkaTopics.USER_ACTIONS,
+    
+    EventType.SYSTEM_ALERT: KafkaTopics.SYSTEM_EVENTS,
+    EventType.CAPACITY_THRESHOLD: KafkaTopics.SYSTEM_EVENTS,
+    EventType.SENSOR_UPDATE: KafkaTopics.SYSTEM_EVENTS,
+    EventType.NOTIFICATION_SENT: KafkaTopics.NOTIFICATIONS,
+})
+
 class EventStore:
     """Event store for event sourcing implementation"""
     
     def __init__(self):
         self.redis_client = get_redis_client()
+        self.append_event_script = self.redis_client.register_script(APPEND_EVENT_SCRIPT)
+        self._pending: List[tuple] = []  # (event, future) awaiting the next group write
+        self._flush_task: Optional[asyncio.Task] = None
     
     async def append_event(self, event: Event) -> bool:
-        """Append event to the event store"""
+        """Append event to the event store, sharing one pipeline with concurrent appends.
+        
+        The event's version is assigned by the store.
+        """
+        future = asyncio.get_running_loop().create_future()
+        self._pending.append((event, future))
+        
+        # No await between the check and the swap, so no lock is needed
+        if len(self._pending) >= EVENT_APPEND_BATCH_MAX:
+            await self._write_pending(self._take_pending())
+        elif self._flush_task is None or self._flush_task.done():
+            self._flush_task = asyncio.create_task(self._flush_after_interval())
+        
+        return await future
+    
+    def _take_pending(self) -> List[tuple]:
+        batch, self._pending = self._pending, []
+        return batch
+    
+    async def _flush_after_interval(self):
+        """Write whatever accumulated during the flush interval"""
+        await asyncio.sleep(EVENT_APPEND_FLUSH_INTERVAL)
+        batch = self._take_pending()
+        if batch:
+            await self._write_pending(batch)
+    
+    async def _write_pending(self, batch: List[tuple]):
+        """Append a group of pending events in arrival order and report each caller its own outcome"""
+        stored = await self.append_events([event for event, _ in batch])
+        for (_, future), success in zip(batch, stored):
+            if not future.done():
+                future.set_result(success)
+    
+    async def append_events(self, events: List[Event]) -> List[bool]:
+        """Append a batch of events to the event store in a single round trip.
+        
+        Each event gets its aggregate's next version; returns whether each event was stored.
+        """
+        daily_key = f"events_daily:{datetime.now(timezone.utc).strftime('%Y-%m-%d')}"
         try:
-            # Store in Redis with TTL
-            key = f"events:{event.aggregate_type}:{event.aggregate_id}"
-            event_data = json.dumps(event.to_dict())
-            
-            # Use Redis streams for ordered event storage
-            stream_key = f"event_stream:{event.aggregate_type}:{event.aggregate_id}"
-            await self.redis_client.xadd(stream_key, event.to_dict())
-            
-            # Also store latest version for quick lookup
-            version_key = f"version:{event.aggregate_type}:{event.aggregate_id}"
-            await self.redis_client.set(version_key, event.version)
-            
-            # Index by event type for efficient querying
-            type_key = f"events_by_type:{event.event_type.value}"
-            await self.redis_client.lpush(type_key, event.event_id)
-            
-            return True
+            async with self.redis_client.pipeline(transaction=False) as pipe:
+                for event in events:
+                    stream_key, version_key, _ = _aggregate_keys(event.aggregate_type, event.aggregate_id)
+                    # Entry = {"event": orjson-encoded event}; the entry ID is the version, so
+                    # readers can range over versions server-side
+                    await self.append_event_script(
+                        keys=[stream_key, version_key, EVENT_TYPE_COUNTS_KEY, daily_key],
+                        args=[orjson.dumps(event), event.event_type.value, DAILY_COUNT_TTL],
+                        client=pipe
+                    )
+                replies = await pipe.execute(raise_on_error=False)
         except Exception as e:
-            logger.error(f"Failed to append event {event.event_id}: {e}")
-            return False
+            logger.error(f"Failed to append {len(events)} events: {e}")
+            return [False] * len(events)
+        
+        stored = []
+        for event, reply in zip(events, replies):
+            if isinstance(reply, Exception):
+                logger.error(f"Failed to append event {event.event_id}: {reply}")
+                stored.append(False)
+            else:
+                event.version = int(reply)
+                stored.append(True)
+        return stored
     
     async def get_events(self, aggregate_type: str, aggregate_id: str, 
                         from_version: int = 0) -> List[Event]:
         """Get events for an aggregate from a specific version"""
         try:
-            stream_key = f"event_stream:{aggregate_type}:{aggregate_id}"
-            events = await self.redis_client.xrange(stream_key)
-            
-            result = []
-            for event_id, fields in events:
-                if fields.get("version", 0) > from_version:
-                    event = Event.from_dict(fields)
-                    result.append(event)
+            stream_key = _aggregate_keys(aggregate_type, aggregate_id)[0]
             
-            return sorted(result, key=lambda x: x.version)
+            # Entry IDs are versions, so only the wanted suffix comes back, already in order
+            entries = await self.redis_client.xrange(stream_key, min=f"{from_version + 1}-0", max="+")
+            events = []
+            for entry_id, fields in entries:
+                event = Event.from_dict(orjson.loads(fields["event"]))
+                # The stored payload is encoded before the store assigns the version
+                event.version = int(entry_id.split("-", 1)[0])
+                events.append(event)
+            return events
         except Exception as e:
             logger.error(f"Failed to get events for {aggregate_type}:{aggregate_id}: {e}")
             return []
     
+    async def drop_legacy_streams(self):
+        """Delete aggregate streams keyed by time-based entry IDs, once per store format.
+        
+        Entry IDs are versions since format 2; older streams end in IDs like 1724...-0 that
+        no new version can follow, so they (and their version keys) are removed.
+        """
+        try:
+            if int(await self.redis_client.get(EVENT_STORE_FORMAT_KEY) or 0) >= EVENT_STORE_FORMAT:
+                return
+            
+            # Only one worker sweeps; the others keep starting up
+            lock_key = f"{EVENT_STORE_FORMAT_KEY}:upgrade"
+            if not await self.redis_client.set(lock_key, "1", nx=True, ex=300):
+                return
+            
+            dropped = 0
+            async for stream_key in self.redis_client.scan_iter(match="event_stream:*", count=1000):
+                version_key = f"version:{stream_key[len('event_stream:'):]}"
+                top = await self.redis_client.xrevrange(stream_key, count=1)
+                current = await self.redis_client.get(version_key)
+                if top and int(top[0][0].split("-", 1)[0]) > int(current or 0):
+                    await self.redis_client.delete(stream_key, version_key)
+                    dropped += 1
+            
+            await self.redis_client.set(EVENT_STORE_FORMAT_KEY, EVENT_STORE_FORMAT)
+            await self.redis_client.delete(lock_key)
+            if dropped:
+                logger.warning(f"Dropped {dropped} event streams from an older event store format")
+        except Exception as e:
+            logger.error(f"Failed to drop legacy event streams: {e}")
+    
     async def get_current_version(self, aggregate_type: str, aggregate_id: str) -> int:
         """Get current version of an aggregate"""
         try:
-            version_key = f"version:{aggregate_type}:{aggregate_id}"
+            version_key = _aggregate_keys(aggregate_type, aggregate_id)[1]
             version = await self.redis_client.get(version_key)
             return int(version) if version else 0
         except Exception as e:
             logger.error(f"Failed to get version for {aggregate_type}:{aggregate_id}: {e}")
             return 0
+    
 
 class EventBus:
     """Event bus for publishing and subscribing to events"""
     
     def __init__(self):
-        self.producer = None
+        self.producer: Optional[AIOKafkaProducer] = None
         self.consumers = {}
+        self.consumer_tasks = {}
         self.event_handlers = {}
+        self._handler_queues: List[asyncio.Queue] = []
+        self._handler_workers: List[asyncio.Task] = []
+        self.published_count = 0
         self.admin_client = None
-        self.executor = ThreadPoolExecutor(max_workers=10)
+        self._producer_lock = asyncio.Lock()
         
-    def _get_producer(self) -> KafkaProducer:
-        """Get Kafka producer instance"""
-        if not self.producer:
-            self.producer = KafkaProducer(
-                bootstrap_servers=[settings.KAFKA_BOOTSTRAP_SERVERS],
-                value_serializer=lambda v: json.dumps(v).encode('utf-8'),
-                key_serializer=lambda k: k.encode('utf-8') if k else None,
-                acks='all',  # Wait for all replicas
-                retries=3,
-                max_in_flight_requests_per_connection=1,  # Ensure ordering
-                enable_idempotence=True  # Prevent duplicate events
-            )
+    async def _get_producer(self) -> AIOKafkaProducer:
+        """Get the started Kafka producer instance"""
+        if self.producer is None:
+            async with self._producer_lock:
+                if self.producer is None:
+                    producer = AIOKafkaProducer(
+                        bootstrap_servers=settings.KAFKA_BOOTSTRAP_SERVERS,
+                        # No serializers: values and partition keys are handed over as bytes
+                        acks='all',  # Wait for all replicas
+                        # Batch sends: wait up to 50ms to fill 128KB batches, compressed on the wire
+                        linger_ms=50,
+                        max_batch_size=131072,
+                        compression_type='lz4',
+                        enable_idempotence=True  # Prevent duplicate events, keep per-partition order
+                    )
+                    await producer.start()
+                    self.producer = producer
         return self.producer
     
     def _get_admin_client(self) -> KafkaAdminClient:
@@ -227,7 +414,6 @@ class EventBus:
     async def initialize_topics(self):
         """Initialize Kafka topics"""
         try:
-            admin = self._get_admin_client()
             topic_list = []
             
             for topic_name in KafkaTopics.get_all_topics():
@@ -237,7 +423,10 @@ class EventBus:
                     replication_factor=1
                 ))
             
-            admin.create_topics(topic_list, validate_only=False)
+            # The admin client is blocking; keep it off the event loop
+            await asyncio.to_thread(
+                lambda: self._get_admin_client().create_topics(topic_list, validate_only=False)
+            )
             logger.info("Kafka topics initialized successfully")
         except TopicAlreadyExistsError:
             logger.info("Kafka topics already exist")
@@ -246,65 +435,62 @@ class EventBus:
     
     def _get_topic_for_event(self, event_type: EventType) -> str:
         """Map event type to Kafka topic"""
-        topic_mapping = {
-            EventType.SPOT_STATUS_CHANGED: KafkaTopics.PARKING_SPOTS,
-            EventType.SPOT_OCCUPIED: KafkaTopics.PARKING_SPOTS,
-            EventType.SPOT_VACATED: KafkaTopics.PARKING_SPOTS,
-            EventType.SPOT_RESERVED: KafkaTopics.PARKING_SPOTS,
-            EventType.SPOT_MAINTENANCE: KafkaTopics.PARKING_SPOTS,
-            
-            EventType.RESERVATION_CREATED: KafkaTopics.RESERVATIONS,
-            EventType.RESERVATION_CONFIRMED: KafkaTopics.RESERVATIONS,
-            EventType.RESERVATION_STARTED: KafkaTopics.RESERVATIONS,
-            EventType.RESERVATION_EXTENDED: KafkaTopics.RESERVATIONS,
-            EventType.RESERVATION_COMPLETED: KafkaTopics.RESERVATIONS,
-            EventType.RESERVATION_CANCELLED: KafkaTopics.RESERVATIONS,
-            EventType.RESERVATION_EXPIRED: KafkaTopics.RESERVATIONS,
-            EventType.RESERVATION_NO_SHOW: KafkaTopics.RESERVATIONS,
-            
-            EventType.PAYMENT_INITIATED: KafkaTopics.PAYMENTS,
-            EventType.PAYMENT_COMPLETED: KafkaTopics.PAYMENTS,
-            EventType.PAYMENT_FAILED: KafkaTopics.PAYMENTS,
-            EventType.PAYMENT_REFUNDED: KafkaTopics.PAYMENTS,
-            
-            EventType.USER_ARRIVED: KafkaTopics.USER_ACTIONS,
-            EventType.USER_DEPARTED: KafkaTopics.USER_ACTIONS,
-            EventType.USER_CHECK_IN: KafkaTopics.USER_ACTIONS,
-            EventType.USER_CHECK_OUT: KafkaTopics.USER_ACTIONS,
-            
-            EventType.SYSTEM_ALERT: KafkaTopics.SYSTEM_EVENTS,
-            EventType.CAPACITY_THRESHOLD: KafkaTopics.SYSTEM_EVENTS,
-            EventType.SENSOR_UPDATE: KafkaTopics.SYSTEM_EVENTS,
-            EventType.NOTIFICATION_SENT: KafkaTopics.NOTIFICATIONS,
-        }
-        
-        return topic_mapping.get(event_type, KafkaTopics.SYSTEM_EVENTS)
+        return _TOPIC_FOR_EVENT.get(event_type, KafkaTopics.SYSTEM_EVENTS)
     
-    async def publish_event(self, event: Event) -> bool:
-        """Publish event to Kafka topic"""
+    async def publish_event(self, event: Event, wait: bool = False) -> bool:
+        """Publish event to Kafka topic; only waits for the broker ack when asked to"""
         try:
-            producer = self._get_producer()
-            topic = self._get_topic_for_event(event.event_type)
-            
-            # Use aggregate_id as key for partitioning
-            key = f"{event.aggregate_type}:{event.aggregate_id}"
-            
-            future = producer.send(
-                topic,
-                value=event.to_dict(),
-                key=key
-            )
+            future = await self._send(await self._get_producer(), event)
+            if wait:
+                await asyncio.wait_for(future, PRODUCER_ACK_TIMEOUT)
             
-            # Wait for acknowledgment
-            producer.flush()
-            
-            logger.info(f"Published event {event.event_id} to topic {topic}")
             return True
             
         except Exception as e:
             logger.error(f"Failed to publish event {event.event_id}: {e}")
             return False
     
+    async def publish_events(self, events: List[Event]) -> bool:
+        """Publish a batch of events to Kafka without waiting for acknowledgment"""
+        try:
+            producer = await self._get_producer()
+            for event in events:
+                await self._send(producer, event)
+            return True
+            
+        except Exception as e:
+            logger.error(f"Failed to publish {len(events)} events: {e}")
+            return False
+    
+    async def _send(self, producer: AIOKafkaProducer, event: Event) -> asyncio.Future:
+        """Append an event to the producer's batch; returns the delivery future"""
+        topic = self._get_topic_for_event(event.event_type)
+        future = await producer.send(
+            topic,
+            # orjson encodes the Event dataclass and the datetimes inside it natively (RFC 3339)
+            value=orjson.dumps(event),
+            # Use aggregate_id as key for partitioning
+            key=_aggregate_keys(event.aggregate_type, event.aggregate_id)[2]
+        )
+        future.add_done_callback(partial(self._on_send_done, event.event_id))
+        
+        # Per-event detail only at DEBUG (formatted lazily); a sampled total at INFO
+        logger.debug("Published event %s to topic %s", event.event_id, topic)
+        self.published_count += 1
+        if self.published_count % PUBLISH_LOG_EVERY == 0:
+            logger.info("Published %d events", self.published_count)
+        return future
+    
+    def _on_send_done(self, event_id: str, future: asyncio.Future):
+        """Log a send that failed after retries"""
+        if not future.cancelled() and future.exception() is not None:
+            logger.error(f"Failed to deliver event {event_id} to Kafka: {future.exception()}")
+    
+    async def flush_pending(self):
+        """Wait until every buffered event has been acknowledged (shutdown, tests)"""
+        if self.producer:
+            await self.producer.flush()
+    
     def register_handler(self, event_type: EventType, handler: Callable):
         """Register event handler for specific event type"""
         if event_type not in self.event_handlers:
@@ -314,77 +500,151 @@ class EventBus:
     async def start_consumer(self, topics: List[str], group_id: str):
         """Start Kafka consumer for specified topics"""
         try:
-            consumer = KafkaConsumer(
+            consumer = AIOKafkaConsumer(
                 *topics,
-                bootstrap_servers=[settings.KAFKA_BOOTSTRAP_SERVERS],
+                bootstrap_servers=settings.KAFKA_BOOTSTRAP_SERVERS,
                 group_id=group_id,
-                value_deserializer=lambda m: json.loads(m.decode('utf-8')),
+                value_deserializer=orjson.loads,
                 auto_offset_reset='earliest',
                 enable_auto_commit=True,
                 auto_commit_interval_ms=1000
             )
+            await consumer.start()
             
             self.consumers[group_id] = consumer
+            self._start_handler_workers()
             
-            # Start consuming in background
-            loop = asyncio.get_event_loop()
-            loop.run_in_executor(self.executor, self._consume_messages, consumer)
+            # Start consuming in background on the app loop, where handlers' clients live
+            self.consumer_tasks[group_id] = asyncio.create_task(self._consume_messages(consumer))
             
             logger.info(f"Started consumer for topics {topics} with group {group_id}")
             
         except Exception as e:
             logger.error(f"Failed to start consumer: {e}")
     
-    def _consume_messages(self, consumer: KafkaConsumer):
+    async def _consume_messages(self, consumer: AIOKafkaConsumer):
         """Consume messages from Kafka"""
         try:
-            for message in consumer:
+            async for message in consumer:
                 try:
                     event_data = message.value
                     event = Event.from_dict(event_data)
                     
-                    # Execute event handlers
-                    if event.event_type in self.event_handlers:
-                        for handler in self.event_handlers[event.event_type]:
-                            try:
-                                asyncio.run(handler(event))
-                            except Exception as e:
-                                logger.error(f"Event handler failed for {event.event_id}: {e}")
+                    # Hand off to the aggregate's worker: same aggregate in order, others in parallel;
+                    # a full queue holds the consumer back instead of buffering without bound
+                    handlers = self.event_handlers.get(event.event_type)
+                    if handlers:
+                        queue = self._handler_queues[hash(event.aggregate_id) % len(self._handler_queues)]
+                        await queue.put((event, handlers, message.value))
                 
                 except Exception as e:
                     logger.error(f"Failed to process message: {e}")
                     # Send to dead letter queue
-                    self._send_to_dead_letter_queue(message.value, str(e))
+                    await self._send_to_dead_letter_queue(message.value, str(e))
         
+        except asyncio.CancelledError:
+            raise
         except Exception as e:
             logger.error(f"Consumer error: {e}")
     
-    def _send_to_dead_letter_queue(self, message: Dict[str, Any], error: str):
+    def _start_handler_workers(self):
+        """Start the handler worker pool shared by all consumers"""
+        if self._handler_workers:
+            return
+        for _ in range(HANDLER_WORKERS):
+            queue = asyncio.Queue(maxsize=HANDLER_QUEUE_SIZE)
+            self._handler_queues.append(queue)
+            self._handler_workers.append(asyncio.create_task(self._handler_worker(queue)))
+    
+    async def _handler_worker(self, queue: asyncio.Queue):
+        """Run handlers for the events routed to this worker, one event at a time"""
+        while True:
+            event, handlers, raw_message = await queue.get()
+            try:
+                await asyncio.wait_for(self._run_handlers(handlers, event), HANDLER_TIMEOUT)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"Failed to process event {event.event_id}: {e}")
+                await self._send_to_dead_letter_queue(raw_message, str(e))
+            finally:
+                queue.task_done()
+    
+    async def _run_handlers(self, handlers: List[Callable], event: Event):
+        """Run every handler for an event, logging failures individually"""
+        results = await asyncio.gather(*[handler(event) for handler in handlers], return_exceptions=True)
+        for result in results:
+            if isinstance(result, Exception):
+                logger.error(f"Event handler failed for {event.event_id}: {result}")
+    
+    async def _send_to_dead_letter_queue(self, message: Dict[str, Any], error: str):
         """Send failed message to dead letter queue"""
         try:
-            producer = self._get_producer()
+            producer = await self._get_producer()
             dead_letter_message = {
                 "original_message": message,
                 "error": error,
-                "timestamp": datetime.now(timezone.utc).isoformat(),
+                "timestamp": datetime.now(timezone.utc),
                 "retry_count": 0
             }
             
-            producer.send(KafkaTopics.DEAD_LETTER, value=dead_letter_message)
-            producer.flush()
+            await producer.send_and_wait(KafkaTopics.DEAD_LETTER, value=orjson.dumps(dead_letter_message))
             
         except Exception as e:
             logger.error(f"Failed to send to dead letter queue: {e}")
     
-    def close(self):
+    async def close(self):
         """Close all connections"""
-        if self.producer:
-            self.producer.close()
+        for task in self.consumer_tasks.values():
+            task.cancel()
+        
+        for worker in self._handler_workers:
+            worker.cancel()
         
         for consumer in self.consumers.values():
-            consumer.close()
+            await consumer.stop()
+        
+        # stop() flushes anything still batched before disconnecting
+        if self.producer:
+            await self.producer.stop()
         
-        self.executor.shutdown(wait=True)
+        if self.admin_client:
+            self.admin_client.close()
+
+# Batch collecting events published by the current command, if any
+_current_batch: contextvars.ContextVar[Optional["EventBatch"]] = contextvars.ContextVar(
+    "event_batch", default=None
+)
+
+class EventBatch:
+    """Events published inside a command, persisted and sent together on flush"""
+    
+    def __init__(self, event_store: EventStore, event_bus: EventBus):
+        self.event_store = event_store
+        self.event_bus = event_bus
+        self.events: List[Event] = []
+    
+    def add(self, event: Event):
+        self.events.append(event)
+    
+    async def flush(self):
+        """Write all queued events in one round trip (the store assigns versions), then publish them"""
+        if not self.events:
+            return
+        
+        events, self.events = self.events, []
+        
+        stored = await self.event_store.append_events(events)
+        stored_events = [event for event, success in zip(events, stored) if success]
+        
+        # Events that did make it to the store are still published, so the bus matches the store
+        if stored_events:
+            publish_success = await self.event_bus.publish_events(stored_events)
+            if not publish_success:
+                logger.warning(f"Failed to publish {len(stored_events)} events to Kafka")
+        
+        if len(stored_events) < len(events):
+            raise Exception(f"Failed to store {len(events) - len(stored_events)} of {len(events)} events")
 
 class EventService:
     """Main event service orchestrating event sourcing and streaming"""
@@ -396,6 +656,7 @@ class EventService:
     
     async def initialize(self):
         """Initialize event service"""
+        await self.event_store.drop_legacy_streams()
         await self.event_bus.initialize_topics()
         
         # Start consumers for different services
@@ -414,6 +675,25 @@ class EventService:
             "payment-service"
         )
     
+    @asynccontextmanager
+    async def event_batch(self):
+        """Queue events published inside the block until the batch is flushed.
+        
+        Events not flushed before the block exits (e.g. a failed command) are dropped.
+        """
+        batch = EventBatch(self.event_store, self.event_bus)
+        token = _current_batch.set(batch)
+        try:
+            yield batch
+        finally:
+            _current_batch.reset(token)
+    
+    async def flush_events(self):
+        """Flush the current event batch, if any"""
+        batch = _current_batch.get()
+        if batch is not None:
+            await batch.flush()
+    
     async def publish_event(self, event_type: EventType, aggregate_type: str,
                           aggregate_id: str, event_data: Dict[str, Any],
                           metadata: Optional[Dict[str, Any]] = None,
@@ -422,28 +702,27 @@ class EventService:
                           causation_id: Optional[str] = None) -> Event:
         """Publish a new event"""
         
-        # Get current version and increment
-        current_version = await self.event_store.get_current_version(
-            aggregate_type, aggregate_id
-        )
-        new_version = current_version + 1
-        
         # Create event
         event = Event(
-            event_id=str(uuid.uuid4()),
+            event_id=uuid.uuid4().hex,  # Still a random UUID, without dashes
             event_type=event_type,
             aggregate_id=aggregate_id,
             aggregate_type=aggregate_type,
             event_data=event_data,
             metadata=metadata or {},
             timestamp=datetime.now(timezone.utc),
-            version=new_version,
             priority=priority,
             correlation_id=correlation_id,
             causation_id=causation_id
         )
         
-        # Store in event store
+        # Inside a batch the event is only queued; its version is assigned on flush
+        batch = _current_batch.get()
+        if batch is not None:
+            batch.add(event)
+            return event
+        
+        # Store in event store (which assigns the version)
         success = await self.event_store.append_event(event)
         if not success:
             raise Exception(f"Failed to store event {event.event_id}")
@@ -484,19 +763,16 @@ class EventService:
     async def get_event_statistics(self) -> Dict[str, Any]:
         """Get event processing statistics"""
         try:
-            stats = {}
-            
-            # Get count by event type
-            for event_type in EventType:
-                type_key = f"events_by_type:{event_type.value}"
-                count = await self.redis_client.llen(type_key)
-                stats[event_type.value] = count
-            
-            # Get total events processed today
+            # Counts by event type and today's total in one round trip
             today = datetime.now(timezone.utc).strftime("%Y-%m-%d")
-            daily_key = f"events_daily:{today}"
-            daily_count = await self.redis_client.get(daily_key) or 0
-            stats["daily_total"] = int(daily_count)
+            async with self.redis_client.pipeline(transaction=False) as pipe:
+                pipe.hgetall(EVENT_TYPE_COUNTS_KEY)
+                pipe.get(f"events_daily:{today}")
+                counts, daily_count = await pipe.execute()
+            
+            # Report types not seen yet as zero
+            stats = {event_type.value: int(counts.get(event_type.value, 0)) for event_type in EventType}
+            stats["daily_total"] = int(daily_count or 0)
             
             return stats
             
@@ -504,9 +780,9 @@ class EventService:
             logger.error(f"Failed to get event statistics: {e}")
             return {}
     
-    def close(self):
+    async def close(self):
         """Close event service"""
-        self.event_bus.close()
+        await self.event_bus.close()
 
 # Global event service instance
 event_service = EventService()
@@ -6,24 +6,31 @@ class KafkaService:
     def __init__(self):
         self.producer = None
         self.consumer = None
+        self.consumers = {}  # (frozenset(topics), group_id) -> consumer
     
     def get_producer(self):
         if not self.producer:
             self.producer = KafkaProducer(
                 bootstrap_servers=[settings.KAFKA_BOOTSTRAP_SERVERS],
                 value_serializer=lambda v: json.dumps(v).encode('utf-8'),
-                key_serializer=lambda k: k.encode('utf-8') if k else None
+                key_serializer=lambda k: k.encode('utf-8') if k else None,
+                # JSON payloads compress well; lz4 is cheap on CPU
+                compression_type='lz4'
             )
         return self.producer
     
     def get_consumer(self, topics, group_id):
-        return KafkaConsumer(
-            *topics,
-            bootstrap_servers=[settings.KAFKA_BOOTSTRAP_SERVERS],
-            group_id=group_id,
-            value_deserializer=lambda m: json.loads(m.decode('utf-8')),
-            auto_offset_reset='earliest'
-        )
+        # Reuse consumers: each new one opens sockets and triggers a group rebalance
+        key = (frozenset(topics), group_id)
+        if key not in self.consumers:
+            self.consumers[key] = KafkaConsumer(
+                *topics,
+                bootstrap_servers=[settings.KAFKA_BOOTSTRAP_SERVERS],
+                group_id=group_id,
+                value_deserializer=lambda m: json.loads(m.decode('utf-8')),
+                auto_offset_reset='earliest'
+            )
+        return self.consumers[key]
     
     async def send_message(self, topic: str, message: dict, key: str = None):
         producer = self.get_producer()
@@ -34,5 +41,10 @@ class KafkaService:
     def close_producer(self):
         if self.producer:
             self.producer.close()
+    
+    def close_consumers(self):
+        for consumer in self.consumers.values():
+            consumer.close()
+        self.consumers.clear()
 
 kafka_service = KafkaService()
\ No newline at end of file
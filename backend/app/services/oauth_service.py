@@ -1,6 +1,9 @@
 """
 OAuth service for social login (Google, GitHub)
 """
+import asyncio
+import hashlib
+import logging
 from typing import Optional, Dict, Any
 import httpx
 from datetime import datetime
@@ -12,7 +15,12 @@ from app.models.user import User, UserRole, UserStatus
 from app.schemas.auth import OAuthUserInfo
 from app.core.config import settings
 from app.core.security import create_salt, generate_random_password, get_password_hash
-from app.services.auth_service import AuthService
+from app.services.auth_service import AuthService, redis_client
+
+logger = logging.getLogger(__name__)
+
+# Seconds a provider's userinfo response is reused for the same access token
+USER_INFO_CACHE_TTL = 60
 
 class OAuthService:
     """OAuth service for social authentication"""
@@ -20,6 +28,26 @@ class OAuthService:
     def __init__(self):
         self.oauth = OAuth()
         self._setup_providers()
+        self._client: Optional[httpx.AsyncClient] = None
+        self._client_lock = asyncio.Lock()
+    
+    async def _get_client(self) -> httpx.AsyncClient:
+        """Shared HTTP client, so provider calls reuse pooled keep-alive connections"""
+        if self._client is None:
+            async with self._client_lock:
+                if self._client is None:
+                    self._client = httpx.AsyncClient(
+                        http2=True,
+                        limits=httpx.Limits(max_keepalive_connections=20, max_connections=100),
+                        timeout=httpx.Timeout(10.0, connect=5.0)
+                    )
+        return self._client
+    
+    async def close(self):
+        """Close the shared HTTP client"""
+        if self._client is not None:
+            await self._client.aclose()
+            self._client = None
     
     def _setup_providers(self):
         """Setup OAuth providers"""
@@ -46,83 +74,109 @@ class OAuthService:
     
     async def get_google_user_info(self, access_token: str) -> OAuthUserInfo:
         """Get user information from Google"""
-        async with httpx.AsyncClient() as client:
-            response = await client.get(
-                'https://www.googleapis.com/oauth2/v2/userinfo',
-                headers={'Authorization': f'Bearer {access_token}'}
-            )
-            
-            if response.status_code != 200:
-                raise HTTPException(
-                    status_code=status.HTTP_400_BAD_REQUEST,
-                    detail="Failed to get user info from Google"
-                )
-            
-            data = response.json()
-            
-            return OAuthUserInfo(
-                email=data.get('email'),
-                first_name=data.get('given_name', ''),
-                last_name=data.get('family_name', ''),
-                provider='google',
-                provider_id=data.get('id'),
-                picture=data.get('picture')
+        client = await self._get_client()
+        response = await client.get(
+            'https://www.googleapis.com/oauth2/v2/userinfo',
+            headers={'Authorization': f'Bearer {access_token}'}
+        )
+        
+        if response.status_code != 200:
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST,
+                detail="Failed to get user info from Google"
             )
+        
+        data = response.json()
+        
+        return OAuthUserInfo(
+            email=data.get('email'),
+            first_name=data.get('given_name', ''),
+            last_name=data.get('family_name', ''),
+            provider='google',
+            provider_id=data.get('id'),
+            picture=data.get('picture')
+        )
     
     async def get_github_user_info(self, access_token: str) -> OAuthUserInfo:
         """Get user information from GitHub"""
-        async with httpx.AsyncClient() as client:
-            # Get user profile
-            user_response = await client.get(
-                'https://api.github.com/user',
-                headers={'Authorization': f'token {access_token}'}
+        client = await self._get_client()
+        headers = {'Authorization': f'token {access_token}'}
+        
+        # Profile and emails are independent, so fetch them concurrently
+        user_response, email_response = await asyncio.gather(
+            client.get('https://api.github.com/user', headers=headers),
+            client.get('https://api.github.com/user/emails', headers=headers)
+        )
+        
+        if user_response.status_code != 200:
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST,
+                detail="Failed to get user info from GitHub"
             )
-            
-            if user_response.status_code != 200:
-                raise HTTPException(
-                    status_code=status.HTTP_400_BAD_REQUEST,
-                    detail="Failed to get user info from GitHub"
-                )
-            
-            user_data = user_response.json()
-            
-            # Get user emails
-            email_response = await client.get(
-                'https://api.github.com/user/emails',
-                headers={'Authorization': f'token {access_token}'}
+        
+        user_data = user_response.json()
+        
+        if email_response.status_code != 200:
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST,
+                detail="Failed to get user emails from GitHub"
             )
-            
-            if email_response.status_code != 200:
-                raise HTTPException(
-                    status_code=status.HTTP_400_BAD_REQUEST,
-                    detail="Failed to get user emails from GitHub"
-                )
-            
-            emails = email_response.json()
-            primary_email = next(
-                (email['email'] for email in emails if email['primary']), 
-                emails[0]['email'] if emails else None
+        
+        emails = email_response.json()
+        primary_email = next(
+            (email['email'] for email in emails if email['primary']), 
+            emails[0]['email'] if emails else None
+        )
+        
+        if not primary_email:
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST,
+                detail="No email found in GitHub account"
             )
-            
-            if not primary_email:
-                raise HTTPException(
-                    status_code=status.HTTP_400_BAD_REQUEST,
-                    detail="No email found in GitHub account"
-                )
-            
-            # Split name
-            name = user_data.get('name', '').split(' ', 1)
-            first_name = name[0] if name else user_data.get('login', '')
-            last_name = name[1] if len(name) > 1 else ''
-            
-            return OAuthUserInfo(
-                email=primary_email,
-                first_name=first_name,
-                last_name=last_name,
-                provider='github',
-                provider_id=str(user_data.get('id')),
-                picture=user_data.get('avatar_url')
+        
+        # Split name
+        name = user_data.get('name', '').split(' ', 1)
+        first_name = name[0] if name else user_data.get('login', '')
+        last_name = name[1] if len(name) > 1 else ''
+        
+        return OAuthUserInfo(
+            email=primary_email,
+            first_name=first_name,
+            last_name=last_name,
+            provider='github',
+            provider_id=str(user_data.get('id')),
+            picture=user_data.get('avatar_url')
+        )
+    
+    async def get_user_info(self, provider: str, access_token: str) -> OAuthUserInfo:
+        """Get provider user information, cached briefly per access token"""
+        if provider == 'google':
+            fetch = self.get_google_user_info
+        elif provider == 'github':
+            fetch = self.get_github_user_info
+        else:
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST,
+                detail="Unsupported OAuth provider"
             )
+        
+        # Key on a digest so raw access tokens never land in Redis
+        cache_key = f"oauth:{provider}:{hashlib.sha256(access_token.encode()).hexdigest()}"
+        try:
+            cached = await redis_client.get(cache_key)
+            if cached:
+                return OAuthUserInfo.model_validate_json(cached)
+        except Exception as e:
+            logger.error(f"Error reading cached OAuth user info: {e}")
+        
+        user_info = await fetch(access_token)
+        
+        try:
+            await redis_client.set(cache_key, user_info.model_dump_json(), ex=USER_INFO_CACHE_TTL)
+        except Exception as e:
+            logger.error(f"Error caching OAuth user info: {e}")
+        
+        return user_info
     
     async def authenticate_oauth_user(
         self, 
@@ -132,15 +186,7 @@ class OAuthService:
     ) -> User:
         """Authenticate user via OAuth"""
         # Get user info from provider
-        if provider == 'google':
-            user_info = await self.get_google_user_info(access_token)
-        elif provider == 'github':
-            user_info = await self.get_github_user_info(access_token)
-        else:
-            raise HTTPException(
-                status_code=status.HTTP_400_BAD_REQUEST,
-                detail="Unsupported OAuth provider"
-            )
+        user_info = await self.get_user_info(provider, access_token)
         
         # Check if user exists
         result = await db.execute(
@@ -243,41 +289,41 @@ class OAuthService:
     
     async def _exchange_google_code(self, code: str, redirect_uri: str) -> Dict[str, Any]:
         """Exchange Google authorization code for token"""
-        async with httpx.AsyncClient() as client:
-            response = await client.post(
-                'https://oauth2.googleapis.com/token',
-                data={
-                    'client_id': settings.GOOGLE_CLIENT_ID,
-                    'client_secret': settings.GOOGLE_CLIENT_SECRET,
-                    'code': code,
-                    'grant_type': 'authorization_code',
-                    'redirect_uri': redirect_uri
-                }
-            )
-            
-            if response.status_code != 200:
-                raise Exception(f"Google token exchange failed: {response.text}")
-            
-            return response.json()
+        client = await self._get_client()
+        response = await client.post(
+            'https://oauth2.googleapis.com/token',
+            data={
+                'client_id': settings.GOOGLE_CLIENT_ID,
+                'client_secret': settings.GOOGLE_CLIENT_SECRET,
+                'code': code,
+                'grant_type': 'authorization_code',
+                'redirect_uri': redirect_uri
+            }
+        )
+        
+        if response.status_code != 200:
+            raise Exception(f"Google token exchange failed: {response.text}")
+        
+        return response.json()
     
     async def _exchange_github_code(self, code: str, redirect_uri: str) -> Dict[str, Any]:
         """Exchange GitHub authorization code for token"""
-        async with httpx.AsyncClient() as client:
-            response = await client.post(
-                'https://github.com/login/oauth/access_token',
-                data={
-                    'client_id': settings.GITHUB_CLIENT_ID,
-                    'client_secret': settings.GITHUB_CLIENT_SECRET,
-                    'code': code,
-                    'redirect_uri': redirect_uri
-                },
-                headers={'Accept': 'application/json'}
-            )
-            
-            if response.status_code != 200:
-                raise Exception(f"GitHub token exchange failed: {response.text}")
-            
-            return response.json()
+        client = await self._get_client()
+        response = await client.post(
+            'https://github.com/login/oauth/access_token',
+            data={
+                'client_id': settings.GITHUB_CLIENT_ID,
+                'client_secret': settings.GITHUB_CLIENT_SECRET,
+                'code': code,
+                'redirect_uri': redirect_uri
+            },
+            headers={'Accept': 'application/json'}
+        )
+        
+        if response.status_code != 200:
+            raise Exception(f"GitHub token exchange failed: {response.text}")
+        
+        return response.json()
 
 # Global OAuth service instance
 oauth_service = OAuthService()
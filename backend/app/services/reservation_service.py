@@ -12,7 +12,6 @@ from datetime import datetime, timezone, timedelta
 from dataclasses import dataclass
 from typing import Dict, List, Optional, Any, Tuple
 from enum import Enum
-from concurrent.futures import ThreadPoolExecutor
 import heapq
 from contextlib import asynccontextmanager
 
@@ -195,7 +194,6 @@ class ConcurrentReservationManager:
         self.redis_client = get_redis_client()
         self.reservation_queue = ReservationQueue()
         self.processing_tasks = {}
-        self.executor = ThreadPoolExecutor(max_workers=20)
         self.is_processing = False
     
     async def start_processing(self):
@@ -219,7 +217,6 @@ class ConcurrentReservationManager:
         if self.processing_tasks:
             await asyncio.gather(*self.processing_tasks.values(), return_exceptions=True)
         
-        self.executor.shutdown(wait=True)
         logger.info("Stopped reservation queue processing")
     
     async def request_reservation(self, request: ReservationRequest) -> ReservationResult:
@@ -45,6 +45,7 @@ class SpatialTaskProcessor:
         await asyncio.gather(
             self.process_geofence_events(),
             self.refresh_spatial_analytics(),
+            self.refresh_reservation_aggregates(),
             self.cleanup_old_events(),
             self.monitor_spatial_performance(),
             return_exceptions=True
@@ -313,6 +314,25 @@ class SpatialTaskProcessor:
                 logger.error(f"Error refreshing spatial analytics: {e}")
                 await asyncio.sleep(60)  # Retry after 1 minute
     
+    async def refresh_reservation_aggregates(self):
+        """Refresh the hourly reservation aggregates read by analytics"""
+        while self.is_running:
+            try:
+                async with self.async_session() as session:
+                    await session.execute(
+                        text("REFRESH MATERIALIZED VIEW CONCURRENTLY mv_reservation_hourly")
+                    )
+                    await session.commit()
+                    
+                    logger.info("Reservation hourly aggregates refreshed")
+                
+                # Refresh every 5 minutes
+                await asyncio.sleep(300)
+                
+            except Exception as e:
+                logger.error(f"Error refreshing reservation aggregates: {e}")
+                await asyncio.sleep(60)  # Retry after 1 minute
+    
     async def cleanup_old_events(self):
         """Clean up old processed events"""
         while self.is_running:
@@ -0,0 +1,138 @@
+"""
+Unit Tests for Analytics Service
+"""
+import pytest
+from datetime import datetime, timedelta, timezone
+
+import numpy as np
+import orjson
+from scipy import stats
+
+from app.services.analytics_service import (
+    ORJSON_OPTIONS,
+    OccupancyPatternDetector,
+    SlidingWindowAnalyzer,
+    batched_linregress,
+    forward_fill,
+)
+
+
+@pytest.mark.unit
+class TestSlidingWindowAnalyzer:
+    """Test sliding window buffer and analysis."""
+
+    def test_no_analysis_until_window_full(self):
+        """Test that analysis only starts once the window is filled."""
+        analyzer = SlidingWindowAnalyzer(window_size=10)
+        start = datetime(2025, 1, 1, 8, 0)
+
+        for i in range(9):
+            result = analyzer.add_data_point(start + timedelta(minutes=i), "1", i, 10, 0.5)
+            assert result is None
+
+        result = analyzer.add_data_point(start + timedelta(minutes=9), "1", 9, 10, 0.5)
+        assert result is not None
+        assert result['window_start'] == start
+        assert result['window_end'] == start + timedelta(minutes=9)
+
+    def test_window_keeps_latest_points_in_order(self):
+        """Test that the ring buffer exposes the most recent points oldest-first."""
+        analyzer = SlidingWindowAnalyzer(window_size=10)
+        start = datetime(2025, 1, 1, 8, 0)
+
+        for i in range(25):
+            result = analyzer.add_data_point(start + timedelta(minutes=i), "1", i % 10, 10, 0.5)
+
+        assert result['window_start'] == start + timedelta(minutes=15)
+        assert result['window_end'] == start + timedelta(minutes=24)
+        assert result['peak_occupancy'] == pytest.approx(0.9)
+        assert result['min_occupancy'] == pytest.approx(0.0)
+        assert result['mean_occupancy'] == pytest.approx(np.mean([i % 10 for i in range(15, 25)]) / 10)
+
+    def test_aware_timestamps_come_back_in_utc(self):
+        """Test tz-aware inputs are normalized to UTC and stay aware."""
+        analyzer = SlidingWindowAnalyzer(window_size=10)
+        start = datetime(2025, 1, 1, 8, 0, tzinfo=timezone(timedelta(hours=2)))
+
+        for i in range(10):
+            result = analyzer.add_data_point(start + timedelta(minutes=i), "1", i, 10, 0.5)
+
+        assert result['window_start'].tzinfo == timezone.utc
+        assert result['window_start'] == start
+        assert result['window_end'] == start + timedelta(minutes=9)
+
+    def test_zero_total_spots(self):
+        """Test that lots without spots report zero occupancy."""
+        analyzer = SlidingWindowAnalyzer(window_size=10)
+        start = datetime(2025, 1, 1, 8, 0)
+
+        for i in range(10):
+            result = analyzer.add_data_point(start + timedelta(minutes=i), "1", 0, 0, 0.0)
+
+        assert result['mean_occupancy'] == 0.0
+
+
+@pytest.mark.unit
+class TestBatchedLinregress:
+    """Test vectorized trend computation."""
+
+    def test_matches_scipy_linregress(self):
+        """Test slopes and r values match scipy row by row."""
+        rng = np.random.default_rng(42)
+        Y = rng.normal(50, 10, size=(4, 48)) + np.arange(48) * rng.normal(0, 1, size=(4, 1))
+
+        slopes, r_values = batched_linregress(Y)
+
+        for i, row in enumerate(Y):
+            expected = stats.linregress(np.arange(len(row)), row)
+            assert slopes[i] == pytest.approx(expected.slope)
+            assert r_values[i] == pytest.approx(expected.rvalue)
+
+    def test_constant_series(self):
+        """Test constant series have zero slope and zero correlation."""
+        slopes, r_values = batched_linregress(np.full((2, 10), 3.0))
+
+        assert np.allclose(slopes, 0.0)
+        assert np.allclose(r_values, 0.0)
+
+
+@pytest.mark.unit
+class TestForwardFill:
+    """Test numpy forward fill."""
+
+    def test_fills_gaps_and_keeps_leading_nans(self):
+        """Test gaps take the previous value and leading NaNs are untouched."""
+        filled = forward_fill(np.array([np.nan, 1.0, np.nan, np.nan, 4.0, np.nan]))
+
+        assert np.isnan(filled[0])
+        assert filled[1:].tolist() == [1.0, 1.0, 1.0, 4.0, 4.0]
+
+
+@pytest.mark.unit
+class TestPatternSerialization:
+    """Test freshly built pattern reports are plain JSON data."""
+
+    @pytest.mark.asyncio
+    async def test_fresh_patterns_serialize_without_default(self):
+        """Test a report built from raw rows needs no fallback encoder."""
+        start = datetime(2025, 1, 1)
+        rng = np.random.default_rng(7)
+        rows = []
+        for i in range(24 * 14):
+            ts = start + timedelta(hours=i)
+            occupancy = 95.0 if i == 100 else float(rng.normal(50, 5))
+            rows.append({
+                'hour_slot': ts,
+                'reservations_count': int(occupancy),
+                'total_spots': 100,
+                'occupancy_percentage': occupancy,
+                'hour_of_day': float(ts.hour),
+                'day_of_week': float((ts.weekday() + 1) % 7)
+            })
+
+        patterns = await OccupancyPatternDetector(None)._analyze_patterns(rows)
+
+        decoded = orjson.loads(orjson.dumps(patterns, option=ORJSON_OPTIONS))
+        assert decoded['daily_patterns']['daily_averages']['Monday']['count'] == 48
+        assert decoded['anomalies']
+        assert all(isinstance(a['timestamp'], str) for a in decoded['anomalies'])
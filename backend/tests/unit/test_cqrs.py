@@ -0,0 +1,102 @@
+"""
+Unit Tests for CQRS Spot Status Batching
+"""
+import asyncio
+from contextlib import asynccontextmanager
+from unittest.mock import AsyncMock, MagicMock, patch
+
+import pytest
+
+from app.models.parking_spot import SpotStatus
+from app.services.cqrs_service import (
+    CommandResult,
+    CommandStatus,
+    CQRSService,
+    UpdateSpotStatusCommand,
+)
+
+
+@asynccontextmanager
+async def _fake_context():
+    yield MagicMock()
+
+
+def _make_service():
+    """Build a CQRSService with locking and persistence stubbed out."""
+    service = CQRSService.__new__(CQRSService)
+    service.event_service = MagicMock()
+    service.event_service.event_batch = _fake_context
+    service._acquire_aggregate_lock = AsyncMock(return_value=True)
+    service._release_aggregate_lock = AsyncMock()
+    service._persist_command_result = AsyncMock()
+    return service
+
+
+def _success(command):
+    return CommandResult(command_id=command.command_id, status=CommandStatus.SUCCESS)
+
+
+def _items(spot_ids):
+    loop = asyncio.get_running_loop()
+    return [
+        (UpdateSpotStatusCommand(spot_id=spot_id, new_status=SpotStatus.OCCUPIED), loop.create_future())
+        for spot_id in spot_ids
+    ]
+
+
+@pytest.mark.unit
+class TestSpotStatusBatch:
+    """Test coalesced spot status windows."""
+
+    async def test_repeated_spots_split_into_rounds(self):
+        """Test each spot appears once per round, in arrival order."""
+        service = _make_service()
+        items = _items([1, 2, 1, 3, 1])
+        rounds = []
+
+        async def execute_batch(commands, session, event_service):
+            rounds.append(list(commands))
+            return {command.command_id: _success(command) for command in commands}
+
+        with patch('app.services.cqrs_service.get_db', _fake_context), \
+                patch.object(UpdateSpotStatusCommand, 'execute_batch', side_effect=execute_batch):
+            await service._execute_spot_status_batch(items)
+
+        assert [[c.spot_id for c in batch] for batch in rounds] == [[1, 2, 3], [1], [1]]
+        assert [rounds[0][0], rounds[1][0], rounds[2][0]] == [items[0][0], items[2][0], items[4][0]]
+        assert all(future.result().status == CommandStatus.SUCCESS for _, future in items)
+
+    async def test_failed_batch_is_retried_per_command(self):
+        """Test one bad command no longer fails the rest of its window."""
+        service = _make_service()
+        items = _items([1, 2, 3])
+        bad_command = items[1][0]
+
+        async def run_command(command):
+            if command is bad_command:
+                raise ValueError("vehicle does not exist")
+            return _success(command)
+
+        service._run_command = AsyncMock(side_effect=run_command)
+
+        with patch('app.services.cqrs_service.get_db', _fake_context), \
+                patch.object(UpdateSpotStatusCommand, 'execute_batch',
+                             AsyncMock(side_effect=ValueError("foreign key violation"))):
+            await service._execute_spot_status_batch(items)
+
+        statuses = [future.result().status for _, future in items]
+        assert statuses == [CommandStatus.SUCCESS, CommandStatus.FAILED, CommandStatus.SUCCESS]
+
+    async def test_lock_error_becomes_failed_result(self):
+        """Test a Redis error while locking is reported as a FAILED result."""
+        service = _make_service()
+        service._acquire_aggregate_lock = AsyncMock(side_effect=ConnectionError("redis down"))
+        items = _items([1])
+
+        with patch('app.services.cqrs_service.get_db', _fake_context):
+            await service._execute_spot_status_batch(items)
+
+        result = items[0][1].result()
+        assert result.status == CommandStatus.FAILED
+        assert "redis down" in result.error_message
+        service._release_aggregate_lock.assert_not_called()